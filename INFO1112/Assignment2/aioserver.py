@@ -0,0 +1,475 @@
+import sys
+import time
+import asyncio
+import logging
+import bcrypt
+import tictactoe
+import rooms
+import metrics
+import protocol
+import server
+
+
+class Connection:
+    '''
+    A class to hold the state of a client connection served by its own coroutine
+
+    Attributes:
+    -----------
+    reader: asyncio.StreamReader
+        the stream the client's lines are read from
+    writer: asyncio.StreamWriter
+        the stream the messages to the client are written to
+    address: tuple
+        the client's address
+    username: str or None
+        the username of the client if logged in
+    room: Room or None
+        the room the client is in
+    '''
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.username = None
+        self.room = None
+
+    def send(self, message: str | bytes) -> None:
+        '''
+        queue <message> for the client without waiting, a message already encoded is queued as is
+        a client with more than OUTBOUND_HIGH_WATER_MARK bytes queued is disconnected
+        '''
+        if self.writer.is_closing():
+            return
+        self.writer.write(message.encode() if isinstance(message, str) else message)
+        if self.writer.transport.get_write_buffer_size() > server.OUTBOUND_HIGH_WATER_MARK:
+            logger.info("%s is too slow to receive", self.address)
+            slow_client_disconnects.inc()
+            self.writer.transport.abort()
+
+
+class Room:
+    '''
+    A class to simulate a Tic Tac Toe game room
+
+    Attributes:
+    -----------
+    room_name: str
+        the room's name
+    player1: Connection or None
+        the connection of player 1
+    player2: Connection or None
+        the connection of player 2
+    viewers: list[Connection]
+        the connections of the viewers in the room
+    current_turn_player: str
+        username of the player who is currently in turn
+    board_size: int
+        the number of rows (and columns) of the board
+    win_length: int
+        the number of markers in a row that wins the game
+    board: tictactoe.BitBoard or tictactoe.GridBoard or None
+        the current board
+    '''
+    def __init__(self, room_name: str, board_size: int = tictactoe.BOARD_SIZE, win_length: int = tictactoe.BOARD_SIZE):
+        self.room_name = room_name
+        self.board_size = board_size
+        self.win_length = win_length
+        self.player1 = None
+        self.player2 = None
+        self.viewers = []
+        self.current_turn_player = ""
+        self.board = None
+
+    def add_player(self, connection: Connection) -> bool:
+        '''
+        add a player to the room
+        return True if it's the second player, else return False
+        '''
+        if self.player1 is None:
+            self.player1 = connection
+            return False
+        self.player2 = connection
+        self.current_turn_player = self.player1.username
+        return True
+
+    def send_message(self, message: str) -> None:
+        '''
+        send a message to all clients in the room, including both players and viewers
+        the message is encoded once and the same buffer is queued for every client
+        '''
+        data = message.encode()
+        self.player1.send(data)
+        self.player2.send(data)
+        for viewer in self.viewers:
+            viewer.send(data)
+
+    def swap_turn(self) -> None:
+        '''
+        swap the current turn between 2 players
+        '''
+        if self.current_turn_player == self.player1.username:
+            self.current_turn_player = self.player2.username
+        else:
+            self.current_turn_player = self.player1.username
+
+    def destroy(self) -> None:
+        '''
+        remove the room and take its players/viewers out of it
+        '''
+        for connection in [self.player1, self.player2] + self.viewers:
+            if connection is not None:
+                connection.room = None
+        room_registry.remove(self.room_name)
+
+
+room_registry: rooms.RoomRegistry = rooms.RoomRegistry() # stores every room by name and the cached room lists
+registering_usernames: set[str] = set() # stores the usernames whose REGISTER is being hashed
+unsynced_registrations: list[asyncio.Future] = [] # resolved once the new user records are durable
+protocol_handlers: protocol.Dispatcher = protocol.Dispatcher() # the handler of each protocol verb, see process_line()
+connections: set[Connection] = set() # every connected client
+logger: logging.Logger = logging.getLogger("aioserver")
+
+metrics_registry: metrics.Registry = metrics.Registry() # the metrics of the server, served on the admin port
+requests_received: metrics.Counter = metrics_registry.counter("tictactoe_requests_total", "Protocol lines received, by verb", ("verb",))
+request_duration: metrics.Histogram = metrics_registry.histogram("tictactoe_request_duration_seconds", "Time spent handling a protocol line, by verb, including the wait for LOGIN/REGISTER password jobs", ("verb",))
+slow_client_disconnects: metrics.Counter = metrics_registry.counter("tictactoe_slow_client_disconnects_total", "Clients disconnected for queueing more than OUTBOUND_HIGH_WATER_MARK bytes")
+metrics_registry.gauge("tictactoe_connections", "Connected clients", lambda: len(connections))
+metrics_registry.gauge("tictactoe_rooms", "Rooms", lambda: len(room_registry))
+metrics_registry.gauge("tictactoe_outbound_queued_bytes", "Bytes queued for clients whose sockets are full", lambda: sum(connection.writer.transport.get_write_buffer_size() for connection in connections))
+
+
+def sync_user_store() -> None:
+    '''
+    make the records added since the last call durable with a single sync
+    '''
+    server.user_store.sync()
+    for registration in unsynced_registrations:
+        registration.set_result(None)
+    unsynced_registrations.clear()
+
+
+@protocol_handlers.register("LOGIN")
+async def login_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the LOGIN protocol
+    '''
+    if len(data) != 3:
+        connection.send("LOGIN:ACKSTATUS:3\n")
+        return
+    _, username, password = data
+    password_hash = server.user_store.get_password(username)
+    if password_hash is None:
+        connection.send("LOGIN:ACKSTATUS:1\n")
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        password_matches = await loop.run_in_executor(None, bcrypt.checkpw, password.encode(), password_hash.encode())
+    except ValueError:
+        password_matches = False
+    if password_matches:
+        connection.username = username
+        connection.send("LOGIN:ACKSTATUS:0\n")
+    else:
+        connection.send("LOGIN:ACKSTATUS:2\n")
+
+
+@protocol_handlers.register("REGISTER")
+async def register_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the REGISTER protocol
+    '''
+    if len(data) != 3:
+        connection.send("REGISTER:ACKSTATUS:2\n")
+        return
+    _, username, password = data
+    if username in server.user_store or username in registering_usernames:
+        connection.send("REGISTER:ACKSTATUS:1\n")
+        return
+    registering_usernames.add(username)
+    loop = asyncio.get_running_loop()
+    try:
+        password_hash = await loop.run_in_executor(None, bcrypt.hashpw, password.encode(), bcrypt.gensalt())
+    except ValueError:
+        # e.g. bcrypt refuses passwords longer than 72 bytes
+        connection.send("REGISTER:ACKSTATUS:2\n")
+        return
+    finally:
+        registering_usernames.discard(username)
+    server.user_store.add(username, password_hash.decode())
+    # every registration of this loop iteration shares one sync
+    registration = loop.create_future()
+    if not unsynced_registrations:
+        loop.call_soon(sync_user_store)
+    unsynced_registrations.append(registration)
+    await registration
+    connection.send("REGISTER:ACKSTATUS:0\n")
+
+
+@protocol_handlers.register("ROOMLIST", requires_auth=True)
+def roomlist_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the ROOMLIST protocol
+    '''
+    connection.send(server.roomlist_response(room_registry, data))
+
+
+def add_connection_to_room(connection: Connection, mode: str, room_name: str) -> None:
+    '''
+    add a client to a room with the name <room_name>
+    the client can be either player or viewer, specified by <mode>
+    '''
+    state, room = room_registry.lookup(room_name)
+    connection.room = room
+    if mode == "PLAYER":
+        if room.add_player(connection):
+            room_registry.fill(room_name)
+            begin_protocol(room)
+    else:
+        room.viewers.append(connection)
+        if state == rooms.FULL:
+            inprogress_protocol(connection)
+
+
+@protocol_handlers.register("CREATE", requires_auth=True)
+def create_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the CREATE protocol
+    '''
+    shape = server.board_shape(data)
+    if shape is None:
+        connection.send("CREATE:ACKSTATUS:4\n")
+        return
+    room_name = data[1]
+    if len(room_registry) >= server.ROOMS_LIMIT:
+        connection.send("CREATE:ACKSTATUS:3\n")
+        return
+    if not server.valid_room_name(room_name):
+        connection.send("CREATE:ACKSTATUS:1\n")
+        return
+    if room_name in room_registry:
+        connection.send("CREATE:ACKSTATUS:2\n")
+        return
+    room_registry.add(room_name, Room(room_name, *shape))
+    add_connection_to_room(connection, "PLAYER", room_name)
+    connection.send("CREATE:ACKSTATUS:0\n")
+
+
+@protocol_handlers.register("JOIN", requires_auth=True)
+def join_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the JOIN protocol
+    '''
+    if len(data) != 3 or data[2] not in ("PLAYER", "VIEWER"):
+        connection.send("JOIN:ACKSTATUS:3\n")
+        return
+    _, room_name, mode = data
+    entry = room_registry.lookup(room_name)
+    if entry is None:
+        connection.send("JOIN:ACKSTATUS:1\n")
+        return
+    if mode == "PLAYER" and entry[0] != rooms.PENDING:
+        connection.send("JOIN:ACKSTATUS:2\n")
+        return
+    connection.send("JOIN:ACKSTATUS:0\n")
+    add_connection_to_room(connection, mode, room_name)
+
+
+def begin_protocol(room: Room) -> None:
+    '''
+    handle the BEGIN protocol
+    '''
+    room.board = tictactoe.create_game_board(room.board_size, room.win_length)
+    if room.board_size == tictactoe.BOARD_SIZE and room.win_length == tictactoe.BOARD_SIZE:
+        room.send_message(f"BEGIN:{room.player1.username}:{room.player2.username}\n")
+    else:
+        room.send_message(f"BEGIN:{room.player1.username}:{room.player2.username}:{room.board_size}:{room.win_length}\n")
+
+
+@protocol_handlers.register("PLACE", requires_auth=True, requires_room=True)
+def place_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the PLACE protocol
+    '''
+    room = connection.room
+    if room_registry.full.get(room.room_name) is not room or connection not in (room.player1, room.player2):
+        return
+    marker = 'X' if connection is room.player1 else 'O'
+    _, col, row = data
+    board = tictactoe.put_marker(room.board, int(row), int(col), marker)
+    if board is None:
+        return
+    if tictactoe.player_wins(marker, room.board):
+        gameend_protocol(room, "0", connection.username)
+    elif tictactoe.players_draw(room.board):
+        gameend_protocol(room, "1")
+    else:
+        room.swap_turn()
+        room.send_message(f"BOARDSTATUS:{tictactoe.get_board_status(room.board)}\n")
+
+
+def gameend_protocol(room: Room, status_code: str, *winner_username) -> None:
+    '''
+    handle the GAMEEND protocol
+    '''
+    board_status = tictactoe.get_board_status(room.board)
+    if winner_username:
+        message = f"GAMEEND:{board_status}:{status_code}:{winner_username[0]}\n"
+    else:
+        message = f"GAMEEND:{board_status}:{status_code}\n"
+    room.send_message(message)
+    room.destroy()
+
+
+@protocol_handlers.register("FORFEIT", requires_auth=True, requires_room=True)
+def forfeit_protocol(connection: Connection, data: list[str]) -> None:
+    '''
+    handle the FORFEIT protocol
+    '''
+    room = connection.room
+    if room_registry.full.get(room.room_name) is not room or connection not in (room.player1, room.player2):
+        return
+    opponent = room.player2 if connection is room.player1 else room.player1
+    gameend_protocol(room, "2", opponent.username)
+
+
+def inprogress_protocol(connection: Connection) -> None:
+    '''
+    handle the INPROGRESS protocol
+    '''
+    room = connection.room
+    current_turn_player = room.current_turn_player
+    opposing_player = room.player1.username if current_turn_player == room.player2.username else room.player2.username
+    connection.send(f"INPROGRESS:{current_turn_player}:{opposing_player}\n")
+
+
+async def process_line(connection: Connection, data: str) -> None:
+    '''
+    respond to one protocol line
+    '''
+    data = data.split(":")
+    entry = protocol_handlers.lookup(data[0])
+    options = entry[1] if entry is not None else server.UNKNOWN_VERB_OPTIONS
+    verb = data[0] if entry is not None else "UNKNOWN"
+    requests_received.inc(verb)
+    if options.get("requires_auth") and connection.username is None:
+        connection.send("BADAUTH\n")
+    elif options.get("requires_room") and connection.room is None:
+        connection.send("NOROOM\n")
+    elif entry is not None:
+        start = time.perf_counter()
+        result = entry[0](connection, data)
+        if asyncio.iscoroutine(result):
+            await result
+        request_duration.observe(time.perf_counter() - start, verb)
+
+
+def remove_connection(connection: Connection) -> None:
+    '''
+    take a disconnected client out of its room, its opponent wins if it was playing
+    '''
+    room = connection.room
+    if room is None:
+        return
+    if room_registry.full.get(room.room_name) is room and connection in (room.player1, room.player2):
+        opponent = room.player2 if connection is room.player1 else room.player1
+        gameend_protocol(room, "2", opponent.username)
+    elif connection is room.player1:
+        # the creator of a pending room left, nobody could play in it
+        room.destroy()
+    elif connection in room.viewers:
+        room.viewers.remove(connection)
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    '''
+    serve one client: its lines are processed in order, each after the previous one completed
+    '''
+    connection = Connection(reader, writer)
+    connections.add(connection)
+    logger.debug("new connection from %s", connection.address)
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                logger.info("line from %s exceeds %d bytes", connection.address, protocol.MAX_LINE_LENGTH)
+                break
+            if not line.endswith(b"\n"):
+                # disconnected, the unterminated fragment is dropped
+                break
+            data = line[:-1].decode(errors="replace")
+            try:
+                await process_line(connection, data)
+            except (ValueError, IndexError) as e:
+                logger.info("malformed message from %s: %s (%s)", connection.address, data, e)
+            # stop reading from a client that does not read its replies
+            await writer.drain()
+    except ConnectionError as e:
+        logger.info("error receiving data: %s", e)
+    finally:
+        logger.debug("disconnection from %s", connection.address)
+        connections.discard(connection)
+        remove_connection(connection)
+        writer.close()
+
+
+async def handle_admin_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    '''
+    answer one HTTP request to the admin port
+    '''
+    request = b""
+    response = None
+    try:
+        while response is None:
+            received = await reader.read(protocol.RECV_SIZE)
+            if not received:
+                break
+            request += received
+            response = metrics.http_response(request, metrics_registry)
+        if response is not None:
+            writer.write(response)
+            await writer.drain()
+    except ConnectionError as e:
+        logger.info("error sending metrics: %s", e)
+    finally:
+        writer.close()
+
+
+async def serve() -> None:
+    '''
+    accept clients until cancelled
+    '''
+    asyncio_server = await asyncio.start_server(
+        handle_connection, "localhost", server.server_port,
+        limit=protocol.MAX_LINE_LENGTH + 1, backlog=server.LISTEN_BACKLOG, reuse_address=True,
+    )
+    logger.info("server is listening at %s", ("localhost", server.server_port))
+    if server.admin_port:
+        await asyncio.start_server(handle_admin_connection, "localhost", server.admin_port, reuse_address=True)
+        logger.info("metrics are served at http://localhost:%d/metrics", server.admin_port)
+    async with asyncio_server:
+        await asyncio_server.serve_forever()
+
+
+def main(args: list[str]) -> None:
+    server.config(args)
+    if server.n_workers != 1:
+        sys.stderr.write("Error: the asyncio server runs a single worker\n")
+        sys.exit(1)
+    server.raise_file_limit()
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    try:
+        if uvloop is not None:
+            uvloop.run(serve())
+        else:
+            asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,188 @@
+import sys
+import time
+import numpy as np
+import tictactoe
+
+
+BATCH_SIZE: int = 10000 # the number of games simulated at once
+N_VERIFIED: int = 2000 # the number of games of the first batch checked against the tictactoe functions
+EMPTY, X, O = 0, 1, 2 # the cell values, which are also the status code digits
+DRAW: int = 3 # the outcome of a drawn game, otherwise the outcome is the winner's cell value (0 while in progress)
+
+
+def line_cells(size: int, win_length: int) -> np.ndarray:
+    '''
+    return the cell indices of every line of <win_length> cells on a <size> by <size> board,
+    one row per line, in the four directions of tictactoe.LINE_DIRECTIONS
+    '''
+    lines = []
+    for d_row, d_col in tictactoe.LINE_DIRECTIONS:
+        for row in range(size):
+            for col in range(size):
+                end_row = row + d_row * (win_length - 1)
+                end_col = col + d_col * (win_length - 1)
+                if 0 <= end_row < size and 0 <= end_col < size:
+                    lines.append([(row + d_row * i) * size + col + d_col * i for i in range(win_length)])
+    return np.array(lines, dtype=np.intp)
+
+
+class BoardBatch:
+    '''
+    A batch of boards held as one array, every operation applies to all of them at once
+
+    Attributes:
+    -----------
+    size: int
+        the number of rows (and columns) of every board
+    win_length: int
+        the number of markers in a row that wins a game
+    cells: np.ndarray
+        an (n_boards, size * size) uint8 array of EMPTY/X/O, in status code order
+    lines: np.ndarray
+        the cell indices of every winning line, see line_cells()
+    '''
+    def __init__(self, n_boards: int, size: int = tictactoe.BOARD_SIZE, win_length: int = tictactoe.BOARD_SIZE):
+        self.size = size
+        self.win_length = win_length
+        self.cells = np.zeros((n_boards, size * size), dtype=np.uint8)
+        self.lines = line_cells(size, win_length)
+
+    def place(self, boards: np.ndarray, cells: np.ndarray, marker: int) -> None:
+        '''
+        put <marker> at cells[i] of board boards[i], the cells must be empty
+        '''
+        self.cells[boards, cells] = marker
+
+    def wins(self, marker: int, boards: np.ndarray | None = None) -> np.ndarray:
+        '''
+        return whether <marker> has a whole line on each board (or on each of <boards>)
+        '''
+        cells = self.cells if boards is None else self.cells[boards]
+        return (cells[:, self.lines] == marker).all(axis=2).any(axis=1)
+
+    def draws(self, boards: np.ndarray | None = None) -> np.ndarray:
+        '''
+        return whether each board (or each of <boards>) is full
+        '''
+        cells = self.cells if boards is None else self.cells[boards]
+        return (cells != EMPTY).all(axis=1)
+
+    def statuses(self) -> np.ndarray:
+        '''
+        return the status code of every board as an array of strings
+        '''
+        digits = np.ascontiguousarray(self.cells + ord("0"))
+        return digits.view(f"S{digits.shape[1]}").ravel().astype(f"U{digits.shape[1]}")
+
+    def bitboard_bits(self) -> np.ndarray:
+        '''
+        return the tictactoe.BitBoard bits of every 3x3 board
+        '''
+        powers = 1 << np.arange(tictactoe.N_CELLS, dtype=np.int64)
+        return (self.cells == X) @ powers | ((self.cells == O) @ powers) << tictactoe.N_CELLS
+
+
+def bot_move_table() -> np.ndarray:
+    '''
+    return the bot's solved 3x3 moves as an array indexed by BitBoard bits
+    '''
+    import bot
+    bot.load_table()
+    table = np.zeros(1 << (2 * tictactoe.N_CELLS), dtype=np.intp)
+    table[list(bot.solved_moves)] = list(bot.solved_moves.values())
+    return table
+
+
+def simulate(n_games: int, size: int, win_length: int, rng: np.random.Generator, bot_marker: int | None = None) -> tuple[BoardBatch, np.ndarray]:
+    '''
+    play <n_games> games at once with uniformly random moves, X moving first
+    on a 3x3 board the bot plays <bot_marker>'s moves if given
+    return the final boards and the outcome of every game
+    '''
+    batch = BoardBatch(n_games, size, win_length)
+    outcomes = np.zeros(n_games, dtype=np.uint8)
+    move_table = bot_move_table() if bot_marker is not None else None
+    active = np.arange(n_games)
+    marker = X
+    while active.size:
+        if marker == bot_marker:
+            cells = move_table[batch.bitboard_bits()[active]]
+        else:
+            # the empty cell with the largest random key is a uniformly random legal move
+            keys = rng.random((active.size, size * size))
+            keys[batch.cells[active] != EMPTY] = -1
+            cells = keys.argmax(axis=1)
+        batch.place(active, cells, marker)
+        won = batch.wins(marker, active)
+        outcomes[active[won]] = marker
+        active = active[~won]
+        drawn = batch.draws(active)
+        outcomes[active[drawn]] = DRAW
+        active = active[~drawn]
+        marker = O if marker == X else X
+    return batch, outcomes
+
+
+def verify(batch: BoardBatch, outcomes: np.ndarray, n_boards: int) -> None:
+    '''
+    check the first <n_boards> boards of <batch> against player_wins, players_draw and get_board_status,
+    raise AssertionError on the first disagreement
+    '''
+    statuses = batch.statuses()
+    for i in range(min(n_boards, len(outcomes))):
+        status = str(statuses[i])
+        if batch.win_length == batch.size:
+            board = tictactoe.assign_board(status)
+        else:
+            board = tictactoe.create_gridboard(batch.size, batch.win_length)
+            board.cells[:] = status.encode()
+            board.n_filled = batch.size * batch.size - status.count("0")
+        assert tictactoe.get_board_status(board) == status, (i, status)
+        if isinstance(board, tictactoe.GridBoard):
+            x_wins, o_wins = (
+                tictactoe.player_wins_horizontally(marker, board) or tictactoe.player_wins_vertically(marker, board) or tictactoe.player_wins_diagonally(marker, board)
+                for marker in ('X', 'O')
+            )
+        else:
+            x_wins, o_wins = tictactoe.player_wins('X', board), tictactoe.player_wins('O', board)
+        expected = X if x_wins else O if o_wins else DRAW if tictactoe.players_draw(board) else EMPTY
+        assert x_wins + o_wins < 2 and outcomes[i] == expected, (i, status, outcomes[i], expected)
+        assert bool(batch.wins(X, np.array([i]))[0]) == x_wins and bool(batch.wins(O, np.array([i]))[0]) == o_wins, (i, status)
+        assert bool(batch.draws(np.array([i]))[0]) == (status.count("0") == 0), (i, status)
+
+
+def main(args: list[str]) -> None:
+    '''
+    usage: batchsim.py [n_games] [size] [win length] [X|O: the side the bot plays, 3x3 only]
+    '''
+    try:
+        n_games = int(args[0]) if len(args) > 0 else 1000000
+        size = int(args[1]) if len(args) > 1 else tictactoe.BOARD_SIZE
+        win_length = int(args[2]) if len(args) > 2 else size
+    except ValueError:
+        sys.stderr.write("Error: Expecting [n_games] [size] [win length] [X|O] as integers and a marker\n")
+        sys.exit(1)
+    bot_marker = {"X": X, "O": O}.get(args[3]) if len(args) > 3 else None
+    if not tictactoe.BOARD_SIZE <= win_length <= size or (len(args) > 3 and (bot_marker is None or size != tictactoe.BOARD_SIZE or win_length != size)):
+        sys.stderr.write("Error: Expecting 3 <= win length <= size, the bot only plays X or O on a 3x3 board\n")
+        sys.exit(1)
+    rng = np.random.default_rng()
+    totals = np.zeros(DRAW + 1, dtype=np.int64)
+    elapsed = 0.0
+    n_played = 0
+    while n_played < n_games:
+        n_batch = min(BATCH_SIZE, n_games - n_played)
+        start = time.perf_counter()
+        batch, outcomes = simulate(n_batch, size, win_length, rng, bot_marker)
+        elapsed += time.perf_counter() - start
+        if n_played == 0:
+            verify(batch, outcomes, N_VERIFIED)
+            print(f"verified {min(N_VERIFIED, n_batch)} games against the tictactoe functions")
+        totals += np.bincount(outcomes, minlength=DRAW + 1)
+        n_played += n_batch
+    print(f"{n_played} games on a {size}x{size} board ({win_length} in a row) in {elapsed:.2f}s: {n_played / elapsed:.0f} games/s")
+    print(f"X won {totals[X] / n_played:.2%}, O won {totals[O] / n_played:.2%}, drawn {totals[DRAW] / n_played:.2%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,1121 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import socket
+import select
+import selectors
+import tempfile
+import threading
+import subprocess
+import server
+import tictactoe
+import wire
+
+
+def make_idle_connections(n_connections: int) -> list[tuple[socket.socket, socket.socket]]:
+    '''
+    create <n_connections> connected socket pairs that never send anything
+    '''
+    pairs = []
+    for _ in range(n_connections):
+        a, b = socket.socketpair()
+        a.setblocking(False)
+        b.setblocking(False)
+        pairs.append((a, b))
+    return pairs
+
+
+def close_connections(pairs: list[tuple[socket.socket, socket.socket]]) -> None:
+    '''
+    close every socket of <pairs>
+    '''
+    for a, b in pairs:
+        a.close()
+        b.close()
+
+
+def time_select_loop(idle: list[socket.socket], active: socket.socket, peer: socket.socket, iterations: int) -> float | None:
+    '''
+    time one wakeup of the old select.select() loop over the whole sockets list, in microseconds
+    return None if select() cannot handle that many descriptors
+    '''
+    sockets_list = idle + [active]
+    start = time.perf_counter()
+    try:
+        for _ in range(iterations):
+            peer.send(b"x")
+            read_sockets, _, _ = select.select(sockets_list, [], sockets_list)
+            for notified_socket in read_sockets:
+                notified_socket.recv(8192)
+    except ValueError:
+        # filedescriptor out of range in select()
+        return None
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def time_selector_loop(idle: list[socket.socket], active: socket.socket, peer: socket.socket, iterations: int) -> float:
+    '''
+    time one wakeup of the selectors based loop, in microseconds
+    '''
+    selector = selectors.DefaultSelector()
+    for sock in idle:
+        selector.register(sock, selectors.EVENT_READ)
+    selector.register(active, selectors.EVENT_READ)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        peer.send(b"x")
+        for key, _ in selector.select():
+            key.fileobj.recv(8192)
+    elapsed = time.perf_counter() - start
+    selector.close()
+    return elapsed / iterations * 1e6
+
+
+def bench_event_loop(args: list[str]) -> None:
+    '''
+    compare the per-wakeup cost of the select.select() loop and the selectors loop
+    as the number of idle connections grows
+    usage: eventloop [n_connections ...]
+    '''
+    counts = [int(arg) for arg in args] if args else [10, 100, 400, 1000, 5000]
+    server.raise_file_limit()
+    iterations = 2000
+    print(f"{'connections':>12} {'select (us)':>12} {'selectors (us)':>15}")
+    for n_connections in counts:
+        pairs = make_idle_connections(n_connections)
+        active, peer = socket.socketpair()
+        active.setblocking(False)
+        idle = [a for a, _ in pairs]
+        select_time = time_select_loop(idle, active, peer, iterations)
+        selector_time = time_selector_loop(idle, active, peer, iterations)
+        select_column = f"{select_time:12.2f}" if select_time is not None else f"{'unsupported':>12}"
+        print(f"{n_connections:>12} {select_column} {selector_time:15.2f}")
+        active.close()
+        peer.close()
+        close_connections(pairs)
+
+
+SERVER_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+class BenchClient:
+    '''
+    A blocking line-oriented client used to drive a running server
+
+    Attributes:
+    -----------
+    client_socket: socket.socket
+        the socket connected to the server
+    buffer: bytes
+        the received bytes that do not form a complete line (or frame) yet
+    binary: bool
+        whether the connection switched to binary frames, whose messages are translated back to lines
+    names: dict[int, str]
+        [name_id, username] : the name ids defined by the server's NAME frames
+    received_bytes: int
+        the number of bytes received
+    '''
+    def __init__(self, port: int):
+        self.client_socket = socket.create_connection(("localhost", port))
+        self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b""
+        self.binary = False
+        self.names = {}
+        self.received_bytes = 0
+
+    def hello(self, mode: str = wire.BINARY, deltas: bool = False) -> None:
+        '''
+        switch the connection to <mode> (binary frames by default), asking for MOVE deltas if <deltas>
+        '''
+        if self.request(f"HELLO:{mode}:{wire.DELTA}" if deltas else f"HELLO:{mode}") != "HELLO:ACKSTATUS:0":
+            raise ConnectionError("server refused the HELLO")
+        self.binary = mode == wire.BINARY
+
+    def send(self, message: str) -> None:
+        '''
+        send one protocol line
+        '''
+        if self.binary:
+            self.client_socket.sendall(wire.frame(wire.encode_request(message.split(":"))))
+        else:
+            self.client_socket.sendall(f"{message}\n".encode())
+
+    def receive_more(self) -> None:
+        '''
+        block until more bytes are received and add them to the buffer
+        '''
+        data = self.client_socket.recv(8192)
+        if not data:
+            raise ConnectionError("server closed the connection")
+        self.received_bytes += len(data)
+        self.buffer += data
+
+    def receive(self) -> str:
+        '''
+        block until a complete protocol line is received and return it
+        '''
+        while self.binary:
+            while len(self.buffer) < 2 or len(self.buffer) < 2 + int.from_bytes(self.buffer[:2], "big"):
+                self.receive_more()
+            end = 2 + int.from_bytes(self.buffer[:2], "big")
+            payload, self.buffer = self.buffer[2:end], self.buffer[end:]
+            line = wire.decode_message(payload, self.names)
+            if line is not None:
+                return line
+        while b"\n" not in self.buffer:
+            self.receive_more()
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return line.decode()
+
+    def request(self, message: str) -> str:
+        '''
+        send one protocol line and return the first line received back
+        '''
+        self.send(message)
+        return self.receive()
+
+    def close(self) -> None:
+        self.client_socket.close()
+
+
+def launch_server(port: int, users: list[dict], extra_config: dict | None = None, server_path: str = SERVER_PATH) -> tuple[subprocess.Popen, str]:
+    '''
+    write a server config and a user database with <users> to a temporary directory,
+    launch the server on <port> and wait until it accepts connections
+    return the server process and the temporary directory
+    '''
+    directory = tempfile.mkdtemp(prefix="tictactoe-bench-")
+    user_database_path = os.path.join(directory, "user_database.json")
+    with open(user_database_path, "w") as f:
+        json.dump(users, f)
+    server_config = {"port": port, "userDatabase": user_database_path}
+    if extra_config:
+        server_config.update(extra_config)
+    server_config_path = os.path.join(directory, "server_config.json")
+    with open(server_config_path, "w") as f:
+        json.dump(server_config, f)
+    process = subprocess.Popen([sys.executable, server_path, server_config_path], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("localhost", port)).close()
+            return process, directory
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("server did not start")
+            time.sleep(0.05)
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    '''
+    return the <fraction> percentile of <samples>
+    '''
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# a sequence of (col, row) moves that fills the board without a winner
+DRAW_MOVES: list[tuple[int, int]] = [(0, 0), (1, 0), (2, 0), (1, 1), (0, 1), (2, 1), (1, 2), (0, 2), (2, 2)]
+
+
+def start_game(player1: BenchClient, player2: BenchClient, room_name: str) -> None:
+    '''
+    let <player1> create the room <room_name> and <player2> join it, then consume the BEGIN messages
+    '''
+    player1.request(f"CREATE:{room_name}")
+    player2.request(f"JOIN:{room_name}:PLAYER")
+    player1.receive()
+    player2.receive()
+
+
+def play_moves(player1: BenchClient, player2: BenchClient, n_moves: int) -> list[float]:
+    '''
+    play <n_moves> moves over as many games as needed and return the latency of each move in milliseconds,
+    measured from sending PLACE until the mover receives the resulting BOARDSTATUS/GAMEEND
+    '''
+    latencies = []
+    n_games = 0
+    while len(latencies) < n_moves:
+        n_games += 1
+        start_game(player1, player2, f"bench{n_games}")
+        for i, (col, row) in enumerate(DRAW_MOVES):
+            mover, other = (player1, player2) if i % 2 == 0 else (player2, player1)
+            start = time.perf_counter()
+            mover.send(f"PLACE:{col}:{row}")
+            mover.receive()
+            latencies.append((time.perf_counter() - start) * 1000)
+            other.receive()
+    return latencies[:n_moves]
+
+
+def bench_login_storm(args: list[str]) -> None:
+    '''
+    measure the move latency of two in-game players while a burst of clients log in
+    usage: loginstorm [n_logins] [port]
+    '''
+    import bcrypt
+    n_logins = int(args[0]) if len(args) > 0 else 64
+    port = int(args[1]) if len(args) > 1 else 52990
+    password_hash = bcrypt.hashpw(b"password", bcrypt.gensalt()).decode()
+    users = [{"username": name, "password": password_hash} for name in ("player1", "player2", "storm")]
+    process, _ = launch_server(port, users)
+    try:
+        player1 = BenchClient(port)
+        player2 = BenchClient(port)
+        player1.request("LOGIN:player1:password")
+        player2.request("LOGIN:player2:password")
+        quiet = play_moves(player1, player2, 45)
+
+        def login_storm() -> None:
+            storm_clients = [BenchClient(port) for _ in range(n_logins)]
+            for storm_client in storm_clients:
+                storm_client.send("LOGIN:storm:password")
+            for storm_client in storm_clients:
+                storm_client.receive()
+                storm_client.close()
+
+        storm_thread = threading.Thread(target=login_storm)
+        start = time.perf_counter()
+        storm_thread.start()
+        stormy = []
+        while storm_thread.is_alive():
+            stormy += play_moves(player1, player2, 9)
+        storm_thread.join()
+        storm_time = time.perf_counter() - start
+        print(f"{n_logins} logins took {storm_time:.2f}s ({n_logins / storm_time:.1f} logins/s)")
+        print(f"{'':>12} {'moves':>6} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+        for label, samples in (("idle", quiet), ("login storm", stormy)):
+            print(f"{label:>12} {len(samples):>6} {percentile(samples, 0.5):9.2f} {percentile(samples, 0.99):9.2f} {max(samples):9.2f}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def rewrite_user_database(path: str, records: list[tuple[str, str]]) -> None:
+    '''
+    rewrite the whole user database file and sync it, as every REGISTER used to (without the sync)
+    '''
+    with open(path, "w") as f:
+        f.write("[\n")
+        for i, (username, password) in enumerate(records):
+            f.write("\t{\n")
+            f.write(f'\t\t"username": "{username}",\n')
+            f.write(f'\t\t"password": "{password}"\n')
+            f.write("\t}")
+            if i < len(records)-1:
+                f.write(",")
+            f.write("\n")
+        f.write("]")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def time_registrations(register, max_registrations: int, max_seconds: float = 2.0) -> float:
+    '''
+    call register(i) until <max_registrations> calls or <max_seconds> and return the calls per second
+    '''
+    start = time.perf_counter()
+    n_registrations = 0
+    while n_registrations < max_registrations and time.perf_counter() - start < max_seconds:
+        register(n_registrations)
+        n_registrations += 1
+    return n_registrations / (time.perf_counter() - start)
+
+
+def bench_registrations(args: list[str]) -> None:
+    '''
+    compare registrations per second of rewriting the JSON file, the journaled JSON store and SQLite
+    as the user database grows, the stores sync once per <group> registrations
+    usage: registrations [group] [n_users ...]
+    '''
+    import userstore
+    group = int(args[0]) if args else 16
+    sizes = [int(arg) for arg in args[1:]] if len(args) > 1 else [1000, 10000, 100000]
+    password_hash = "$2b$12$" + "x" * 53
+    print(f"{'users':>8} {'rewrite (/s)':>13} {'journal (/s)':>13} {'sqlite (/s)':>12}")
+    for n_users in sizes:
+        directory = tempfile.mkdtemp(prefix="tictactoe-bench-")
+        records = [(f"user{i}", password_hash) for i in range(n_users)]
+        json_path = os.path.join(directory, "users.json")
+        userstore.write_snapshot(json_path, records)
+
+        def rewrite(i: int) -> None:
+            records.append((f"new{i}", password_hash))
+            rewrite_user_database(json_path, records)
+        rewrite_rate = time_registrations(rewrite, 2000)
+
+        userstore.write_snapshot(json_path, records[:n_users])
+        json_store = userstore.JsonUserStore(json_path)
+        sqlite_store = userstore.SqliteUserStore(os.path.join(directory, "users.db"))
+        sqlite_store.add_many(records[:n_users])
+        rates = []
+        for store in (json_store, sqlite_store):
+            def register(i: int, store: userstore.UserStore = store) -> None:
+                store.add(f"new{i}", password_hash)
+                if i % group == group - 1:
+                    store.sync()
+            rates.append(time_registrations(register, 20000))
+            store.close()
+        print(f"{n_users:>8} {rewrite_rate:13.0f} {rates[0]:13.0f} {rates[1]:12.0f}")
+
+
+def bench_user_loading(args: list[str]) -> None:
+    '''
+    compare the startup load time of a JSON user database with json.load, the streaming loader
+    and the binary index cache
+    usage: userload [n_users ...]
+    '''
+    import userstore
+    sizes = [int(arg) for arg in args] if args else [10000, 100000, 1000000]
+    password_hash = "$2b$12$" + "x" * 53
+    print(f"{'users':>8} {'json.load (s)':>14} {'streaming (s)':>14} {'cached (s)':>11}")
+    for n_users in sizes:
+        directory = tempfile.mkdtemp(prefix="tictactoe-bench-")
+        json_path = os.path.join(directory, "users.json")
+        index_cache_path = json_path + ".idx"
+        userstore.write_snapshot(json_path, [(f"user{i}", password_hash) for i in range(n_users)])
+        timings = []
+        start = time.perf_counter()
+        with open(json_path) as fileobj:
+            data = json.load(fileobj)
+        {account["username"]: account["password"] for account in data}
+        timings.append(time.perf_counter() - start)
+        del data
+        for cache_path in (None, index_cache_path):
+            if cache_path is not None:
+                # build the cache first, the timing is of a restart
+                userstore.load_snapshot(json_path, cache_path)
+            start = time.perf_counter()
+            userstore.load_snapshot(json_path, cache_path)
+            timings.append(time.perf_counter() - start)
+        print(f"{n_users:>8} {timings[0]:14.3f} {timings[1]:14.3f} {timings[2]:11.3f}")
+
+
+AIOSERVER_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aioserver.py")
+
+
+def bench_users(n_users: int, rounds: int = 4) -> list[dict]:
+    '''
+    return <n_users> user records named user0, user1, ... with the password "password",
+    hashed with few bcrypt rounds so that logging in is cheap
+    '''
+    import bcrypt
+    password_hash = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds)).decode()
+    return [{"username": f"user{i}", "password": password_hash} for i in range(n_users)]
+
+
+class AsyncBenchClient:
+    '''
+    An asyncio line-oriented client used to drive a running server
+
+    Attributes:
+    -----------
+    reader: asyncio.StreamReader
+        the stream the server's lines are read from
+    writer: asyncio.StreamWriter
+        the stream the lines to the server are written to
+    '''
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, port: int) -> "AsyncBenchClient":
+        reader, writer = await asyncio.open_connection("localhost", port)
+        return cls(reader, writer)
+
+    def send(self, message: str) -> None:
+        '''
+        send one protocol line
+        '''
+        self.writer.write(f"{message}\n".encode())
+
+    async def receive(self) -> str:
+        '''
+        wait until a complete protocol line is received and return it
+        '''
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return line[:-1].decode()
+
+    async def request(self, message: str) -> str:
+        '''
+        send one protocol line and return the first line received back
+        '''
+        self.send(message)
+        return await self.receive()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def play_pair(port: int, pair: int, n_moves: int, latencies: list[float]) -> None:
+    '''
+    log two players in and let them play <n_moves> moves over as many games as needed,
+    appending the latency of each move in milliseconds to <latencies>
+    '''
+    player1 = await AsyncBenchClient.connect(port)
+    player2 = await AsyncBenchClient.connect(port)
+    await player1.request(f"LOGIN:user{2*pair}:password")
+    await player2.request(f"LOGIN:user{2*pair+1}:password")
+    n_played = 0
+    n_games = 0
+    while n_played < n_moves:
+        n_games += 1
+        await player1.request(f"CREATE:p{pair}g{n_games}")
+        await player2.request(f"JOIN:p{pair}g{n_games}:PLAYER")
+        await player1.receive()
+        await player2.receive()
+        for i, (col, row) in enumerate(DRAW_MOVES):
+            mover, other = (player1, player2) if i % 2 == 0 else (player2, player1)
+            start = time.perf_counter()
+            mover.send(f"PLACE:{col}:{row}")
+            await mover.receive()
+            latencies.append((time.perf_counter() - start) * 1000)
+            await other.receive()
+            n_played += 1
+    player1.close()
+    player2.close()
+
+
+async def run_pairs(port: int, n_pairs: int, n_moves: int) -> tuple[float, list[float]]:
+    '''
+    run <n_pairs> concurrent games of <n_moves> moves each
+    return the elapsed time in seconds and the move latencies in milliseconds
+    '''
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(play_pair(port, pair, n_moves, latencies) for pair in range(n_pairs)))
+    return time.perf_counter() - start, latencies
+
+
+def bench_servers(args: list[str]) -> None:
+    '''
+    compare the selectors server and the asyncio server with concurrent games
+    usage: servers [n_pairs] [n_moves] [port]
+    '''
+    n_pairs = int(args[0]) if len(args) > 0 else 100
+    n_moves = int(args[1]) if len(args) > 1 else 90
+    port = int(args[2]) if len(args) > 2 else 52991
+    users = bench_users(2 * n_pairs)
+    server.raise_file_limit()
+    print(f"{'server':>12} {'moves/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for label, server_path in (("selectors", SERVER_PATH), ("asyncio", AIOSERVER_PATH)):
+        process, _ = launch_server(port, users, server_path=server_path)
+        try:
+            elapsed, latencies = asyncio.run(run_pairs(port, n_pairs, n_moves))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{label:>12} {len(latencies) / elapsed:9.0f} {percentile(latencies, 0.5):9.2f} {percentile(latencies, 0.99):9.2f}")
+
+
+DISPATCH_LINES: list[str] = ["PLACE:1:2", "ROOMLIST:PLAYER", "CREATE:room", "JOIN:room:VIEWER", "FORFEIT", "LOGIN:user:password"] # a mix of protocol lines to parse
+
+
+def bench_dispatch(args: list[str]) -> None:
+    '''
+    compare the parsing rate of an if/elif chain that splits the line per verb with protocol.Dispatcher
+    usage: dispatch [n_lines]
+    '''
+    import protocol
+    n_lines = int(args[0]) if args else 1000000
+    lines = (DISPATCH_LINES * (n_lines // len(DISPATCH_LINES) + 1))[:n_lines]
+    handled = []
+    handler = handled.append
+
+    def dispatch_chain(data: str) -> None:
+        if data.split(":")[0] == "LOGIN":
+            handler(data.split(":"))
+        elif data.split(":")[0] == "REGISTER":
+            handler(data.split(":"))
+        elif data.split(":")[0] == "ROOMLIST":
+            handler(data.split(":"))
+        elif data.split(":")[0] == "CREATE":
+            handler(data.split(":"))
+        elif data.split(":")[0] == "JOIN":
+            handler(data.split(":"))
+        elif data.split(":")[0] == "PLACE":
+            handler(data.split(":"))
+        elif data.split(":")[0] == "FORFEIT":
+            handler(data.split(":"))
+
+    dispatcher = protocol.Dispatcher()
+    for verb in ("LOGIN", "REGISTER", "ROOMLIST", "CREATE", "JOIN", "PLACE", "FORFEIT"):
+        dispatcher.register(verb)(handler)
+    print(f"{'parser':>12} {'lines/s':>12}")
+    for label, dispatch in (("if/elif", dispatch_chain), ("dispatcher", dispatcher.dispatch)):
+        handled.clear()
+        start = time.perf_counter()
+        for line in lines:
+            dispatch(line)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>12} {n_lines / elapsed:12.0f}")
+
+
+def wait_for_lines(viewer_selector: selectors.BaseSelector, n_viewers: int) -> tuple[float, float]:
+    '''
+    wait until each of the <n_viewers> sockets registered with <viewer_selector> has received one line
+    return the times the first and the last of them completed it
+    '''
+    first = None
+    remaining = n_viewers
+    while remaining:
+        for key, _ in viewer_selector.select(timeout=10):
+            data = key.fileobj.recv(8192)
+            if not data:
+                raise ConnectionError("server closed a viewer connection")
+            if data.endswith(b"\n"):
+                first = first or time.perf_counter()
+                remaining -= 1
+    return first, time.perf_counter()
+
+
+def bench_fanout(args: list[str]) -> None:
+    '''
+    measure how long a BOARDSTATUS takes to reach every viewer of a room with many viewers
+    usage: fanout [n_viewers] [n_games] [port] [server path]
+    '''
+    n_viewers = int(args[0]) if len(args) > 0 else 10000
+    n_games = int(args[1]) if len(args) > 1 else 3
+    port = int(args[2]) if len(args) > 2 else 52992
+    server_path = args[3] if len(args) > 3 else SERVER_PATH
+    server.raise_file_limit()
+    users = bench_users(n_viewers + 2)
+    process, _ = launch_server(port, users, server_path=server_path)
+    try:
+        player1 = BenchClient(port)
+        player2 = BenchClient(port)
+        player1.request("LOGIN:user0:password")
+        player2.request("LOGIN:user1:password")
+        viewers = [BenchClient(port) for _ in range(n_viewers)]
+        for i, viewer in enumerate(viewers):
+            viewer.send(f"LOGIN:user{i + 2}:password")
+        for viewer in viewers:
+            viewer.receive()
+        viewer_selector = selectors.DefaultSelector()
+        for viewer in viewers:
+            viewer_selector.register(viewer.client_socket, selectors.EVENT_READ)
+        first_latencies = []
+        last_latencies = []
+        for game in range(n_games):
+            start_game(player1, player2, f"fanout{game}")
+            for viewer in viewers:
+                viewer.send(f"JOIN:fanout{game}:VIEWER")
+            for viewer in viewers:
+                # JOIN:ACKSTATUS, INPROGRESS and SNAPSHOT
+                for _ in range(3):
+                    viewer.receive()
+            for i, (col, row) in enumerate(DRAW_MOVES):
+                mover, other = (player1, player2) if i % 2 == 0 else (player2, player1)
+                start = time.perf_counter()
+                mover.send(f"PLACE:{col}:{row}")
+                first, last = wait_for_lines(viewer_selector, n_viewers)
+                first_latencies.append((first - start) * 1000)
+                last_latencies.append((last - start) * 1000)
+                mover.receive()
+                other.receive()
+        viewer_selector.close()
+        print(f"{n_viewers} viewers, {len(last_latencies)} moves, time from PLACE until a viewer receives the board:")
+        print(f"{'viewer':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+        for label, samples in (("first", first_latencies), ("last", last_latencies)):
+            print(f"{label:>8} {percentile(samples, 0.5):9.2f} {percentile(samples, 0.99):9.2f} {max(samples):9.2f}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bench_board(args: list[str]) -> None:
+    '''
+    compare the list board and the BitBoard on applying moves, checking for a win/draw and encoding the status
+    usage: board [n_games]
+    '''
+    import tictactoe
+    n_games = int(args[0]) if args else 100000
+    print(f"{'board':>8} {'moves/s':>10} {'win checks/s':>13} {'statuses/s':>11}")
+    for label, create_board in (("list", tictactoe.create_board), ("bitboard", tictactoe.create_bitboard)):
+        start = time.perf_counter()
+        for _ in range(n_games):
+            board = create_board()
+            for i, (col, row) in enumerate(DRAW_MOVES):
+                marker = 'X' if i % 2 == 0 else 'O'
+                tictactoe.put_marker(board, row, col, marker)
+                tictactoe.player_wins(marker, board)
+                tictactoe.players_draw(board)
+                tictactoe.get_board_status(board)
+        moves_rate = n_games * len(DRAW_MOVES) / (time.perf_counter() - start)
+        n_checks = n_games * len(DRAW_MOVES)
+        start = time.perf_counter()
+        for _ in range(n_checks // 2):
+            tictactoe.player_wins('X', board)
+            tictactoe.player_wins('O', board)
+        checks_rate = n_checks / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(n_checks):
+            tictactoe.get_board_status(board)
+        statuses_rate = n_checks / (time.perf_counter() - start)
+        print(f"{label:>8} {moves_rate:10.0f} {checks_rate:13.0f} {statuses_rate:11.0f}")
+
+
+def bench_bot(args: list[str]) -> None:
+    '''
+    measure how long the bot takes to load its table, to move on every reachable 3x3 position and to move on a larger board
+    usage: bot [size] [win length] [time budget]
+    '''
+    import bot
+    import tictactoe
+    size = int(args[0]) if len(args) > 0 else 15
+    win_length = int(args[1]) if len(args) > 1 else 5
+    time_budget = float(args[2]) if len(args) > 2 else bot.TIME_BUDGET
+    start = time.perf_counter()
+    bot.load_table()
+    print(f"loaded {len(bot.solved_moves)} positions in {(time.perf_counter() - start) * 1000:.2f} ms")
+    boards = [tictactoe.BitBoard(bits) for bits in bot.solved_moves]
+    rounds = 20
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for board in boards:
+            bot.choose_move(board, 'X')
+    print(f"3x3: {(time.perf_counter() - start) / (rounds * len(boards)) * 1e6:.2f} us/move")
+    board = tictactoe.create_gridboard(size, win_length)
+    marker = 'X'
+    latencies = []
+    while len(latencies) < 20 and not tictactoe.players_draw(board):
+        start = time.perf_counter()
+        row, col = bot.choose_move(board, marker, time_budget)
+        latencies.append((time.perf_counter() - start) * 1000)
+        tictactoe.put_marker(board, row, col, marker)
+        if tictactoe.player_wins(marker, board):
+            break
+        marker = 'O' if marker == 'X' else 'X'
+    print(f"{size}x{size}, {win_length} in a row: {len(latencies)} moves, p50 {percentile(latencies, 0.5):.1f} ms, max {max(latencies):.1f} ms")
+
+
+def bench_room_list(args: list[str]) -> None:
+    '''
+    compare building the VIEWER room list on every request with the RoomRegistry's cached response
+    usage: roomlist [n_rooms] [n_requests]
+    '''
+    import rooms
+    n_rooms = int(args[0]) if len(args) > 0 else 256
+    n_requests = int(args[1]) if len(args) > 1 else 100000
+    registry = rooms.RoomRegistry()
+    for i in range(n_rooms):
+        registry.add(f"room{i}", None)
+        if i % 2:
+            registry.fill(f"room{i}")
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        f"ROOMLIST:ACKSTATUS:0:{','.join(list(registry.pending.keys()) + list(registry.full.keys()))}\n".encode()
+    rebuilt = n_requests / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        registry.room_list("VIEWER")
+    cached = n_requests / (time.perf_counter() - start)
+    print(f"{n_rooms} rooms: rebuilt {rebuilt:.0f} lists/s, cached {cached:.0f} lists/s")
+
+
+def bench_room_pages(args: list[str]) -> None:
+    '''
+    measure the size and latency of paged ROOMLIST responses as the number of rooms grows
+    usage: roompages [n_requests] [page size]
+    '''
+    import random
+    import rooms
+    n_requests = int(args[0]) if len(args) > 0 else 20000
+    page_size = int(args[1]) if len(args) > 1 else rooms.PAGE_LIMIT
+    for n_rooms in (1000, 10000, 100000, server.ROOMS_LIMIT):
+        registry = rooms.RoomRegistry()
+        start = time.perf_counter()
+        for i in random.sample(range(n_rooms), n_rooms):
+            registry.add(f"room{i}", None)
+        add_time = (time.perf_counter() - start) / n_rooms
+        requests = [
+            ["ROOMLIST", "PLAYER", str(random.randrange(n_rooms)), str(page_size)] + ([f"room{random.randrange(100)}"] if i % 2 else [])
+            for i in range(n_requests)
+        ]
+        total_size = 0
+        start = time.perf_counter()
+        for request in requests:
+            total_size += len(server.roomlist_response(registry, request))
+        elapsed = time.perf_counter() - start
+        print(f"{n_rooms} rooms: {elapsed / n_requests * 1e6:.1f} us and {total_size / n_requests:.0f} bytes per page, {add_time * 1e6:.1f} us per CREATE")
+
+
+def bench_timers(args: list[str]) -> None:
+    '''
+    measure the cost of the idle timers as the number of connections grows: scheduling a timer, advancing the wheel
+    by a tick in which none fire, and firing a timer (including moving it down the levels), compared with scanning
+    every connection's deadline once per tick
+    usage: timers [n_idle_ticks]
+    '''
+    import random
+    import timers
+    n_idle_ticks = int(args[0]) if args else 600
+    tick = 0.1
+    idle_time = n_idle_ticks * tick
+    print(f"{'timers':>8} {'schedule (us)':>14} {'idle tick (us)':>15} {'fire (us)':>10} {'scan (us)':>10}")
+    for n_timers in (1000, 10000, 100000):
+        wheel = timers.TimerWheel(tick, 0.0)
+        fired = []
+        deadlines = [random.uniform(idle_time + tick, idle_time + 600) for _ in range(n_timers)]
+        start = time.perf_counter()
+        for deadline in deadlines:
+            wheel.schedule(deadline, fired.append, deadline)
+        schedule_time = (time.perf_counter() - start) / n_timers
+        start = time.perf_counter()
+        for i in range(1, n_idle_ticks + 1):
+            wheel.advance(i * tick)
+        idle_tick_time = (time.perf_counter() - start) / n_idle_ticks
+        assert not fired
+        start = time.perf_counter()
+        now = idle_time
+        while wheel:
+            now += tick
+            wheel.advance(now)
+        fire_time = (time.perf_counter() - start) / len(fired)
+        start = time.perf_counter()
+        for deadline in deadlines:
+            if deadline <= now:
+                pass
+        scan_time = time.perf_counter() - start
+        print(f"{n_timers:>8} {schedule_time * 1e6:14.2f} {idle_tick_time * 1e6:15.2f} {fire_time * 1e6:10.2f} {scan_time * 1e6:10.0f}")
+
+def server_cpu_time(pid: int) -> float | None:
+    '''
+    return the CPU seconds used by the process <pid> so far, None where /proc is not available
+    '''
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_spectators(args: list[str]) -> None:
+    '''
+    compare the bytes sent to the viewers of a room with many viewers, and the server's CPU time,
+    between text lines and binary frames
+    usage: spectators [n_viewers] [n_games] [port]
+    '''
+    n_viewers = int(args[0]) if len(args) > 0 else 1000
+    n_games = int(args[1]) if len(args) > 1 else 20
+    port = int(args[2]) if len(args) > 2 else 52993
+    server.raise_file_limit()
+    users = bench_users(n_viewers + 2)
+    print(f"{n_viewers} viewers, {n_games} games of {len(DRAW_MOVES)} moves, the viewers joining every game:")
+    print(f"{'mode':>8} {'viewer bytes/move':>18} {'server CPU/move (us)':>21} {'time/move (ms)':>15}")
+    for mode in (wire.TEXT, wire.BINARY):
+        process, _ = launch_server(port, users)
+        try:
+            player1 = BenchClient(port)
+            player2 = BenchClient(port)
+            viewers = [BenchClient(port) for _ in range(n_viewers)]
+            for i, bench_client in enumerate([player1, player2] + viewers):
+                if mode == wire.BINARY:
+                    bench_client.hello()
+                bench_client.send(f"LOGIN:user{i}:password")
+            for bench_client in [player1, player2] + viewers:
+                bench_client.receive()
+            for viewer in viewers:
+                viewer.received_bytes = 0
+            cpu_start = server_cpu_time(process.pid)
+            start = time.perf_counter()
+            for game in range(n_games):
+                start_game(player1, player2, f"spectators{game}")
+                for viewer in viewers:
+                    viewer.send(f"JOIN:spectators{game}:VIEWER")
+                for viewer in viewers:
+                    # JOIN:ACKSTATUS, INPROGRESS and SNAPSHOT
+                    for _ in range(3):
+                        viewer.receive()
+                for i, (col, row) in enumerate(DRAW_MOVES):
+                    mover, other = (player1, player2) if i % 2 == 0 else (player2, player1)
+                    mover.send(f"PLACE:{col}:{row}")
+                    mover.receive()
+                    other.receive()
+                    for viewer in viewers:
+                        viewer.receive()
+            elapsed = time.perf_counter() - start
+            cpu_end = server_cpu_time(process.pid)
+            n_moves = n_games * len(DRAW_MOVES)
+            viewer_bytes = sum(viewer.received_bytes for viewer in viewers) / n_moves
+            cpu_column = f"{(cpu_end - cpu_start) / n_moves * 1e6:21.0f}" if cpu_start is not None else f"{'-':>21}"
+            print(f"{mode:>8} {viewer_bytes:18.0f} {cpu_column} {elapsed / n_moves * 1000:15.2f}")
+            for bench_client in [player1, player2] + viewers:
+                bench_client.close()
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def bench_deltas(args: list[str]) -> None:
+    '''
+    compare the bytes sent to the viewers of a room with many viewers, and the server's CPU time, between a BOARDSTATUS
+    after every move and MOVE deltas, as text lines and binary frames
+    usage: deltas [n_viewers] [n_games] [board size] [port]
+    '''
+    n_viewers = int(args[0]) if len(args) > 0 else 500
+    n_games = int(args[1]) if len(args) > 1 else 5
+    board_size = int(args[2]) if len(args) > 2 else 15
+    port = int(args[3]) if len(args) > 3 else 52994
+    if board_size == 3:
+        moves = DRAW_MOVES
+        create_message = "CREATE:deltas{game}"
+    elif 5 <= board_size <= 19:
+        # the first 4 rows, alternating markers, have no 5 in a row
+        moves = [(i % board_size, i // board_size) for i in range(4 * board_size)]
+        create_message = f"CREATE:deltas{{game}}:{board_size}:5"
+    else:
+        sys.stderr.write("Error: Expecting a board size of 3 or 5 to 19\n")
+        sys.exit(1)
+    server.raise_file_limit()
+    users = bench_users(n_viewers + 2)
+    print(f"{n_viewers} viewers, {n_games} games of {len(moves)} moves on a {board_size}x{board_size} board:")
+    print(f"{'mode':>18} {'viewer bytes/move':>18} {'server CPU/move (us)':>21} {'time/move (ms)':>15}")
+    for label, mode, deltas in (("BOARDSTATUS text", None, False), ("MOVE text", wire.TEXT, True), ("MOVE binary", wire.BINARY, True)):
+        process, _ = launch_server(port, users, {"coalesceWindow": 0})
+        try:
+            player1 = BenchClient(port)
+            player2 = BenchClient(port)
+            viewers = [BenchClient(port) for _ in range(n_viewers)]
+            for i, bench_client in enumerate([player1, player2] + viewers):
+                if mode is not None:
+                    bench_client.hello(mode, deltas)
+                bench_client.send(f"LOGIN:user{i}:password")
+            for bench_client in [player1, player2] + viewers:
+                bench_client.receive()
+            viewer_bytes = 0
+            cpu_time = 0.0
+            elapsed = 0.0
+            for game in range(n_games):
+                room_message = create_message.format(game=game)
+                player1.request(room_message)
+                player2.request(f"JOIN:{room_message.split(':')[1]}:PLAYER")
+                player1.receive()
+                player2.receive()
+                for viewer in viewers:
+                    viewer.send(f"JOIN:deltas{game}:VIEWER")
+                for viewer in viewers:
+                    # JOIN:ACKSTATUS, INPROGRESS and SNAPSHOT
+                    for _ in range(3):
+                        viewer.receive()
+                    viewer.received_bytes = 0
+                cpu_start = server_cpu_time(process.pid)
+                start = time.perf_counter()
+                for i, (col, row) in enumerate(moves):
+                    mover, other = (player1, player2) if i % 2 == 0 else (player2, player1)
+                    mover.send(f"PLACE:{col}:{row}")
+                    mover.receive()
+                    other.receive()
+                    for viewer in viewers:
+                        viewer.receive()
+                elapsed += time.perf_counter() - start
+                if cpu_start is not None:
+                    cpu_time += server_cpu_time(process.pid) - cpu_start
+                viewer_bytes += sum(viewer.received_bytes for viewer in viewers)
+                if board_size != 3:
+                    mover.send("FORFEIT")
+                    for bench_client in [player1, player2] + viewers:
+                        bench_client.receive()
+            n_moves = n_games * len(moves)
+            cpu_column = f"{cpu_time / n_moves * 1e6:21.0f}" if cpu_start is not None else f"{'-':>21}"
+            print(f"{label:>18} {viewer_bytes / n_moves:18.0f} {cpu_column} {elapsed / n_moves * 1000:15.2f}")
+            for bench_client in [player1, player2] + viewers:
+                bench_client.close()
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def bench_joins(args: list[str]) -> None:
+    '''
+    time viewers joining a game on the largest board after more and more moves, from sending JOIN
+    until the SNAPSHOT of the board is received, to show the cost of a join does not grow with the game
+    usage: joins [n_viewers] [port]
+    '''
+    n_viewers = int(args[0]) if len(args) > 0 else 200
+    port = int(args[1]) if len(args) > 1 else 52994
+    board_size = tictactoe.MAX_BOARD_SIZE
+    checkpoints = [0, 100, 200, 300]
+    server.raise_file_limit()
+    process, _ = launch_server(port, bench_users(2 + n_viewers * len(checkpoints)))
+    try:
+        player1 = BenchClient(port)
+        player2 = BenchClient(port)
+        player1.request("LOGIN:user0:password")
+        player2.request("LOGIN:user1:password")
+        # move i places a marker on cell i, which completes no line of 19 before the antidiagonal at cell 342
+        player1.request(f"CREATE:joins:{board_size}:{board_size}")
+        player2.request("JOIN:joins:PLAYER")
+        player1.receive()
+        player2.receive()
+        print(f"{n_viewers} viewers joining a {board_size}x{board_size} game one at a time:")
+        print(f"{'moves played':>13} {'p50 join (ms)':>14} {'p99 join (ms)':>14} {'server CPU/join (us)':>21} {'bytes/join':>11}")
+        n_moves = 0
+        for checkpoint_index, checkpoint in enumerate(checkpoints):
+            while n_moves < checkpoint:
+                mover, other = (player1, player2) if n_moves % 2 == 0 else (player2, player1)
+                row, col = divmod(n_moves, board_size)
+                mover.send(f"PLACE:{col}:{row}")
+                mover.receive()
+                other.receive()
+                n_moves += 1
+            viewers = [BenchClient(port) for _ in range(n_viewers)]
+            for i, viewer in enumerate(viewers):
+                viewer.request(f"LOGIN:user{2 + checkpoint_index * n_viewers + i}:password")
+                viewer.received_bytes = 0
+            latencies = []
+            cpu_start = server_cpu_time(process.pid)
+            for viewer in viewers:
+                start = time.perf_counter()
+                viewer.send("JOIN:joins:VIEWER")
+                # JOIN:ACKSTATUS, INPROGRESS and SNAPSHOT
+                for _ in range(3):
+                    viewer.receive()
+                latencies.append((time.perf_counter() - start) * 1000)
+            cpu_end = server_cpu_time(process.pid)
+            cpu_column = f"{(cpu_end - cpu_start) / n_viewers * 1e6:21.0f}" if cpu_start is not None else f"{'-':>21}"
+            bytes_per_join = sum(viewer.received_bytes for viewer in viewers) / n_viewers
+            print(f"{n_moves:>13} {percentile(latencies, 0.5):14.3f} {percentile(latencies, 0.99):14.3f} {cpu_column} {bytes_per_join:11.0f}")
+            for viewer in viewers:
+                viewer.close()
+        player1.close()
+        player2.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bench_history(args: list[str]) -> None:
+    '''
+    measure the cost of appending finished games to the game log on the event loop, how many games a second
+    the writing thread makes durable and how long loading the log takes, then the move latency of a server
+    with and without a game log
+    usage: history [n_games] [n_moves] [port]
+    '''
+    import shutil
+    import history
+    n_games = int(args[0]) if len(args) > 0 else 100000
+    n_moves = int(args[1]) if len(args) > 1 else 2000
+    port = int(args[2]) if len(args) > 2 else 52995
+    directory = tempfile.mkdtemp(prefix="tictactoe-bench-")
+    try:
+        log_path = os.path.join(directory, "games.log")
+        game_log = history.GameLog(log_path)
+        moves = [(col, row, "X" if i % 2 == 0 else "O") for i, (col, row) in enumerate(DRAW_MOVES)]
+        start = time.perf_counter()
+        for i in range(n_games):
+            game_log.append(history.Game(f"room{i % 1000}", f"user{i % 997}", f"user{i % 991 + 997}", 3, 3, moves, 0.0, 0.0, 1, history.NO_WINNER))
+        appended = time.perf_counter()
+        game_log.close()
+        written = time.perf_counter()
+        print(f"{n_games} games of {len(moves)} moves: {(appended - start) / n_games * 1e6:.2f} us/append on the loop, "
+              f"{n_games / (written - start):.0f} games/s written, {os.path.getsize(log_path) / n_games:.0f} bytes/game")
+        start = time.perf_counter()
+        game_log = history.GameLog(log_path)
+        print(f"loaded and indexed {len(game_log)} games in {(time.perf_counter() - start) * 1000:.0f} ms")
+        game_log.close()
+        print(f"{'game log':>9} {'p50 move (ms)':>14} {'p99 move (ms)':>14} {'server CPU/move (us)':>21}")
+        for label, extra_config in (("off", None), ("on", {"gameHistory": os.path.join(directory, "server_games.log")})):
+            process, _ = launch_server(port, bench_users(2), extra_config)
+            try:
+                player1 = BenchClient(port)
+                player2 = BenchClient(port)
+                player1.request("LOGIN:user0:password")
+                player2.request("LOGIN:user1:password")
+                cpu_start = server_cpu_time(process.pid)
+                latencies = play_moves(player1, player2, n_moves)
+                cpu_end = server_cpu_time(process.pid)
+                cpu_column = f"{(cpu_end - cpu_start) / n_moves * 1e6:21.0f}" if cpu_start is not None else f"{'-':>21}"
+                print(f"{label:>9} {percentile(latencies, 0.5):14.3f} {percentile(latencies, 0.99):14.3f} {cpu_column}")
+                player1.close()
+                player2.close()
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_leaderboard(args: list[str]) -> None:
+    '''
+    measure the cost of rating a game, finding the rank of a player and listing a page of the leaderboard
+    as the number of rated players grows tenfold, the ranking keeps each of them O(log n)
+    usage: leaderboard [max players] [n_operations]
+    '''
+    import random
+    import shutil
+    import ratings
+    max_players = int(args[0]) if len(args) > 0 else 1000000
+    n_operations = int(args[1]) if len(args) > 1 else 20000
+    rng = random.Random(0)
+    print(f"{'players':>9} {'load (s)':>9} {'us/game':>8} {'us/rank':>8} {'us/top 10':>10}")
+    n_players = 10000
+    while n_players <= max_players:
+        directory = tempfile.mkdtemp(prefix="tictactoe-bench-")
+        try:
+            player_ratings = ratings.Ratings(os.path.join(directory, "ratings.log"))
+            usernames = [f"user{i}" for i in range(n_players)]
+            start = time.perf_counter()
+            # every player is rated once before timing
+            for i in range(0, n_players - 1, 2):
+                player_ratings.record_game(usernames[i], usernames[i + 1], rng.choice((0.0, 0.5, 1.0)))
+            load_time = time.perf_counter() - start
+            pairs = [rng.sample(usernames, 2) for _ in range(n_operations)]
+            start = time.perf_counter()
+            for p1_username, p2_username in pairs:
+                player_ratings.record_game(p1_username, p2_username, rng.choice((0.0, 0.5, 1.0)))
+            game_time = (time.perf_counter() - start) / n_operations
+            start = time.perf_counter()
+            for p1_username, _ in pairs:
+                player_ratings.rank(p1_username)
+            rank_time = (time.perf_counter() - start) / n_operations
+            offsets = [rng.randrange(n_players) for _ in range(n_operations)]
+            start = time.perf_counter()
+            for offset in offsets:
+                player_ratings.top(offset, 10)
+            top_time = (time.perf_counter() - start) / n_operations
+            player_ratings.close()
+            print(f"{n_players:>9} {load_time:9.2f} {game_time * 1e6:8.2f} {rank_time * 1e6:8.2f} {top_time * 1e6:10.2f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        n_players *= 10
+
+
+BENCHMARKS = {
+    "eventloop": bench_event_loop,
+    "loginstorm": bench_login_storm,
+    "registrations": bench_registrations,
+    "userload": bench_user_loading,
+    "servers": bench_servers,
+    "dispatch": bench_dispatch,
+    "fanout": bench_fanout,
+    "board": bench_board,
+    "bot": bench_bot,
+    "roomlist": bench_room_list,
+    "roompages": bench_room_pages,
+    "timers": bench_timers,
+    "spectators": bench_spectators,
+    "deltas": bench_deltas,
+    "joins": bench_joins,
+    "history": bench_history,
+    "leaderboard": bench_leaderboard,
+}
+
+
+def main(args: list[str]) -> None:
+    if len(args) < 1 or args[0] not in BENCHMARKS:
+        sys.stderr.write(f"Error: Expecting a benchmark name: {', '.join(BENCHMARKS)}\n")
+        sys.exit(1)
+    BENCHMARKS[args[0]](args[1:])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,332 @@
+import os
+import sys
+import time
+import array
+import logging
+import tictactoe
+
+
+BOT_USERNAME: str = "computer" # the username the bot plays under
+TABLE_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_table.bin") # the solved 3x3 positions, generated on first use
+TABLE_MAGIC: bytes = b"TTTBOT01"
+TIME_BUDGET: float = 0.5 # the seconds a move on a larger board may be searched for
+BEAM_WIDTH: int = 12 # the most candidate moves searched at each node on a larger board
+NEIGHBOURHOOD: int = 2 # only empty cells within this distance of a marker are candidate moves on a larger board
+WIN_SCORE: int = 1 << 40
+EMPTY_DIGIT: int = ord("0")
+
+solved_moves: dict[int, int] = {} # [BitBoard bits, cell] : the best move of every reachable 3x3 position, see load_table()
+logger: logging.Logger = logging.getLogger("bot")
+
+
+class SearchTimeout(Exception):
+    '''
+    raised inside the search of a larger board when its time budget runs out
+    '''
+
+
+def solve_positions() -> dict[int, int]:
+    '''
+    solve 3x3 tic tac toe and return the best move (cell 3*row + col) of every reachable position that is not over,
+    keyed by the BitBoard bits of the position
+    a quicker win and a slower loss are preferred
+    '''
+    moves = {}
+    values = {}
+
+    def negamax(bits: int) -> int:
+        if bits in values:
+            return values[bits]
+        x_mask = bits & tictactoe.CELLS_MASK
+        o_mask = bits >> tictactoe.N_CELLS
+        # X moves whenever both players have placed the same number of markers
+        shift = 0 if x_mask.bit_count() == o_mask.bit_count() else tictactoe.N_CELLS
+        filled = x_mask | o_mask
+        n_filled = filled.bit_count() + 1
+        best_value = best_cell = None
+        for cell in range(tictactoe.N_CELLS):
+            if filled >> cell & 1:
+                continue
+            child = bits | 1 << (shift + cell)
+            if tictactoe.WINNING_MASKS[child >> shift & tictactoe.CELLS_MASK]:
+                value = tictactoe.N_CELLS + 1 - n_filled
+            elif n_filled == tictactoe.N_CELLS:
+                value = 0
+            else:
+                value = -negamax(child)
+            if best_value is None or value > best_value:
+                best_value, best_cell = value, cell
+        values[bits] = best_value
+        moves[bits] = best_cell
+        return best_value
+
+    negamax(0)
+    return moves
+
+
+def write_table(path: str, moves: dict[int, int]) -> None:
+    '''
+    atomically write <moves> to <path>, every position is one 32-bit entry: its bits shifted left by 4, or'ed with its move
+    '''
+    entries = array.array("I", sorted(bits << 4 | cell for bits, cell in moves.items()))
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(TABLE_MAGIC)
+        entries.tofile(f)
+    os.replace(temporary_path, path)
+
+
+def read_table(path: str) -> dict[int, int] | None:
+    '''
+    return the moves stored in the table at <path>, or None if it is missing or unreadable
+    '''
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(TABLE_MAGIC)) != TABLE_MAGIC:
+                return None
+            entries = array.array("I")
+            entries.frombytes(f.read())
+    except (OSError, ValueError):
+        return None
+    return {entry >> 4: entry & 0xF for entry in entries}
+
+
+def load_table(path: str = TABLE_PATH) -> None:
+    '''
+    load the solved 3x3 positions into <solved_moves>, solving and writing them to <path> the first time
+    '''
+    global solved_moves
+    moves = read_table(path)
+    if moves is None:
+        moves = solve_positions()
+        try:
+            write_table(path, moves)
+        except OSError as e:
+            # the table only saves solving it again on the next start
+            logger.warning("error writing bot table: %s", e)
+    solved_moves = moves
+
+
+def choose_move(board: tictactoe.BitBoard | tictactoe.GridBoard, marker: str, time_budget: float = TIME_BUDGET) -> tuple[int, int]:
+    '''
+    return the (row, col) the bot places <marker> at on <board>, which must have an empty cell
+    a 3x3 move is looked up in the solved table, a move on a larger board is searched for up to <time_budget> seconds
+    '''
+    if isinstance(board, tictactoe.GridBoard):
+        return divmod(search_move(board, marker, time_budget), board.size)
+    if not solved_moves:
+        load_table()
+    cell = solved_moves.get(board.bits)
+    if cell is None:
+        # not reachable by alternating moves, take the first empty cell
+        filled = (board.bits | board.bits >> tictactoe.N_CELLS) & tictactoe.CELLS_MASK
+        cell = next(cell for cell in range(tictactoe.N_CELLS) if not filled >> cell & 1)
+    return divmod(cell, tictactoe.BOARD_SIZE)
+
+
+def run_length(cells: bytearray, size: int, win_length: int, cell: int, digit: int, d_row: int, d_col: int) -> tuple[int, int]:
+    '''
+    return the length of the unbroken line of <digit> markers a marker at <cell> would be part of in the direction
+    (<d_row>,<d_col>), capped at <win_length>, and how many ends of that line are empty
+    '''
+    row, col = divmod(cell, size)
+    length = 1
+    open_ends = 0
+    for sign in (1, -1):
+        r = row + sign * d_row
+        c = col + sign * d_col
+        while length < win_length and 0 <= r < size and 0 <= c < size and cells[r * size + c] == digit:
+            length += 1
+            r += sign * d_row
+            c += sign * d_col
+        if 0 <= r < size and 0 <= c < size and cells[r * size + c] == EMPTY_DIGIT:
+            open_ends += 1
+    return length, open_ends
+
+
+def move_value(cells: bytearray, size: int, win_length: int, cell: int, digit: int) -> int:
+    '''
+    return how much a <digit> marker at the empty <cell> is worth to its player: WIN_SCORE if it completes a line,
+    otherwise more for longer lines through it with more empty ends
+    '''
+    value = 0
+    for d_row, d_col in tictactoe.LINE_DIRECTIONS:
+        length, open_ends = run_length(cells, size, win_length, cell, digit, d_row, d_col)
+        if length >= win_length:
+            return WIN_SCORE
+        value += 10 ** length * open_ends
+    return value
+
+
+def neighbours(cells: bytearray, size: int, cell: int) -> set[int]:
+    '''
+    return the empty cells within NEIGHBOURHOOD of <cell>
+    '''
+    row, col = divmod(cell, size)
+    return {
+        r * size + c
+        for r in range(max(0, row - NEIGHBOURHOOD), min(size, row + NEIGHBOURHOOD + 1))
+        for c in range(max(0, col - NEIGHBOURHOOD), min(size, col + NEIGHBOURHOOD + 1))
+        if cells[r * size + c] == EMPTY_DIGIT
+    }
+
+
+def search_move(board: tictactoe.GridBoard, marker: str, time_budget: float) -> int:
+    '''
+    return the cell the bot places <marker> at on a larger board, found by iterative-deepening alpha-beta search
+    over the most promising candidate moves, deepening until <time_budget> seconds have passed
+    '''
+    deadline = time.perf_counter() + time_budget
+    size = board.size
+    win_length = board.win_length
+    cells = bytearray(board.cells)
+    digit = tictactoe.MARKER_DIGITS[marker]
+    other = tictactoe.MARKER_DIGITS['O' if marker == 'X' else 'X']
+    candidates = set()
+    for cell, value in enumerate(cells):
+        if value != EMPTY_DIGIT:
+            candidates |= neighbours(cells, size, cell)
+    if not candidates:
+        empty = [cell for cell, value in enumerate(cells) if value == EMPTY_DIGIT]
+        centre = (size // 2) * size + size // 2
+        return centre if centre in empty else empty[0]
+
+    def ordered(candidates: set[int], digit: int, other: int) -> list[tuple[int, int, int]]:
+        # (gain, attack, cell) of the BEAM_WIDTH moves that build the longest lines or block the opponent's
+        moves = []
+        for cell in candidates:
+            attack = move_value(cells, size, win_length, cell, digit)
+            moves.append((attack + move_value(cells, size, win_length, cell, other), attack, cell))
+        moves.sort(reverse=True)
+        return moves[:BEAM_WIDTH]
+
+    def negamax(depth: int, alpha: int, beta: int, digit: int, other: int, candidates: set[int], score: int) -> int:
+        if time.perf_counter() > deadline:
+            raise SearchTimeout
+        if not candidates:
+            return score
+        best = -WIN_SCORE * 2
+        for gain, attack, cell in ordered(candidates, digit, other):
+            if attack >= WIN_SCORE:
+                # a quicker win scores higher
+                return WIN_SCORE + depth
+            if depth == 1:
+                value = score + gain
+            else:
+                cells[cell] = digit
+                child_candidates = (candidates | neighbours(cells, size, cell)) - {cell}
+                value = -negamax(depth - 1, -beta, -alpha, other, digit, child_candidates, -(score + gain))
+                cells[cell] = EMPTY_DIGIT
+            best = max(best, value)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return best
+
+    root_moves = ordered(candidates, digit, other)
+    for _, attack, cell in root_moves:
+        if attack >= WIN_SCORE:
+            return cell
+    for cell in candidates:
+        if move_value(cells, size, win_length, cell, other) >= WIN_SCORE:
+            # the opponent completes a line there next
+            return cell
+    best_cell = root_moves[0][2]
+    n_empty = cells.count(EMPTY_DIGIT)
+    depth = 1
+    while depth <= n_empty:
+        try:
+            depth_best_value = -WIN_SCORE * 2
+            depth_best_cell = best_cell
+            # search the best move of the previous depth first so that it is pruned against
+            for gain, _, cell in sorted(root_moves, key=lambda move: move[2] != best_cell):
+                if depth == 1:
+                    value = gain
+                else:
+                    cells[cell] = digit
+                    child_candidates = (candidates | neighbours(cells, size, cell)) - {cell}
+                    value = -negamax(depth - 1, -WIN_SCORE * 2, -depth_best_value, other, digit, child_candidates, -gain)
+                    cells[cell] = EMPTY_DIGIT
+                if value > depth_best_value:
+                    depth_best_value, depth_best_cell = value, cell
+        except SearchTimeout:
+            break
+        best_cell = depth_best_cell
+        if depth_best_value >= WIN_SCORE:
+            break
+        depth += 1
+    return best_cell
+
+
+def copy_board(board: tictactoe.BitBoard | tictactoe.GridBoard) -> tictactoe.BitBoard | tictactoe.GridBoard:
+    '''
+    return a copy of <board> that a search in another thread can read while the game goes on
+    '''
+    if isinstance(board, tictactoe.BitBoard):
+        return tictactoe.BitBoard(board.bits)
+    copy = tictactoe.GridBoard(board.size, board.win_length)
+    copy.cells[:] = board.cells
+    copy.n_filled = board.n_filled
+    copy.winner = board.winner
+    return copy
+
+
+def play(size: int, win_length: int) -> None:
+    '''
+    play a game against the bot at the terminal, the human is X and moves first
+    '''
+    board = tictactoe.create_game_board(size, win_length)
+    tictactoe.print_board(board)
+    player = 'X'
+    while True:
+        if player == 'X':
+            try:
+                row = int(input("Row: "))
+                col = int(input("Col: "))
+            except EOFError:
+                return
+            except ValueError as e:
+                print(f"caught exception {e}")
+                continue
+            size = tictactoe.get_board_size(board)
+            if row < 0 or row >= size or col < 0 or col >= size:
+                print(f"Invalid position ({row},{col}). Row/Column must be an integer between 0 and {size - 1}")
+                continue
+            if tictactoe.get_marker(board, row, col) != ' ':
+                print(f"({row},{col}) is occupied by {tictactoe.get_marker(board, row, col)}")
+                continue
+            tictactoe.put_marker(board, row, col, player)
+        else:
+            row, col = choose_move(board, player)
+            tictactoe.put_marker(board, row, col, player)
+            print(f"{BOT_USERNAME} placed at ({row},{col})")
+        tictactoe.print_board(board)
+        if tictactoe.player_wins(player, board):
+            print(f"{player} wins the game!")
+            return
+        if tictactoe.players_draw(board):
+            print("The game draws!")
+            return
+        player = 'X' if player == 'O' else 'O'
+
+
+def main(args: list[str]) -> None:
+    '''
+    generate: solve 3x3 tic tac toe and write the table
+    play [size] [win length]: play against the bot
+    '''
+    if args[:1] == ["generate"]:
+        start = time.perf_counter()
+        moves = solve_positions()
+        write_table(TABLE_PATH, moves)
+        print(f"solved {len(moves)} positions in {time.perf_counter() - start:.2f}s, wrote {os.path.getsize(TABLE_PATH)} bytes to {TABLE_PATH}")
+    elif args[:1] == ["play"]:
+        size = int(args[1]) if len(args) > 1 else tictactoe.BOARD_SIZE
+        play(size, int(args[2]) if len(args) > 2 else size)
+    else:
+        sys.stderr.write("Error: Expecting generate or play [size] [win length]\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,21 +1,29 @@
 import sys
+import time
 import socket
 import threading
 import tictactoe
+import protocol
+import wire
 
 
 client_socket: socket.socket = None
 server_address: tuple = ()
 most_recent_message: str = ""
 user_username: str = ""
+next_roomlist_message: str = "" # the ROOMLIST message asking for the next page of the last room list, empty if it was the last page
+message_handlers: protocol.Dispatcher = protocol.Dispatcher() # the handler of each message received from the server
+binary: bool = False # whether the connection switched to binary frames, see wire.py
+frame_names: dict[int, str] = {} # [name_id, username] : the usernames of the name ids the server sent NAME frames of
 
 
 def launch_check(args: list[str]) -> None:
     '''
     launch the client program and perform necessary checks
     '''
-    if len(args) != 2:
-        sys.stderr.write("Error: Expecting 2 arguments: <server address> <port>\n")
+    options = args[2:]
+    if len(args) < 2 or any(option not in (wire.BINARY, wire.DELTA) for option in options) or len(set(options)) != len(options):
+        sys.stderr.write(f"Error: Expecting 2 to 4 arguments: <server address> <port> [{wire.BINARY}] [{wire.DELTA}]\n")
         sys.exit(1)
     global client_socket, server_address
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -26,6 +34,30 @@ def launch_check(args: list[str]) -> None:
     except:
         sys.stderr.write("Error: cannot connect to server at <server address> and <port>.\n")
         sys.exit(1)
+    if options:
+        hello(wire.BINARY if wire.BINARY in options else wire.TEXT, wire.DELTA in options)
+
+
+def hello(mode: str, deltas: bool) -> None:
+    '''
+    ask the server to switch the connection to <mode>, and to send MOVE deltas if <deltas>, and wait for the acknowledgement
+    '''
+    global binary
+    client_socket.sendall((f"HELLO:{mode}:{wire.DELTA}\n" if deltas else f"HELLO:{mode}\n").encode())
+    received = b""
+    try:
+        while b"\n" not in received:
+            data = client_socket.recv(protocol.RECV_SIZE)
+            if not data:
+                break
+            received += data
+    except OSError:
+        pass
+    # the server sends nothing else before the next request, so nothing follows the acknowledgement
+    if received.split(b"\n", 1)[0] != b"HELLO:ACKSTATUS:0":
+        sys.stderr.write(f"Error: the server does not support {mode} mode{' with deltas' if deltas else ''}.\n")
+        sys.exit(1)
+    binary = mode == wire.BINARY
 
 
 in_room: bool = False
@@ -54,63 +86,77 @@ def prompt_message() -> None:
                     message = prompt_register_protocol()
                 elif message == "ROOMLIST":
                     message = prompt_roomlist_protocol()
+                elif message == "MORE":
+                    if not next_roomlist_message:
+                        print("There are no more rooms to list.")
+                        continue
+                    message = next_roomlist_message
                 elif message == "CREATE":
                     message = prompt_create_protocol()
                 elif message == "JOIN":
                     message = prompt_join_protocol()
+                elif message == "HISTORY":
+                    message = prompt_history_protocol()
+                elif message == "REPLAY":
+                    message = prompt_replay_protocol()
+                elif message == "LEADERBOARD":
+                    message = prompt_leaderboard_protocol()
                 else:
                     print(f"Unknown command: {message}")
             elif in_room:
                 if not game_begun:
-                    continue
-                if message == "PLACE":
+                    if message != "ADDBOT":
+                        continue
+                    message = prompt_addbot_protocol()
+                elif message == "PLACE":
                     message = prompt_place_protocol()
                 elif message == "FORFEIT":
                     message = prompt_forfeit_protocol()
                 else:
                     print(f"Unknown command: {message}")
             most_recent_message = message
-            client_socket.sendall(f"{message}\n".encode())
+            if binary:
+                client_socket.sendall(wire.frame(wire.encode_request(message.split(":"))))
+            else:
+                client_socket.sendall(f"{message}\n".encode())
 
 
 def receive_data() -> None:
     '''
     process received messages from server according to protocols
     '''
+    reader = protocol.FrameBuffer() if binary else protocol.LineBuffer()
     while True:
         try:
-            data_list = client_socket.recv(8192)
-            if not data_list:
+            received = client_socket.recv(protocol.RECV_SIZE)
+            if not received:
                 print("no data received")
                 sys.exit(0)
+            data_list = reader.feed(received)
+        except protocol.LineTooLong:
+            print("error receiving data: message from server is too long")
+            sys.exit(1)
         except Exception as e:
             print(f"error receiving data: {e}")
             sys.exit(1)
-        data_list = data_list.decode()
-        print(f"received from {server_address}: {data_list}")
-        for data in data_list.split("\n"):
-            if data.split(":")[0] == "LOGIN":
-                receive_login_protocol(data)
-            elif data.split(":")[0] == "REGISTER":
-                receive_register_protocol(data)
-            elif data == "BADAUTH":
-                sys.stderr.write("Error: You must be logged in to perform this action\n")
-            elif data.split(":")[0] == "ROOMLIST":
-                receive_roomlist_protocol(data)
-            elif data.split(":")[0] == "CREATE":
-                receive_create_protocol(data)
-            elif data.split(":")[0] == "JOIN":
-                receive_join_protocol(data)
-            elif data == "NOROOM":
-                sys.stderr.write("You are currently not in a room\n")
-            elif data.split(":")[0] == "BEGIN":
-                receive_begin_protocol(data)
-            elif data.split(":")[0] == "BOARDSTATUS":
-                receive_boardstatus_protocol(data)
-            elif data.split(":")[0] == "INPROGRESS":
-                receive_inprogress_protocol(data)
-            elif data.split(":")[0] == "GAMEEND":
-                receive_gameend_protocol(data)
+        if not binary:
+            print(f"received from {server_address}: {received.decode(errors='replace')}")
+        for data in data_list:
+            if binary:
+                data = wire.decode_message(data, frame_names)
+                if data is None:
+                    continue
+                print(f"received from {server_address}: {data}")
+                message_handlers.dispatch(data)
+            else:
+                message_handlers.dispatch(data.decode(errors="replace"))
+
+
+def login_message(username: str, password: str) -> str:
+    '''
+    return the LOGIN message of <username> with <password>
+    '''
+    return f"LOGIN:{username}:{password}"
 
 
 def prompt_login_protocol() -> str:
@@ -125,15 +171,16 @@ def prompt_login_protocol() -> str:
         password = input("Enter password: ")
     except EOFError:
         sys.exit(0)
-    return f"LOGIN:{username}:{password}"
+    return login_message(username, password)
 
 
-def receive_login_protocol(data: str) -> None:
+@message_handlers.register("LOGIN")
+def receive_login_protocol(data: list[str]) -> None:
     '''
     process received messages of LOGIN protocol
     '''
     global user_username
-    status = data.split(":")[2]
+    status = data[2]
     if status == "3":
         print("wrong format LOGIN message")
         return
@@ -147,6 +194,13 @@ def receive_login_protocol(data: str) -> None:
         sys.stderr.write(f"Error: Wrong password for user {username}\n")
 
 
+def register_message(username: str, password: str) -> str:
+    '''
+    return the REGISTER message of a new user <username> with <password>
+    '''
+    return f"REGISTER:{username}:{password}"
+
+
 def prompt_register_protocol() -> str:
     '''
     prompt for user's input and rewrite it to message for REGISTER protocol
@@ -159,14 +213,15 @@ def prompt_register_protocol() -> str:
         password = input("Enter password: ")
     except EOFError:
         sys.exit(0)
-    return f"REGISTER:{username}:{password}"
+    return register_message(username, password)
 
 
-def receive_register_protocol(data: str) -> None:
+@message_handlers.register("REGISTER")
+def receive_register_protocol(data: list[str]) -> None:
     '''
     process received messages of REGISTER protocol
     '''
-    status = data.split(":")[2]
+    status = data[2]
     if status == "2":
         print("wrong format REGISTER message")
         return
@@ -177,6 +232,15 @@ def receive_register_protocol(data: str) -> None:
         sys.stderr.write(f"Error: User {username} already exists\n")
 
 
+def roomlist_message(mode: str, offset: int, limit: int, prefix: str = "") -> str:
+    '''
+    return the ROOMLIST message asking for <limit> names from the <offset>-th of the rooms to join as <mode>
+    ("PLAYER" or "VIEWER") whose names start with <prefix>
+    '''
+    message = f"ROOMLIST:{mode}:{offset}:{limit}"
+    return f"{message}:{prefix}" if prefix else message
+
+
 def prompt_roomlist_protocol() -> str:
     '''
     prompt for user's input and rewrite it to message for ROOMLIST protocol
@@ -190,40 +254,223 @@ def prompt_roomlist_protocol() -> str:
         if mode in ("PLAYER", "VIEWER"):
             break
         print("Unknown input.")
-    return f"ROOMLIST:{mode}"
+    while True:
+        try:
+            prefix = input("Enter the start of the room names to list (leave empty for all rooms): ")
+        except EOFError:
+            sys.exit(0)
+        if ":" not in prefix:
+            break
+        print("Unknown input.")
+    return roomlist_message(mode, 0, ROOMLIST_PAGE_SIZE, prefix)
+
+
+@message_handlers.register("BADAUTH")
+def receive_badauth_protocol(data: list[str]) -> None:
+    '''
+    process received messages of BADAUTH protocol
+    '''
+    sys.stderr.write("Error: You must be logged in to perform this action\n")
 
 
-def receive_roomlist_protocol(data: str) -> None:
+@message_handlers.register("ROOMLIST")
+def receive_roomlist_protocol(data: list[str]) -> None:
     '''
     process received messages of ROOMLIST protocol
+    a page of a longer room list is followed by the number of matching rooms, MORE asks for the next page
     '''
-    data = data.split(":")
+    global next_roomlist_message
     status = data[2]
     if status == "1":
         sys.stderr.write("Error: Please input a valid mode.\n")
         return
-    mode = most_recent_message.split(":")[1]
+    request = most_recent_message.split(":")
+    mode = request[1]
     room_list = data[3]
     print(f"Room available to join as {mode}: {room_list}")
+    next_roomlist_message = ""
+    if len(data) < 5 or len(request) < 4:
+        return
+    offset = int(request[2])
+    n_listed = len(room_list.split(",")) if room_list else 0
+    n_matching = int(data[4])
+    if n_listed:
+        print(f"Showing rooms {offset + 1}-{offset + n_listed} of {n_matching}")
+    if offset + n_listed < n_matching:
+        request[2] = str(offset + n_listed)
+        next_roomlist_message = ":".join(request)
+        print("Enter MORE to list the next page of rooms")
+
+
+def history_message(mode: str, name: str, offset: int, limit: int) -> str:
+    '''
+    return the HISTORY message asking for <limit> ids from the <offset>-th newest of the games
+    of the user (<mode> "USER") or room (<mode> "ROOM") named <name>
+    '''
+    return f"HISTORY:{mode}:{name}:{offset}:{limit}"
+
+
+def prompt_history_protocol() -> str:
+    '''
+    prompt for user's input and rewrite it to message for HISTORY protocol
+    '''
+    while True:
+        try:
+            mode = input("Do you want the games of a user or of a room? (User/Room) ")
+        except EOFError:
+            sys.exit(0)
+        mode = mode.upper()
+        if mode in ("USER", "ROOM"):
+            break
+        print("Unknown input.")
+    try:
+        name = input(f"Enter the {mode.lower()} name (leave empty for your own games): ")
+    except EOFError:
+        sys.exit(0)
+    return history_message(mode, name or user_username, 0, HISTORY_PAGE_SIZE)
+
+
+@message_handlers.register("HISTORY")
+def receive_history_protocol(data: list[str]) -> None:
+    '''
+    process received messages of HISTORY protocol: the ids of the newest games, followed by the number of games
+    '''
+    status = data[2]
+    if status == "1":
+        sys.stderr.write("Error: Please input a valid user or room name.\n")
+        return
+    if status == "2":
+        sys.stderr.write("Error: The server does not keep a game history.\n")
+        return
+    name = most_recent_message.split(":")[2]
+    game_ids = data[3]
+    if not game_ids:
+        print(f"There are no games of {name}.")
+        return
+    print(f"Games of {name}, newest first: {game_ids} (showing {len(game_ids.split(','))} of {data[4]})")
+    print("Enter REPLAY to watch one of them")
+
+
+def replay_message(game_id: int) -> str:
+    '''
+    return the REPLAY message of the game with <game_id>
+    '''
+    return f"REPLAY:{game_id}"
+
+
+def prompt_replay_protocol() -> str:
+    '''
+    prompt for user's input and rewrite it to message for REPLAY protocol
+    '''
+    while True:
+        try:
+            game_id = input("Enter the id of the game to replay: ")
+        except EOFError:
+            sys.exit(0)
+        if game_id.isdigit():
+            return replay_message(int(game_id))
+        print("Unknown input.")
+
+
+@message_handlers.register("REPLAY")
+def receive_replay_protocol(data: list[str]) -> None:
+    '''
+    process received messages of REPLAY protocol, the game follows as INPROGRESS, SNAPSHOT, its moves and GAMEEND
+    '''
+    status = data[2]
+    if status == "1":
+        sys.stderr.write("Error: There is no game with this id.\n")
+    elif status == "2":
+        sys.stderr.write("Error: The server does not keep a game history.\n")
+    elif status == "3":
+        sys.stderr.write("Error: Leave the room before replaying a game.\n")
+    else:
+        _, _, _, game_id, room_name, started, ended = data
+        start_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(started)))
+        print(f"Replaying game {game_id}, played in room {room_name} at {start_time} for {int(ended) - int(started)} seconds")
+
+
+def leaderboard_message(username: str = "", offset: int = 0, limit: int = 0) -> str:
+    '''
+    return the LEADERBOARD message asking for the rank of <username>,
+    or if no username is given for <limit> players from the <offset>-th best rated
+    '''
+    if username:
+        return f"LEADERBOARD:RANK:{username}"
+    return f"LEADERBOARD:TOP:{offset}:{limit}"
+
+
+def prompt_leaderboard_protocol() -> str:
+    '''
+    prompt for user's input and rewrite it to message for LEADERBOARD protocol
+    '''
+    while True:
+        try:
+            mode = input("Do you want the best rated players or the rank of a player? (Top/Rank) ")
+        except EOFError:
+            sys.exit(0)
+        mode = mode.upper()
+        if mode == "TOP":
+            return leaderboard_message(offset=0, limit=LEADERBOARD_PAGE_SIZE)
+        if mode == "RANK":
+            break
+        print("Unknown input.")
+    try:
+        username = input("Enter the username (leave empty for your own rank): ")
+    except EOFError:
+        sys.exit(0)
+    return leaderboard_message(username or user_username)
+
+
+@message_handlers.register("LEADERBOARD")
+def receive_leaderboard_protocol(data: list[str]) -> None:
+    '''
+    process received messages of LEADERBOARD protocol: the number of rated players,
+    then the rank, username, rating, wins, losses and draws of every player listed
+    '''
+    status = data[2]
+    if status == "1":
+        sys.stderr.write("Error: Please input a valid username.\n")
+        return
+    if status == "2":
+        sys.stderr.write("Error: The server does not keep ratings.\n")
+        return
+    if status == "3":
+        print(f"{most_recent_message.split(':')[2]} has not finished a rated game yet.")
+        return
+    print(f"{data[3]} rated players")
+    print(f"{'rank':>6} {'player':<20} {'rating':>6} {'W':>5} {'L':>5} {'D':>5}")
+    for i in range(4, len(data) - 5, 6):
+        rank, username, rating, wins, losses, draws = data[i:i + 6]
+        print(f"{rank:>6} {username:<20} {rating:>6} {wins:>5} {losses:>5} {draws:>5}")
+
+
+def create_message(room_name: str) -> str:
+    '''
+    return the CREATE message of a room named <room_name>
+    '''
+    return f"CREATE:{room_name}"
 
 
 def prompt_create_protocol() -> str:
     '''
     prompt for user's input and rewrite it to message for CREATE protocol
+    a room name followed by :<size>:<win length> (e.g. gomoku:15:5) creates a room with a larger board
     '''
     try:
         room_name = input("Enter room name you want to create: ")
     except EOFError:
         sys.exit(0)
-    return f"CREATE:{room_name}"
+    return create_message(room_name)
 
 
-def receive_create_protocol(data: str) -> None:
+@message_handlers.register("CREATE")
+def receive_create_protocol(data: list[str]) -> None:
     '''
     process received messages of CREATE protocol
     '''
     global in_room, is_player
-    status = data.split(":")[2]
+    status = data[2]
     if status == "4":
         print("wrong format CREATE message")
         return
@@ -241,6 +488,32 @@ def receive_create_protocol(data: str) -> None:
         sys.stderr.write(f"Error: Server already contains a maximum of {ROOMS_LIMIT} rooms\n")
 
 
+def prompt_addbot_protocol() -> str:
+    '''
+    prompt for user's input and rewrite it to message for ADDBOT protocol
+    '''
+    return "ADDBOT"
+
+
+@message_handlers.register("ADDBOT")
+def receive_addbot_protocol(data: list[str]) -> None:
+    '''
+    process received messages of ADDBOT protocol
+    '''
+    status = data[2]
+    if status == "0":
+        print("The computer joined the room as the other player")
+    elif status == "1":
+        sys.stderr.write("Error: The computer can only join a room you created that is waiting for a player\n")
+
+
+def join_message(room_name: str, mode: str) -> str:
+    '''
+    return the JOIN message of the room named <room_name> as <mode> ("PLAYER" or "VIEWER")
+    '''
+    return f"JOIN:{room_name}:{mode}"
+
+
 def prompt_join_protocol() -> str:
     '''
     prompt for user's input and rewrite it to message for JOIN protocol
@@ -259,18 +532,19 @@ def prompt_join_protocol() -> str:
             print("Unknown input.")
         else:
             break
-    return f"JOIN:{room_name}:{mode}"
+    return join_message(room_name, mode)
 
 
 is_player: bool = False
 
 
-def receive_join_protocol(data: str) -> None:
+@message_handlers.register("JOIN")
+def receive_join_protocol(data: list[str]) -> None:
     '''
     process received messages of JOIN protocol
     '''
     global in_room, is_player
-    status = data.split(":")[2]
+    status = data[2]
     if status == "3":
         print("wrong format JOIN message")
         return
@@ -293,31 +567,87 @@ board: list[list[str]]
 
 p1_username: str = ""
 p2_username: str = ""
+board_seq: int = 0 # the sequence number of the last MOVE applied to the board
+p1_turn_parity: int | None = 0 # the parity of the sequence numbers after which p1_username is in turn, None until a viewer joining mid-game gets a SNAPSHOT
+
+@message_handlers.register("NOROOM")
+def receive_noroom_protocol(data: list[str]) -> None:
+    '''
+    process received messages of NOROOM protocol
+    '''
+    sys.stderr.write("You are currently not in a room\n")
+
 
-def receive_begin_protocol(data: str) -> None:
+@message_handlers.register("BEGIN")
+def receive_begin_protocol(data: list[str]) -> None:
     '''
     process received messages of BEGIN protocol
     '''
-    global is_p1_turn, game_begun, board, p1_username, p2_username
-    _, p1, p2 = data.split(":")
+    global is_p1_turn, game_begun, board, p1_username, p2_username, board_seq, p1_turn_parity
+    p1, p2 = data[1:3]
+    board_seq = 0
+    p1_turn_parity = 0
     p1_username = p1
     p2_username = p2
     print(f"match between {p1} and {p2} will commence, it is currently {p1}’s turn.")
     if user_username in (p1, p2):
         game_begun = True
         is_p1_turn = True
-    board = tictactoe.create_board()
+    # a room with a larger board announces its size after the players
+    board = tictactoe.create_board(int(data[3]) if len(data) > 3 else tictactoe.BOARD_SIZE)
 
 
-def receive_boardstatus_protocol(data: str) -> None:
+@message_handlers.register("BOARDSTATUS")
+def receive_boardstatus_protocol(data: list[str]) -> None:
     '''
     process received messages of BOARDSTATUS protocol
     '''
     global is_p1_turn, board
-    status = data.split(":")[1]
+    status = data[1]
     board = tictactoe.assign_board(status)
     tictactoe.print_board(board)
     is_p1_turn = not is_p1_turn
+    print_turn()
+
+
+@message_handlers.register("MOVE")
+def receive_move_protocol(data: list[str]) -> None:
+    '''
+    process received messages of MOVE protocol: the marker placed by the last move, applied to the board
+    '''
+    global is_p1_turn, board, board_seq
+    seq = int(data[1])
+    if board is None or seq != board_seq + 1 or p1_turn_parity is None:
+        # the board is out of sync until the next SNAPSHOT
+        return
+    tictactoe.put_marker(board, int(data[3]), int(data[2]), "X" if data[4] == "1" else "O")
+    board_seq = seq
+    tictactoe.print_board(board)
+    is_p1_turn = seq % 2 == p1_turn_parity
+    print_turn()
+
+
+@message_handlers.register("SNAPSHOT")
+def receive_snapshot_protocol(data: list[str]) -> None:
+    '''
+    process received messages of SNAPSHOT protocol: the whole board, after the move with the sequence number
+    '''
+    global is_p1_turn, board, board_seq, p1_turn_parity
+    seq = int(data[1])
+    board = tictactoe.assign_board(data[2])
+    board_seq = seq
+    if p1_turn_parity is None:
+        # a viewer joining mid-game was told that p1_username is in turn now
+        p1_turn_parity = seq % 2
+    tictactoe.print_board(board)
+    is_p1_turn = seq % 2 == p1_turn_parity
+    print_turn()
+
+
+def print_turn() -> None:
+    '''
+    print whose turn it is
+    '''
     if is_player:
         if is_p1_turn:
             if user_username == p1_username:
@@ -336,10 +666,18 @@ def receive_boardstatus_protocol(data: str) -> None:
             print(f"It is {p2_username}'s turn")
 
 
+def place_message(row: int, col: int) -> str:
+    '''
+    return the PLACE message of a marker at (<row>, <col>)
+    '''
+    return f"PLACE:{col}:{row}"
+
+
 def prompt_place_protocol() -> str:
     '''
     prompt for user's input and rewrite it to message for PLACE protocol
     '''
+    size = tictactoe.get_board_size(board)
     while True:
         try:
             col = int(input("Column: "))
@@ -347,30 +685,31 @@ def prompt_place_protocol() -> str:
         except EOFError:
             sys.exit(0)
         except:
-            print("(Column/Row) values must be an integer between 0 and 2")
+            print(f"(Column/Row) values must be an integer between 0 and {size - 1}")
             continue
-        if row < 0 or row > 2 or col < 0 or col > 2:
-            print("(Column/Row) values must be an integer between 0 and 2")
+        if row < 0 or row >= size or col < 0 or col >= size:
+            print(f"(Column/Row) values must be an integer between 0 and {size - 1}")
             continue
         if tictactoe.get_marker(board, row, col) != ' ':
             print(f"({col}, {row}) is occupied by {tictactoe.get_marker(board, row, col)}.")
             continue
         break
-    return f"PLACE:{col}:{row}"
+    return place_message(row, col)
 
 
-def receive_gameend_protocol(data: str) -> None:
+@message_handlers.register("GAMEEND")
+def receive_gameend_protocol(data: list[str]) -> None:
     '''
     process received messages of GAMEEND protocol
     '''
-    global board, game_begun, in_room, is_p1_turn, p1_username, p2_username, is_player
-    board_status, status_code = data.split(":")[1:3]
+    global board, game_begun, in_room, is_p1_turn, p1_username, p2_username, is_player, board_seq
+    board_status, status_code = data[1:3]
     board = tictactoe.assign_board(board_status)
     tictactoe.print_board(board)
     if status_code == "1":
         print("Game ended in a draw")
     elif status_code == "0":
-        winner_username = data.split(":")[3]
+        winner_username = data[3]
         if is_player:
             if user_username == winner_username:
                 print("Congratulations, you won!")
@@ -379,7 +718,7 @@ def receive_gameend_protocol(data: str) -> None:
         else:
             print(f"{winner_username} has won this game")
     elif status_code == "2":
-        winner_username = data.split(":")[3]
+        winner_username = data[3]
         print(f"{winner_username} won due to the opposing player forfeiting")
     board = None
     game_begun = False
@@ -388,6 +727,7 @@ def receive_gameend_protocol(data: str) -> None:
     is_p1_turn = False
     p1_username = ""
     p2_username = ""
+    board_seq = 0
 
 
 def prompt_forfeit_protocol() -> str:
@@ -397,19 +737,24 @@ def prompt_forfeit_protocol() -> str:
     return "FORFEIT"
 
 
-def receive_inprogress_protocol(data: str) -> None:
+@message_handlers.register("INPROGRESS")
+def receive_inprogress_protocol(data: list[str]) -> None:
     '''
     process received messages of INPROGRESS protocol
     '''
-    global p1_username, p2_username, is_p1_turn
-    _, current_turn_player, opposing_player = data.split(":")
+    global p1_username, p2_username, is_p1_turn, p1_turn_parity
+    _, current_turn_player, opposing_player = data
     p1_username = current_turn_player
     p2_username = opposing_player
     is_p1_turn = True
+    p1_turn_parity = None
     print(f"Match between {current_turn_player} and {opposing_player} is currently in progress, it is {current_turn_player}’s turn")
 
 
-ROOMS_LIMIT: int = 2
+ROOMS_LIMIT: int = 200000
+ROOMLIST_PAGE_SIZE: int = 20 # the number of room names asked for per ROOMLIST page
+HISTORY_PAGE_SIZE: int = 20 # the number of game ids asked for by HISTORY
+LEADERBOARD_PAGE_SIZE: int = 10 # the number of players asked for by LEADERBOARD:TOP
 
 
 def main(args: list[str]) -> None:
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import zlib
+import array
+import signal
+import socket
+import traceback
+import collections
+
+
+MAX_MESSAGE_SIZE: int = 256 * 1024 # the largest message sent between workers
+MAX_FDS: int = 4 # the most file descriptors passed with one message
+
+
+class Peer:
+    '''
+    A message channel to another worker process over an AF_UNIX SOCK_SEQPACKET socket
+
+    Every message is one JSON object and may carry sockets, which are passed to the other
+    worker with SCM_RIGHTS. Messages the socket does not accept right away are queued
+    until it becomes writable.
+
+    Attributes:
+    -----------
+    worker_id: int
+        the id of the worker on the other end
+    channel_socket: socket.socket
+        the non-blocking socket connected to the other worker
+    outbound: collections.deque[tuple[bytes, list[socket.socket]]]
+        the encoded messages, with the sockets they pass, waiting for the channel to become writable
+    '''
+    def __init__(self, worker_id: int, channel_socket: socket.socket):
+        self.worker_id = worker_id
+        self.channel_socket = channel_socket
+        self.channel_socket.setblocking(False)
+        self.outbound = collections.deque()
+
+    def send(self, message: dict, passed_sockets: list[socket.socket] = ()) -> None:
+        '''
+        queue <message> for the other worker, passing <passed_sockets> along with it
+        the sockets are closed in this process once they have been passed
+        '''
+        self.outbound.append((json.dumps(message).encode(), list(passed_sockets)))
+        if len(self.outbound) == 1:
+            self.flush()
+
+    def flush(self) -> bool:
+        '''
+        send as many queued messages as the channel accepts
+        return True if the queue is empty
+        '''
+        while self.outbound:
+            data, passed_sockets = self.outbound[0]
+            ancillary = []
+            if passed_sockets:
+                fds = array.array("i", (passed_socket.fileno() for passed_socket in passed_sockets))
+                ancillary.append((socket.SOL_SOCKET, socket.SCM_RIGHTS, fds))
+            try:
+                self.channel_socket.sendmsg([data], ancillary)
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.outbound.popleft()
+            for passed_socket in passed_sockets:
+                passed_socket.close()
+        return True
+
+    def receive(self) -> list[tuple[dict, list[int]]]:
+        '''
+        return every message received so far with the file descriptors passed along with it
+        raise ConnectionError if the other worker is gone
+        '''
+        messages = []
+        fds_size = socket.CMSG_SPACE(MAX_FDS * array.array("i").itemsize)
+        while True:
+            try:
+                data, ancillary, _, _ = self.channel_socket.recvmsg(MAX_MESSAGE_SIZE, fds_size)
+            except (BlockingIOError, InterruptedError):
+                return messages
+            if not data:
+                raise ConnectionError(f"worker {self.worker_id} is gone")
+            fds = array.array("i")
+            for level, kind, payload in ancillary:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+            messages.append((json.loads(data), list(fds)))
+
+
+def room_shard(room_name: str, n_workers: int) -> int:
+    '''
+    return the id of the worker that hosts the room named <room_name>
+    '''
+    return zlib.crc32(room_name.encode()) % n_workers
+
+
+def create_channels(n_workers: int) -> list[dict[int, socket.socket]]:
+    '''
+    connect every pair of workers and return, for each worker, its channel sockets by peer id
+    '''
+    channels = [{} for _ in range(n_workers)]
+    for i in range(n_workers):
+        for j in range(i + 1, n_workers):
+            a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            for channel_socket in (a, b):
+                channel_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, MAX_MESSAGE_SIZE * 4)
+            channels[i][j] = a
+            channels[j][i] = b
+    return channels
+
+
+def start_workers(n_workers: int, run_worker) -> None:
+    '''
+    fork <n_workers> worker processes, each calls run_worker(worker_id, peers)
+    then supervise them: if one exits, or this process is interrupted/terminated, stop them all
+    '''
+    channels = create_channels(n_workers)
+    children = []
+    for worker_id in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            # keep only this worker's ends of the channels
+            for other_id, worker_channels in enumerate(channels):
+                if other_id != worker_id:
+                    for channel_socket in worker_channels.values():
+                        channel_socket.close()
+            peers = {peer_id: Peer(peer_id, channel_socket) for peer_id, channel_socket in channels[worker_id].items()}
+            status = 0
+            try:
+                run_worker(worker_id, peers)
+            except KeyboardInterrupt:
+                pass
+            except BaseException as e:
+                status = e.code if isinstance(e, SystemExit) and isinstance(e.code, int) else 1
+                if not isinstance(e, SystemExit):
+                    traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        children.append(pid)
+    for worker_channels in channels:
+        for channel_socket in worker_channels.values():
+            channel_socket.close()
+
+    def stop_workers() -> None:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        pid, status = os.wait()
+        sys.stderr.write(f"Error: worker process {pid} exited with status {status}\n")
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        stop_workers()
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
@@ -0,0 +1,304 @@
+import os
+import zlib
+import queue
+import struct
+import logging
+import threading
+
+
+LOG_MAGIC: bytes = b"TTTGLOG1" # the first bytes of a game log
+RECORD_HEADER: struct.Struct = struct.Struct("<II") # the length of a record's body and its CRC-32, a torn or corrupt record ends the log
+GAME_HEADER: struct.Struct = struct.Struct("<ddBBBBHHHH") # start and end (UNIX time), board size, win length, status, winner, then the lengths of the room name and usernames and the number of moves
+MOVE_BYTES: int = 2 # a move is its column, its row << 5 and whether it placed an O << 10
+NO_WINNER: int = 0 # the winner of a game without one, otherwise 1 (player 1) or 2 (player 2)
+READ_CHUNK_SIZE: int = 1 << 20 # the number of bytes of the log read at once when it is loaded
+
+logger: logging.Logger = logging.getLogger("history")
+
+
+class GameLogError(Exception):
+    '''
+    raised when a game log cannot be opened, the message completes "Error: <game history path> ..."
+    '''
+
+
+class Game:
+    '''
+    A finished game
+
+    Attributes:
+    -----------
+    room_name: str
+        the name of the room the game was played in
+    p1_username: str
+        the username of player 1, who placed the Xs
+    p2_username: str
+        the username of player 2, who placed the Os
+    board_size: int
+        the number of rows (and columns) of the board
+    win_length: int
+        the number of markers in a row that won the game
+    moves: list[tuple[int, int, str]]
+        the column, row and marker of every move, in order
+    started: float
+        the UNIX time the game began at
+    ended: float
+        the UNIX time the game ended at
+    status: int
+        the GAMEEND status code: 0 won, 1 drawn, 2 forfeited
+    winner: int
+        1 or 2, the player who won, or NO_WINNER
+    '''
+    def __init__(self, room_name: str, p1_username: str, p2_username: str, board_size: int, win_length: int,
+                 moves: list[tuple[int, int, str]], started: float, ended: float, status: int, winner: int):
+        self.room_name = room_name
+        self.p1_username = p1_username
+        self.p2_username = p2_username
+        self.board_size = board_size
+        self.win_length = win_length
+        self.moves = moves
+        self.started = started
+        self.ended = ended
+        self.status = status
+        self.winner = winner
+
+    def winner_username(self) -> str | None:
+        '''
+        return the username of the winner, or None
+        '''
+        if self.winner == NO_WINNER:
+            return None
+        return self.p1_username if self.winner == 1 else self.p2_username
+
+
+def encode_moves(moves: list[tuple[int, int, str]]) -> bytes:
+    '''
+    return the packed moves <moves>, MOVE_BYTES each
+    '''
+    return b"".join((col | row << 5 | (marker == "O") << 10).to_bytes(MOVE_BYTES, "little") for col, row, marker in moves)
+
+
+def encode_game(game: Game) -> bytes:
+    '''
+    return the log record of <game>
+    '''
+    room_name = game.room_name.encode()
+    p1_username = game.p1_username.encode()
+    p2_username = game.p2_username.encode()
+    body = b"".join((
+        GAME_HEADER.pack(game.started, game.ended, game.board_size, game.win_length, game.status, game.winner,
+                         len(room_name), len(p1_username), len(p2_username), len(game.moves)),
+        room_name, p1_username, p2_username, encode_moves(game.moves),
+    ))
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def decode_names(body: bytes, lengths: tuple[int, int, int]) -> list[str]:
+    '''
+    return the room name and usernames of the log record body <body>, whose lengths are <lengths>
+    '''
+    names = []
+    position = GAME_HEADER.size
+    for length in lengths:
+        names.append(body[position:position + length].decode(errors="replace"))
+        position += length
+    return names
+
+
+def decode_game(body: bytes) -> Game:
+    '''
+    return the game of the log record body <body>
+    '''
+    started, ended, board_size, win_length, status, winner, room_length, p1_length, p2_length, n_moves = GAME_HEADER.unpack_from(body)
+    names = decode_names(body, (room_length, p1_length, p2_length))
+    position = GAME_HEADER.size + room_length + p1_length + p2_length
+    moves = []
+    for _ in range(n_moves):
+        move = int.from_bytes(body[position:position + MOVE_BYTES], "little")
+        moves.append((move & 0x1F, move >> 5 & 0x1F, "O" if move >> 10 & 1 else "X"))
+        position += MOVE_BYTES
+    return Game(*names, board_size, win_length, moves, started, ended, status, winner)
+
+
+class GameLog:
+    '''
+    An append-only log of finished games, indexed by username and room name
+
+    A game gets the next game id and is indexed as soon as it is appended, its record is handed
+    to a writing thread that writes every record queued meanwhile with one write and one fsync,
+    so the event loop never waits for the disk. Until then the record is read from memory.
+    Loading scans the log once to rebuild the indexes, a torn or corrupt tail is cut off.
+
+    Attributes:
+    -----------
+    path: str
+        the path of the log
+    offsets: list[int]
+        the offset of the record of every game id in the log, the ids are the games in log order
+    size: int
+        the length the log will have once every appended record is written
+    by_username: dict[str, list[int]]
+        [username, game ids] : the games every user played, oldest first
+    by_room: dict[str, list[int]]
+        [room name, game ids] : the games played in every room, oldest first
+    unwritten: dict[int, bytes]
+        [game id, record] : the records the writing thread has not written yet
+    reader: io.FileIO
+        the unbuffered file the records are read from, which sees every write of the writing thread
+    writes: queue.SimpleQueue
+        the (game id, record) pairs to write, None stops the writing thread
+    writer: threading.Thread
+        the thread writing the records
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = []
+        self.by_username = {}
+        self.by_room = {}
+        self.unwritten = {}
+        try:
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                with open(path, "wb") as f:
+                    f.write(LOG_MAGIC)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.size = self.load()
+            self.reader = open(path, "rb", buffering=0)
+            log = open(path, "ab")
+        except OSError as e:
+            raise GameLogError(f"cannot be opened: {e.strerror}.")
+        self.writes = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self.write_records, args=(log,), name="history", daemon=True)
+        self.writer.start()
+
+    def load(self) -> int:
+        '''
+        index every record of the log and return the length of its valid part, which it is cut to
+        raise GameLogError if it is not a game log
+        '''
+        with open(self.path, "rb") as f:
+            if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+                raise GameLogError("is not a game log.")
+            data = b""
+            position = 0
+            offset = len(LOG_MAGIC)
+            at_eof = False
+            while True:
+                if len(data) - position < RECORD_HEADER.size + GAME_HEADER.size and not at_eof:
+                    chunk = f.read(READ_CHUNK_SIZE)
+                    at_eof = not chunk
+                    data = data[position:] + chunk
+                    position = 0
+                    continue
+                if len(data) - position < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack_from(data, position)
+                end = position + RECORD_HEADER.size + length
+                while end > len(data) and not at_eof:
+                    chunk = f.read(max(READ_CHUNK_SIZE, end - len(data)))
+                    at_eof = not chunk
+                    data = data[position:] + chunk
+                    end -= position
+                    position = 0
+                if end > len(data) or length < GAME_HEADER.size:
+                    break
+                body = data[position + RECORD_HEADER.size:end]
+                if zlib.crc32(body) != crc:
+                    break
+                # the moves are only decoded by get()
+                self.index(len(self.offsets), *decode_names(body, GAME_HEADER.unpack_from(body)[6:9]))
+                self.offsets.append(offset)
+                offset += end - position
+                position = end
+        if offset < os.path.getsize(self.path):
+            logger.warning("cutting %d bytes of torn or corrupt records off %s", os.path.getsize(self.path) - offset, self.path)
+            os.truncate(self.path, offset)
+        return offset
+
+    def index(self, game_id: int, room_name: str, p1_username: str, p2_username: str) -> None:
+        '''
+        add <game_id> to the games of its players and its room
+        '''
+        self.by_username.setdefault(p1_username, []).append(game_id)
+        if p2_username != p1_username:
+            self.by_username.setdefault(p2_username, []).append(game_id)
+        self.by_room.setdefault(room_name, []).append(game_id)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def append(self, game: Game) -> int:
+        '''
+        add <game> to the log and return its game id, it is written in the background
+        '''
+        record = encode_game(game)
+        game_id = len(self.offsets)
+        self.offsets.append(self.size)
+        self.size += len(record)
+        self.index(game_id, game.room_name, game.p1_username, game.p2_username)
+        self.unwritten[game_id] = record
+        self.writes.put((game_id, record))
+        return game_id
+
+    def write_records(self, log) -> None:
+        '''
+        the writing thread: write the queued records in batches, every record queued while a batch is being written
+        goes in the next one, until None is queued
+        '''
+        failed = False
+        with log:
+            while True:
+                batch = [self.writes.get()]
+                while batch[-1] is not None:
+                    try:
+                        batch.append(self.writes.get_nowait())
+                    except queue.Empty:
+                        break
+                records = [item for item in batch if item is not None]
+                if records and not failed:
+                    try:
+                        log.write(b"".join(record for _, record in records))
+                        log.flush()
+                        os.fsync(log.fileno())
+                    except OSError as e:
+                        # the offsets of the following records would be wrong, they all stay in memory until the server stops
+                        # and the partly written batch is cut off the log when it is loaded again
+                        logger.error("error writing game records to %s, the following games are not kept: %s", self.path, e)
+                        failed = True
+                    else:
+                        for game_id, _ in records:
+                            self.unwritten.pop(game_id, None)
+                if batch[-1] is None:
+                    return
+
+    def get(self, game_id: int) -> Game | None:
+        '''
+        return the game with <game_id>, or None if there is no such game
+        '''
+        if not 0 <= game_id < len(self.offsets):
+            return None
+        # the writing thread drops a record from memory only once it is written
+        record = self.unwritten.get(game_id)
+        if record is None:
+            offset = self.offsets[game_id]
+            end = self.offsets[game_id + 1] if game_id + 1 < len(self.offsets) else self.size
+            self.reader.seek(offset)
+            record = self.reader.read(end - offset)
+        return decode_game(record[RECORD_HEADER.size:])
+
+    def games(self, index: dict[str, list[int]], key: str, offset: int, limit: int) -> tuple[list[int], int]:
+        '''
+        return <limit> game ids of <key> in <index> (by_username or by_room) from the <offset>-th, newest first,
+        and the number of games of <key>
+        '''
+        game_ids = index.get(key, [])
+        end = len(game_ids) - offset
+        return game_ids[max(0, end - limit):max(0, end)][::-1], len(game_ids)
+
+    def close(self) -> None:
+        '''
+        write every appended record and stop the writing thread
+        '''
+        self.writes.put(None)
+        self.writer.join()
+        self.reader.close()
@@ -0,0 +1,218 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import random
+import asyncio
+import multiprocessing
+import client
+import server
+import benchmark
+
+
+REPLY_TIMEOUT: float = 10.0 # the most seconds to wait for a reply before the request counts as an error and the pair stops
+ROOMLIST_PAGE_SIZE: int = 20 # the number of room names each scripted player asks for before a game
+PASSWORD: str = "password" # the password of the generated users, see benchmark.bench_users()
+VERBS: tuple[str, ...] = ("LOGIN", "ROOMLIST", "CREATE", "JOIN", "PLACE") # the verbs reported, in script order
+
+
+class Results:
+    '''
+    The requests made by some scripted clients, merged across processes at the end
+
+    Attributes:
+    -----------
+    requests: dict[str, int]
+        [verb, count] : the number of requests sent
+    errors: dict[str, int]
+        [verb, count] : the number of requests answered with an unexpected reply, or not answered in time
+    latencies: dict[str, list[float]]
+        [verb, latencies] : the milliseconds from sending each answered request to receiving its reply
+    games: int
+        the number of games played to the end
+    moves: int
+        the number of markers placed
+    '''
+    def __init__(self):
+        self.requests = {verb: 0 for verb in VERBS}
+        self.errors = {verb: 0 for verb in VERBS}
+        self.latencies = {verb: [] for verb in VERBS}
+        self.games = 0
+        self.moves = 0
+
+    def merge(self, other: "Results") -> None:
+        '''
+        add the requests of <other> to these
+        '''
+        for verb in VERBS:
+            self.requests[verb] += other.requests[verb]
+            self.errors[verb] += other.errors[verb]
+            self.latencies[verb].extend(other.latencies[verb])
+        self.games += other.games
+        self.moves += other.moves
+
+
+async def request(results: Results, verb: str, player: benchmark.AsyncBenchClient, message: str, expected: tuple[str, ...]) -> str:
+    '''
+    send <message> and wait for the reply, recording its latency under <verb>
+    a reply that does not start with one of <expected> counts as an error, a missing reply is an error that is raised
+    '''
+    results.requests[verb] += 1
+    start = time.perf_counter()
+    try:
+        player.send(message)
+        reply = await asyncio.wait_for(player.receive(), REPLY_TIMEOUT)
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        results.errors[verb] += 1
+        raise
+    results.latencies[verb].append((time.perf_counter() - start) * 1000)
+    if not reply.startswith(expected):
+        results.errors[verb] += 1
+    return reply
+
+
+async def expect(player: benchmark.AsyncBenchClient, expected: str) -> str:
+    '''
+    wait for the next line, which is not timed, and raise ConnectionError if it does not start with <expected>
+    '''
+    line = await asyncio.wait_for(player.receive(), REPLY_TIMEOUT)
+    if not line.startswith(expected):
+        raise ConnectionError(f"expected {expected}, received {line}")
+    return line
+
+
+async def play_pair(port: int, pair: int, deadline: float, results: Results) -> None:
+    '''
+    log two players in and let them play games of random moves against each other until <deadline>:
+    player 2 lists the rooms, player 1 creates a room and player 2 joins it
+    '''
+    rng = random.Random(pair)
+    players = []
+    try:
+        players.append(await benchmark.AsyncBenchClient.connect(port))
+        players.append(await benchmark.AsyncBenchClient.connect(port))
+        player1, player2 = players
+        for i, player in enumerate(players):
+            await request(results, "LOGIN", player, client.login_message(f"user{2 * pair + i}", PASSWORD), ("LOGIN:ACKSTATUS:0",))
+        n_games = 0
+        while time.perf_counter() < deadline:
+            n_games += 1
+            room_name = f"p{pair}g{n_games}"
+            await request(results, "ROOMLIST", player2, client.roomlist_message("PLAYER", 0, ROOMLIST_PAGE_SIZE), ("ROOMLIST:ACKSTATUS:0",))
+            await request(results, "CREATE", player1, client.create_message(room_name), ("CREATE:ACKSTATUS:0",))
+            await request(results, "JOIN", player2, client.join_message(room_name, "PLAYER"), ("JOIN:ACKSTATUS:0",))
+            await expect(player1, "BEGIN")
+            await expect(player2, "BEGIN")
+            board_status = "0" * 9
+            mover, other = player1, player2
+            while True:
+                row, col = divmod(rng.choice([cell for cell, digit in enumerate(board_status) if digit == "0"]), 3)
+                reply = await request(results, "PLACE", mover, client.place_message(row, col), ("BOARDSTATUS", "GAMEEND"))
+                results.moves += 1
+                await expect(other, reply.split(":")[0])
+                if not reply.startswith("BOARDSTATUS"):
+                    break
+                board_status = reply.split(":")[1]
+                mover, other = other, mover
+            results.games += 1
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        # counted as an error of the request that failed, the pair stops
+        pass
+    finally:
+        for player in players:
+            player.close()
+
+
+async def run_pairs(port: int, first_pair: int, n_pairs: int, seconds: float) -> Results:
+    '''
+    run pairs <first_pair> to <first_pair> + <n_pairs> - 1 concurrently for <seconds>
+    '''
+    results = Results()
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(play_pair(port, pair, deadline, results) for pair in range(first_pair, first_pair + n_pairs)))
+    return results
+
+
+def run_slice(port: int, first_pair: int, n_pairs: int, seconds: float) -> Results:
+    '''
+    the entry point of a load generating process
+    '''
+    server.raise_file_limit()
+    return asyncio.run(run_pairs(port, first_pair, n_pairs, seconds))
+
+
+def free_port() -> int:
+    '''
+    return a local port nothing is listening on
+    '''
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def report(results: Results, n_connections: int, elapsed: float) -> None:
+    '''
+    print the throughput, the latency percentiles and the error rate of every verb
+    '''
+    n_requests = sum(results.requests.values())
+    n_errors = sum(results.errors.values())
+    print(f"{n_connections} connections, {results.games} games in {elapsed:.1f}s: "
+          f"{n_requests / elapsed:.0f} requests/s, {results.moves / elapsed:.0f} moves/s, {n_errors} errors")
+    print(f"{'verb':>9} {'requests':>9} {'errors':>7} {'error %':>8} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for verb in VERBS:
+        latencies = results.latencies[verb]
+        if not results.requests[verb]:
+            continue
+        p50 = f"{benchmark.percentile(latencies, 0.5):9.2f}" if latencies else f"{'-':>9}"
+        p99 = f"{benchmark.percentile(latencies, 0.99):9.2f}" if latencies else f"{'-':>9}"
+        error_rate = results.errors[verb] / results.requests[verb]
+        print(f"{verb:>9} {results.requests[verb]:>9} {results.errors[verb]:>7} {error_rate:8.2%} {p50} {p99}")
+
+
+def main(args: list[str]) -> None:
+    '''
+    usage: loadgen.py [n_pairs] [seconds] [n_processes] [server.py | aioserver.py | port]
+    launches the server with users user0, user1, ... unless given the port of a running server that has them
+    '''
+    try:
+        n_pairs = int(args[0]) if len(args) > 0 else 500
+        seconds = float(args[1]) if len(args) > 1 else 10.0
+        n_processes = int(args[2]) if len(args) > 2 else 1
+    except ValueError:
+        sys.stderr.write("Error: Expecting [n_pairs] [seconds] [n_processes] as numbers\n")
+        sys.exit(1)
+    if n_pairs < 1 or seconds <= 0 or not 1 <= n_processes <= n_pairs:
+        sys.stderr.write("Error: Expecting n_pairs >= 1, seconds > 0 and 1 <= n_processes <= n_pairs\n")
+        sys.exit(1)
+    target = args[3] if len(args) > 3 else "server.py"
+    server.raise_file_limit()
+    process = directory = None
+    if target.isdigit():
+        port = int(target)
+    else:
+        port = free_port()
+        server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), target)
+        process, directory = benchmark.launch_server(port, benchmark.bench_users(2 * n_pairs), server_path=server_path)
+    try:
+        slices = [(port, n_pairs * i // n_processes, n_pairs * (i + 1) // n_processes - n_pairs * i // n_processes, seconds) for i in range(n_processes)]
+        start = time.perf_counter()
+        if n_processes == 1:
+            all_results = [run_slice(*slices[0])]
+        else:
+            with multiprocessing.Pool(n_processes) as pool:
+                all_results = pool.starmap(run_slice, slices)
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(directory, ignore_errors=True)
+    results = Results()
+    for slice_results in all_results:
+        results.merge(slice_results)
+    report(results, 2 * n_pairs, elapsed)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,277 @@
+import sys
+import queue
+import socket
+import bisect
+import atexit
+import logging
+import logging.handlers
+
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+) # the upper bounds in seconds of the histogram buckets, handling a line usually takes microseconds and a bcrypt job a fraction of a second
+MAX_REQUEST_LENGTH: int = 8192 # the longest HTTP request accepted on the admin port
+LOG_FORMAT: str = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LOG_LEVELS: tuple[str, ...] = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+log_listener: logging.handlers.QueueListener | None = None # writes the queued log records from its own thread, see start_logging()
+
+
+class Counter:
+    '''
+    A monotonically increasing count, one per combination of label values
+
+    Attributes:
+    -----------
+    name: str
+        the metric name
+    help: str
+        the description exported with the metric
+    label_names: tuple[str, ...]
+        the names of the labels, in the order their values are given to inc()
+    values: dict[tuple[str, ...], float]
+        [label values, count] : the count of every combination of label values seen
+    '''
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        '''
+        add <amount> to the count of <label_values>
+        '''
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        '''
+        return the lines of the metric in the Prometheus text format
+        '''
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if not self.values and not self.label_names:
+            lines.append(f"{self.name} 0")
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Gauge:
+    '''
+    A value read when the metrics are exported, e.g. the number of connections
+
+    Attributes:
+    -----------
+    name: str
+        the metric name
+    help: str
+        the description exported with the metric
+    read: callable
+        returns the current value, called only when the metrics are exported so that the hot path never updates it
+    '''
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> list[str]:
+        '''
+        return the lines of the metric in the Prometheus text format
+        '''
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {format_value(self.read())}"]
+
+
+class Histogram:
+    '''
+    The distribution of observed values (e.g. latencies in seconds), one per combination of label values
+
+    Attributes:
+    -----------
+    name: str
+        the metric name
+    help: str
+        the description exported with the metric
+    label_names: tuple[str, ...]
+        the names of the labels, in the order their values are given to observe()
+    buckets: tuple[float, ...]
+        the increasing upper bounds of the buckets, the +Inf bucket is implied
+    series: dict[tuple[str, ...], list]
+        [label values, [bucket counts, sum, count]] : the bucket counts are not cumulative until they are exported
+    '''
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        '''
+        add <value> to the distribution of <label_values>
+        '''
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        '''
+        return the lines of the metric in the Prometheus text format
+        '''
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names + ("le",), label_values + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    '''
+    The metrics of one server process, exported together
+
+    Attributes:
+    -----------
+    metrics: list[Counter | Gauge | Histogram]
+        every metric, in the order they are exported
+    '''
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Counter:
+        '''
+        add a new counter to the registry and return it
+        '''
+        metric = Counter(name, help, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read) -> Gauge:
+        '''
+        add a new gauge read by <read>() to the registry and return it
+        '''
+        metric = Gauge(name, help, read)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        '''
+        add a new histogram to the registry and return it
+        '''
+        metric = Histogram(name, help, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        '''
+        return every metric in the Prometheus text exposition format
+        '''
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+
+def format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...]) -> str:
+    '''
+    return the {name="value",...} part of a sample, empty if there are no labels
+    '''
+    if not label_names:
+        return ""
+    pairs = (f'{name}="{escape_label(value)}"' for name, value in zip(label_names, label_values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape_label(value: str) -> str:
+    '''
+    return <value> escaped for a label value
+    '''
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    '''
+    return <value> as a sample value, whole numbers without a fraction
+    '''
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def http_response(request: bytes, registry: Registry) -> bytes | None:
+    '''
+    return the HTTP response to <request> received on the admin port, None if the request is not complete yet
+    GET /metrics returns <registry> in the Prometheus text format, any other path is not found
+    '''
+    if b"\r\n\r\n" not in request and b"\n\n" not in request:
+        if len(request) > MAX_REQUEST_LENGTH:
+            return b"HTTP/1.0 431 Request Header Fields Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+        return None
+    request_line = request.split(b"\n", 1)[0].split()
+    if len(request_line) < 2 or request_line[0] != b"GET":
+        return b"HTTP/1.0 405 Method Not Allowed\r\nAllow: GET\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+    if request_line[1].split(b"?", 1)[0] != b"/metrics":
+        return b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+    body = registry.render()
+    header = (
+        "HTTP/1.0 200 OK\r\n"
+        "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    return header.encode() + body
+
+
+def create_admin_socket(port: int) -> socket.socket:
+    '''
+    create the non-blocking listening socket of the admin port, which only accepts local connections
+    '''
+    admin_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    admin_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    admin_socket.bind(("localhost", port))
+    admin_socket.setblocking(False)
+    admin_socket.listen()
+    return admin_socket
+
+
+def start_logging(level: str) -> None:
+    '''
+    send every log record of at least <level> through a queue to a thread that writes it to stdout,
+    so that logging never blocks the event loop on the terminal
+    called again in a forked worker, whose copy of the writing thread does not run
+    '''
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level)
+    log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    log_listener.start()
+
+
+def stop_logging() -> None:
+    '''
+    write the log records still queued and stop the writing thread
+    '''
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+atexit.register(stop_logging)
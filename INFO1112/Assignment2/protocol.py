@@ -0,0 +1,156 @@
+MAX_LINE_LENGTH: int = 8192 # the longest protocol line (without its newline) a peer may send
+RECV_SIZE: int = 8192 # the number of bytes read from a socket at once
+
+
+class LineTooLong(Exception):
+    '''
+    raised when a peer sends more than <max_line_length> bytes without a newline, or announces a longer frame
+    '''
+
+
+class LineBuffer:
+    '''
+    An incremental newline framer for a byte stream
+
+    Bytes are fed in as they are received, complete lines are returned without their
+    trailing newline and any incomplete fragment is kept until a later feed completes it,
+    so a line may be split across or share a read with any number of other lines.
+
+    Attributes:
+    -----------
+    buffer: bytearray
+        the received bytes that do not form a complete line yet
+    scanned: int
+        the number of bytes at the start of <buffer> already known to contain no newline
+    max_line_length: int
+        the longest line accepted, a longer line raises LineTooLong
+    '''
+    def __init__(self, max_line_length: int = MAX_LINE_LENGTH):
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.max_line_length = max_line_length
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[bytes]:
+        '''
+        append <data> to the buffer and return every line it completes
+        raise LineTooLong if a line grows longer than <max_line_length>
+        '''
+        buffer = self.buffer
+        buffer += data
+        lines = []
+        start = 0
+        position = self.scanned
+        with memoryview(buffer) as view:
+            while True:
+                newline = buffer.find(b"\n", position)
+                if newline < 0:
+                    break
+                if newline - start > self.max_line_length:
+                    raise LineTooLong(newline - start)
+                lines.append(bytes(view[start:newline]))
+                start = position = newline + 1
+        if start:
+            # drop every consumed line at once instead of once per line
+            del buffer[:start]
+        self.scanned = len(buffer)
+        if self.scanned > self.max_line_length:
+            raise LineTooLong(self.scanned)
+        return lines
+
+    def pending(self) -> int:
+        '''
+        return the number of buffered bytes that do not form a complete line yet
+        '''
+        return len(self.buffer)
+
+
+class FrameBuffer:
+    '''
+    An incremental framer for a stream of length-prefixed binary frames, see wire.py
+
+    A frame is a 2-byte big-endian payload length followed by the payload. It is used like a
+    LineBuffer once a connection switched to binary frames with HELLO, feed() returns the payloads.
+
+    Attributes:
+    -----------
+    buffer: bytearray
+        the received bytes that do not form a complete frame yet
+    max_frame_length: int
+        the longest payload accepted, a longer one raises LineTooLong
+    '''
+    def __init__(self, max_frame_length: int = MAX_LINE_LENGTH):
+        self.buffer = bytearray()
+        self.max_frame_length = max_frame_length
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[bytes]:
+        '''
+        append <data> to the buffer and return the payload of every frame it completes
+        raise LineTooLong if a frame is longer than <max_frame_length>
+        '''
+        buffer = self.buffer
+        buffer += data
+        payloads = []
+        start = 0
+        with memoryview(buffer) as view:
+            while len(buffer) - start >= 2:
+                length = (buffer[start] << 8) | buffer[start + 1]
+                if length > self.max_frame_length:
+                    raise LineTooLong(length)
+                end = start + 2 + length
+                if end > len(buffer):
+                    break
+                payloads.append(bytes(view[start + 2:end]))
+                start = end
+        if start:
+            del buffer[:start]
+        return payloads
+
+    def pending(self) -> int:
+        '''
+        return the number of buffered bytes that do not form a complete frame yet
+        '''
+        return len(self.buffer)
+
+
+class Dispatcher:
+    '''
+    A table of protocol handlers keyed by verb
+
+    A line is split on ":" once and the handler registered for its first field receives
+    the fields, so adding a verb only takes registering its handler.
+
+    Attributes:
+    -----------
+    handlers: dict[str, tuple[callable, dict]]
+        [verb, (handler, options)] : the handler of each verb and the options it was registered with
+    '''
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, verb: str, **options):
+        '''
+        return a decorator registering a function as the handler of <verb>,
+        <options> are kept for the caller to interpret (e.g. whether the verb requires a login)
+        '''
+        def decorator(handler):
+            self.handlers[verb] = (handler, options)
+            return handler
+        return decorator
+
+    def lookup(self, verb: str) -> tuple | None:
+        '''
+        return the (handler, options) registered for <verb>, or None
+        '''
+        return self.handlers.get(verb)
+
+    def dispatch(self, line: str, *context) -> bool:
+        '''
+        split <line> and call the handler of its verb with <context> followed by the fields
+        return False if no handler is registered for the verb
+        '''
+        fields = line.split(":")
+        entry = self.handlers.get(fields[0])
+        if entry is None:
+            return False
+        entry[0](*context, fields)
+        return True
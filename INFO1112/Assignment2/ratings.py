@@ -0,0 +1,360 @@
+import os
+import queue
+import bisect
+import struct
+import logging
+import threading
+
+
+INITIAL_RATING: float = 1500.0 # the Elo rating of a player before their first rated game
+K_FACTOR: float = 32.0 # the most rating points a game can move
+BUCKET_SIZE: int = 512 # a bucket of a RankedList is split in two once it holds twice as many keys
+LOG_MAGIC: bytes = b"TTTRATE1" # the first bytes of a ratings log
+RECORD_HEADER: struct.Struct = struct.Struct("<dIIIH") # rating, wins, losses, draws and the length of the username that follows
+COMPACT_THRESHOLD: int = 4096 # the log is rewritten once it holds this many records more than twice the number of players
+READ_CHUNK_SIZE: int = 1 << 20 # the number of bytes of the log read at once when it is loaded
+
+logger: logging.Logger = logging.getLogger("ratings")
+
+Stats = tuple[float, int, int, int] # a player's rating, wins, losses and draws
+
+
+class RatingsError(Exception):
+    '''
+    raised when a ratings log cannot be opened, the message completes "Error: <ratings path> ..."
+    '''
+
+
+class RankedList:
+    '''
+    A sorted list that also finds the rank of a key and the key at a rank in O(log n)
+
+    The keys are kept in sorted buckets of up to 2 * BUCKET_SIZE keys, found by bisecting the last key of
+    every bucket, like the sorted room names of rooms.RoomRegistry but without moving the whole list on
+    every change. A Fenwick tree over the bucket lengths counts the keys before a bucket, it is rebuilt
+    when a bucket is split or emptied, once every BUCKET_SIZE changes at most.
+
+    Attributes:
+    -----------
+    buckets: list[list]
+        the keys in sorted order, split into buckets
+    maxes: list
+        the last key of every bucket
+    tree: list[int]
+        the Fenwick tree of the bucket lengths, tree[i] sums the lengths of the buckets (i & (i - 1), i]
+    size: int
+        the number of keys
+    '''
+    def __init__(self, keys: list | None = None):
+        keys = sorted(keys) if keys else []
+        self.buckets = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.size = len(keys)
+        self.build_tree()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def build_tree(self) -> None:
+        '''
+        rebuild the Fenwick tree of the bucket lengths in O(number of buckets)
+        '''
+        tree = [0] + [len(bucket) for bucket in self.buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add_to_tree(self, bucket_index: int, amount: int) -> None:
+        '''
+        add <amount> to the length of the bucket <bucket_index> in the Fenwick tree
+        '''
+        tree = self.tree
+        i = bucket_index + 1
+        while i < len(tree):
+            tree[i] += amount
+            i += i & -i
+
+    def count_before(self, bucket_index: int) -> int:
+        '''
+        return the number of keys in the buckets before the bucket <bucket_index>
+        '''
+        tree = self.tree
+        count = 0
+        i = bucket_index
+        while i:
+            count += tree[i]
+            i &= i - 1
+        return count
+
+    def insert(self, key) -> None:
+        '''
+        add <key>
+        '''
+        self.size += 1
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.build_tree()
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        bisect.insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self.buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self.maxes[i:i + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+            self.build_tree()
+        else:
+            self.add_to_tree(i, 1)
+
+    def remove(self, key) -> None:
+        '''
+        remove <key>, which must be present
+        '''
+        i = bisect.bisect_left(self.maxes, key)
+        bucket = self.buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        self.size -= 1
+        if bucket:
+            self.maxes[i] = bucket[-1]
+            self.add_to_tree(i, -1)
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+            self.build_tree()
+
+    def rank(self, key) -> int:
+        '''
+        return the number of keys smaller than <key>
+        '''
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            return self.size
+        return self.count_before(i) + bisect.bisect_left(self.buckets[i], key)
+
+    def slice(self, offset: int, limit: int) -> list:
+        '''
+        return up to <limit> keys in sorted order from the <offset>-th
+        '''
+        if offset >= self.size or limit <= 0:
+            return []
+        # descend the Fenwick tree to the bucket holding the <offset>-th key
+        tree = self.tree
+        i = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        remaining = offset
+        while step:
+            if i + step < len(tree) and tree[i + step] <= remaining:
+                i += step
+                remaining -= tree[i]
+            step >>= 1
+        keys = []
+        for bucket in self.buckets[i:]:
+            keys.extend(bucket[remaining:remaining + limit - len(keys)])
+            remaining = 0
+            if len(keys) == limit:
+                break
+        return keys
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    '''
+    return the score a player rated <rating> is expected to make against a player rated <opponent_rating>
+    '''
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def encode_record(username: str, stats: Stats) -> bytes:
+    '''
+    return the log record of the stats <stats> of <username>
+    '''
+    name = username.encode()
+    return RECORD_HEADER.pack(*stats, len(name)) + name
+
+
+class Ratings:
+    '''
+    The Elo rating and win/loss/draw counts of every player who finished a rated game, ranked by rating
+
+    A game updates both players at once, their ranks then cost O(log n) to find and a page of the
+    leaderboard O(log n) plus its length. The new stats are appended to a log by a writing thread,
+    which writes every record queued meanwhile at once, the latest record of a player wins on loading.
+    Once the log holds COMPACT_THRESHOLD more records than twice the number of players, the writing thread
+    rewrites it from a copy of the stats taken when it was asked to, so a rewrite is paid for by as many appends.
+
+    Attributes:
+    -----------
+    path: str
+        the path of the log
+    players: dict[str, Stats]
+        [username, (rating, wins, losses, draws)] : the stats of every rated player
+    ranking: RankedList
+        the (-rating, username) key of every player, the best rated first
+    n_records: int
+        the number of records the log will hold once everything queued is written
+    writes: queue.SimpleQueue
+        the records to append, lists of (username, stats) pairs to rewrite the log with, and None, which stops the writing thread
+    writer: threading.Thread
+        the thread writing the log
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.players = {}
+        try:
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                with open(path, "wb") as f:
+                    f.write(LOG_MAGIC)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.n_records = self.load()
+            log = open(path, "ab")
+        except OSError as e:
+            raise RatingsError(f"cannot be opened: {e.strerror}.")
+        self.ranking = RankedList([(-stats[0], username) for username, stats in self.players.items()])
+        self.writes = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self.write_records, args=(log,), name="ratings", daemon=True)
+        self.writer.start()
+        self.compact_if_needed()
+
+    def load(self) -> int:
+        '''
+        read the latest stats of every player from the log and return the number of records it holds,
+        a torn last record is cut off
+        raise RatingsError if it is not a ratings log
+        '''
+        n_records = 0
+        with open(self.path, "rb") as f:
+            if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+                raise RatingsError("is not a ratings log.")
+            data = b""
+            position = 0
+            offset = len(LOG_MAGIC)
+            at_eof = False
+            while True:
+                if len(data) - position < RECORD_HEADER.size + 0xFFFF and not at_eof:
+                    chunk = f.read(READ_CHUNK_SIZE)
+                    at_eof = not chunk
+                    data = data[position:] + chunk
+                    position = 0
+                if len(data) - position < RECORD_HEADER.size:
+                    break
+                rating, wins, losses, draws, name_length = RECORD_HEADER.unpack_from(data, position)
+                end = position + RECORD_HEADER.size + name_length
+                if end > len(data):
+                    break
+                self.players[data[end - name_length:end].decode(errors="replace")] = (rating, wins, losses, draws)
+                n_records += 1
+                offset += end - position
+                position = end
+        if offset < os.path.getsize(self.path):
+            logger.warning("cutting %d bytes of a torn record off %s", os.path.getsize(self.path) - offset, self.path)
+            os.truncate(self.path, offset)
+        return n_records
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def get(self, username: str) -> Stats | None:
+        '''
+        return the stats of <username>, or None if they have not finished a rated game
+        '''
+        return self.players.get(username)
+
+    def rank(self, username: str) -> int | None:
+        '''
+        return the rank of <username> from 1, the best rated, or None if they have not finished a rated game
+        '''
+        stats = self.players.get(username)
+        if stats is None:
+            return None
+        return self.ranking.rank((-stats[0], username)) + 1
+
+    def top(self, offset: int, limit: int) -> list[tuple[int, str, Stats]]:
+        '''
+        return the rank, username and stats of up to <limit> players from the <offset>-th best rated
+        '''
+        return [(offset + i + 1, username, self.players[username]) for i, (_, username) in enumerate(self.ranking.slice(offset, limit))]
+
+    def record_game(self, p1_username: str, p2_username: str, p1_score: float) -> None:
+        '''
+        update the ratings and counts of both players of a game in which player 1 scored <p1_score>:
+        1 for a win, 0.5 for a draw and 0 for a loss
+        '''
+        p1_stats = self.players.get(p1_username, (INITIAL_RATING, 0, 0, 0))
+        p2_stats = self.players.get(p2_username, (INITIAL_RATING, 0, 0, 0))
+        change = K_FACTOR * (p1_score - expected_score(p1_stats[0], p2_stats[0]))
+        records = []
+        for username, stats, score, rating_change in ((p1_username, p1_stats, p1_score, change), (p2_username, p2_stats, 1 - p1_score, -change)):
+            rating, wins, losses, draws = stats
+            if username in self.players:
+                self.ranking.remove((-rating, username))
+            new_stats = (rating + rating_change, wins + (score == 1), losses + (score == 0), draws + (score == 0.5))
+            self.players[username] = new_stats
+            self.ranking.insert((-new_stats[0], username))
+            records.append(encode_record(username, new_stats))
+        self.writes.put(b"".join(records))
+        self.n_records += 2
+        self.compact_if_needed()
+
+    def compact_if_needed(self) -> None:
+        '''
+        ask the writing thread to rewrite the log once it holds COMPACT_THRESHOLD more records than twice the number of players
+        '''
+        if self.n_records < 2 * len(self.players) + COMPACT_THRESHOLD:
+            return
+        # the copy is taken in the caller's thread so that the stats can keep changing meanwhile
+        self.writes.put(list(self.players.items()))
+        self.n_records = len(self.players)
+
+    def write_records(self, log) -> None:
+        '''
+        the writing thread: append the queued records in batches, every record queued while a batch is being written
+        goes in the next one, and rewrite the log when asked to, until None is queued
+        '''
+        failed = False
+        while True:
+            item = self.writes.get()
+            batch = []
+            while isinstance(item, bytes):
+                batch.append(item)
+                try:
+                    item = self.writes.get_nowait()
+                except queue.Empty:
+                    item = ...
+            try:
+                if batch and not failed:
+                    log.write(b"".join(batch))
+                    log.flush()
+                    os.fsync(log.fileno())
+                if isinstance(item, list) and not failed:
+                    log.close()
+                    log = self.rewrite(item)
+            except OSError as e:
+                # the stats stay in memory until the server stops
+                logger.error("error writing ratings to %s, the following games are not kept: %s", self.path, e)
+                failed = True
+            if item is None:
+                log.close()
+                return
+
+    def rewrite(self, players: list[tuple[str, Stats]]):
+        '''
+        atomically replace the log with one record per player of <players> and return it opened for appending
+        '''
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(LOG_MAGIC)
+            f.write(b"".join(encode_record(username, stats) for username, stats in players))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        return open(self.path, "ab")
+
+    def close(self) -> None:
+        '''
+        write every queued record and stop the writing thread
+        '''
+        self.writes.put(None)
+        self.writer.join()
@@ -0,0 +1,139 @@
+import bisect
+import itertools
+
+
+PENDING: str = "PENDING"
+FULL: str = "FULL"
+LIST_LIMIT: int = 256 # the most room names in a ROOMLIST response without a cursor
+PAGE_LIMIT: int = 100 # the most room names in one page of a ROOMLIST response with a cursor
+
+
+class RoomRegistry:
+    '''
+    The index of every room by name, with the ROOMLIST responses cached
+
+    A room is looked up with a single probe of <states> whether it is pending or full, and the encoded
+    ROOMLIST responses are only rebuilt after a room is created, filled or destroyed. The room names
+    are also kept sorted, so that a page of the rooms starting with a prefix is found by bisection.
+
+    Attributes:
+    -----------
+    pending: dict[str, object]
+        [room_name, room_object] : the rooms of this process waiting for a second player, in creation order
+    full: dict[str, object]
+        [room_name, room_object] : the rooms of this process with 2 players, in the order they filled
+    remote_pending: dict[str, None]
+        in sharded mode, the names of the pending rooms of the other workers (a dict for its order)
+    remote_full: dict[str, None]
+        in sharded mode, the names of the full rooms of the other workers
+    states: dict[str, str]
+        [room_name, PENDING or FULL] : the state of every room, including the rooms of the other workers
+    room_lists: dict[str, bytes]
+        [mode, response] : the encoded ROOMLIST responses built since the rooms last changed
+    sorted_names: dict[str, list[str]]
+        [mode, names] : the sorted names of the rooms a client can join as "PLAYER" (the pending rooms) or "VIEWER" (all rooms)
+    '''
+    def __init__(self):
+        self.pending = {}
+        self.full = {}
+        self.remote_pending = {}
+        self.remote_full = {}
+        self.states = {}
+        self.room_lists = {}
+        self.sorted_names = {"PLAYER": [], "VIEWER": []}
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __contains__(self, room_name: str) -> bool:
+        return room_name in self.states
+
+    def lookup(self, room_name: str) -> tuple[str, object] | None:
+        '''
+        return the state of the room named <room_name> and the room itself (None if another worker hosts it),
+        or None if there is no such room
+        '''
+        state = self.states.get(room_name)
+        if state is None:
+            return None
+        if state == PENDING:
+            return state, self.pending.get(room_name)
+        return state, self.full.get(room_name)
+
+    def add(self, room_name: str, room: object) -> None:
+        '''
+        add a new pending room of this process
+        '''
+        self.pending[room_name] = room
+        self.set_state(room_name, PENDING)
+
+    def fill(self, room_name: str) -> object:
+        '''
+        move the pending room named <room_name> to the full rooms and return it
+        '''
+        room = self.full[room_name] = self.pending.pop(room_name)
+        self.set_state(room_name, FULL)
+        return room
+
+    def remove(self, room_name: str) -> None:
+        '''
+        remove the room named <room_name> of this process
+        '''
+        self.pending.pop(room_name, None)
+        self.full.pop(room_name, None)
+        self.set_state(room_name, None)
+
+    def update_remote(self, room_name: str, state: str | None) -> None:
+        '''
+        record the new state of a room of another worker, None if it is gone
+        '''
+        self.remote_pending.pop(room_name, None)
+        self.remote_full.pop(room_name, None)
+        if state == PENDING:
+            self.remote_pending[room_name] = None
+        elif state == FULL:
+            self.remote_full[room_name] = None
+        self.set_state(room_name, state)
+
+    def set_state(self, room_name: str, state: str | None) -> None:
+        '''
+        record that the room named <room_name> is now <state> (None if it is gone),
+        update the sorted names and drop the cached room lists
+        '''
+        old_state = self.states.pop(room_name, None)
+        if state is not None:
+            self.states[room_name] = state
+        for mode, names in self.sorted_names.items():
+            was_listed = old_state is not None and (mode == "VIEWER" or old_state == PENDING)
+            is_listed = state is not None and (mode == "VIEWER" or state == PENDING)
+            if was_listed and not is_listed:
+                del names[bisect.bisect_left(names, room_name)]
+            elif is_listed and not was_listed:
+                bisect.insort(names, room_name)
+        self.room_lists.clear()
+
+    def room_list(self, mode: str) -> bytes:
+        '''
+        return the encoded ROOMLIST response listing the rooms a client can join as <mode> ("PLAYER" or "VIEWER")
+        '''
+        response = self.room_lists.get(mode)
+        if response is None:
+            if mode == "PLAYER":
+                names = itertools.chain(self.pending, self.remote_pending)
+            else:
+                names = itertools.chain(self.pending, self.full, self.remote_pending, self.remote_full)
+            # a client reads at most protocol.MAX_LINE_LENGTH bytes per line, so a larger lobby has to be paged
+            names = itertools.islice(names, LIST_LIMIT)
+            response = self.room_lists[mode] = f"ROOMLIST:ACKSTATUS:0:{','.join(names)}\n".encode()
+        return response
+
+    def page(self, mode: str, offset: int, limit: int, prefix: str = "") -> tuple[list[str], int]:
+        '''
+        return up to <limit> names, in sorted order from the <offset>-th, of the rooms a client can join as <mode>
+        whose names start with <prefix>, and the number of such rooms
+        '''
+        names = self.sorted_names[mode]
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\U0010ffff", start) if prefix else len(names)
+        first = min(start + offset, end)
+        return names[first:min(first + limit, end)], end - start
@@ -1,10 +1,105 @@
 import sys
+import time
+import atexit
 import socket
-import select
+import selectors
 import os
 import json
+import queue
+import logging
+import base64
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
 import bcrypt
 import tictactoe
+import bot
+import rooms
+import timers
+import metrics
+import protocol
+import wire
+import userstore
+import history
+import ratings
+import cluster
+
+
+class Client:
+    '''
+    A class to hold the per-connection state of a client
+
+    Attributes:
+    -----------
+    client_socket: socket.socket
+        the client socket, used for communication
+    address: tuple
+        the client's address as returned by accept()
+    reader: protocol.LineBuffer
+        the receive buffer, which frames the received bytes into complete protocol lines
+    outbound: collections.deque[bytes | memoryview]
+        the encoded messages waiting for the socket to become writable, a message sent to a whole room
+        is the same bytes object in every recipient's queue
+    outbound_bytes: int
+        the total number of bytes in <outbound>
+    closing: bool
+        whether the client is scheduled to be disconnected at the end of the current loop iteration
+    auth_pending: bool
+        whether a LOGIN/REGISTER password job of the client is running in the worker pool
+    deferred: list[bytes]
+        the lines received while <auth_pending>, processed in order once the job completes
+    handoff: tuple[int, list[bytes]] or None
+        in sharded mode, the worker the client is being handed off to and the lines it should process,
+        set while the client's queued messages are being flushed before the handoff
+    connected_at: float
+        the loop time the client connected at, an unauthenticated client must log in within unauthenticated_timeout of it
+    last_active: float
+        the loop time the client last sent a complete line or its game ended, see client_idle_deadline()
+    idle_timer: timers.Timer or None
+        the timer that checks whether the client has been idle for too long
+    binary: bool
+        whether the client switched to binary frames with HELLO, see wire.py
+    known_names: dict[int, str]
+        [name_id, username] : the name ids the binary client has been sent the NAME frame of
+    deltas: bool
+        whether the client asked with HELLO for a MOVE after every move instead of a BOARDSTATUS
+    '''
+    def __init__(self, client_socket: socket.socket, address: tuple):
+        self.client_socket = client_socket
+        self.address = address
+        self.reader = protocol.LineBuffer()
+        self.outbound = collections.deque()
+        self.outbound_bytes = 0
+        self.closing = False
+        self.auth_pending = False
+        self.deferred = []
+        self.handoff = None
+        self.connected_at = loop_time
+        self.last_active = loop_time
+        self.idle_timer = None
+        self.binary = False
+        self.known_names = {}
+        self.deltas = False
+
+
+class AdminConnection:
+    '''
+    A class to hold the state of a connection to the admin port, which is served by the loop without blocking
+
+    Attributes:
+    -----------
+    request: bytearray
+        the bytes of the HTTP request received so far
+    response: memoryview or None
+        the part of the HTTP response not written yet, None until the request is complete
+    timer: timers.Timer or None
+        the timer that closes the connection ADMIN_TIMEOUT after it was accepted
+    '''
+    def __init__(self):
+        self.request = bytearray()
+        self.response = None
+        self.timer = None
 
 
 class Room:
@@ -27,11 +122,37 @@ class Room:
         a list containing the client sockets of viewers in the room
     current_turn_player: str
         username of the player who is currently in turn
-    board: list[list[str]] or None
-        the current tic tac toe board as a 2D list of strings
+    board_size: int
+        the number of rows (and columns) of the board
+    win_length: int
+        the number of markers in a row that wins the game
+    board: tictactoe.BitBoard or tictactoe.GridBoard or None
+        the current board
+    has_bot: bool
+        whether player 2 is the bot, which has no client socket
+    turn_deadline: float
+        the loop time the current turn player forfeits at if it has not placed a marker
+    turn_timer: timers.Timer or None
+        the timer that checks the turn clock, see start_turn_clock()
+    seq: int
+        the number of markers placed, the sequence number of the last MOVE
+    stale_viewers: set[socket.socket]
+        the delta viewers that could not keep up, whose updates are merged into one SNAPSHOT, see send_message()
+    coalesce_timer: timers.Timer or None
+        the timer that sends the <stale_viewers> their SNAPSHOT
+    join_snapshot: str
+        the INPROGRESS and SNAPSHOT lines a viewer joining the running game is sent, kept current by update_join_snapshot()
+    join_snapshot_encodings: dict[bool, tuple[bytes, tuple]]
+        [binary, encoded] : <join_snapshot> encoded for text or binary clients, dropped whenever it changes
+    moves: list[tuple[int, int, str]]
+        the column, row and marker of every move, kept for the game log
+    started: float
+        the UNIX time the game began at
     '''
-    def __init__(self, room_name: str):
+    def __init__(self, room_name: str, board_size: int = tictactoe.BOARD_SIZE, win_length: int = tictactoe.BOARD_SIZE):
         self.room_name = room_name
+        self.board_size = board_size
+        self.win_length = win_length
         self.p1_username = ""
         self.p2_username = ""
         self.p1_client_socket = None
@@ -39,6 +160,16 @@ class Room:
         self.viewers_client_socket = []
         self.current_turn_player = ""
         self.board = None
+        self.has_bot = False
+        self.turn_deadline = 0.0
+        self.turn_timer = None
+        self.seq = 0
+        self.stale_viewers = set()
+        self.coalesce_timer = None
+        self.join_snapshot = ""
+        self.join_snapshot_encodings = {}
+        self.moves = []
+        self.started = 0.0
 
     def has_player1(self) -> bool:
         '''
@@ -90,16 +221,41 @@ class Room:
         '''
         self.viewers_client_socket.append(client_socket)
 
-    def send_message(self, message: str) -> None:
+    def remove_viewer(self, client_socket: socket.socket) -> None:
+        '''
+        remove a viewer from the room if present
+        '''
+        if client_socket in self.viewers_client_socket:
+            self.viewers_client_socket.remove(client_socket)
+        self.stale_viewers.discard(client_socket)
+
+    def send_message(self, message: str, delta_message: str | None = None) -> None:
         '''
         send a message to all clients in the room, including both players and viewers
+        a client that asked for deltas is sent <delta_message> instead if there is one, unless it is a viewer
+        whose queue is not empty: its updates are then merged into one SNAPSHOT sent coalesce_window later
+        each message is encoded once (and framed once for binary clients) and the same buffer is queued for every client
         '''
-        p1_client_socket = self.p1_client_socket
-        p2_client_socket = self.p2_client_socket
-        p1_client_socket.sendall(message.encode())
-        p2_client_socket.sendall(message.encode())
-        for viewer_client_socket in self.viewers_client_socket:
-            viewer_client_socket.sendall(message.encode())
+        encodings = {}
+        for i, client_socket in enumerate(itertools.chain((self.p1_client_socket, self.p2_client_socket), self.viewers_client_socket)):
+            client = clients.get(client_socket)
+            if client is None or client.closing:
+                continue
+            delta = delta_message is not None and client.deltas
+            if delta and i >= 2 and (client.outbound and coalesce_window or client_socket in self.stale_viewers):
+                if client_socket not in self.stale_viewers:
+                    self.stale_viewers.add(client_socket)
+                    if self.coalesce_timer is None:
+                        self.coalesce_timer = timer_wheel.schedule(loop_time + coalesce_window, send_coalesced_snapshots, self)
+                coalesced_updates.inc()
+                continue
+            key = (delta, client.binary)
+            encoded = encodings.get(key)
+            if encoded is None:
+                text = delta_message if delta else message
+                encoded = encodings[key] = wire.encode_message(text, name_table) if client.binary else (text.encode(), ())
+            # e.g. a BOARDSTATUS names nobody, every binary client is sent the same frame
+            write_to_client(client_socket, client, binary_frames(client, encoded) if encoded[1] else encoded[0])
 
     def swap_turn(self) -> None:
         '''
@@ -116,20 +272,44 @@ class Room:
         '''
         p1_client_socket = self.p1_client_socket
         p2_client_socket = self.p2_client_socket
-        client_room.pop(p1_client_socket)
-        client_room.pop(p2_client_socket)
+        client_room.pop(p1_client_socket, None)
+        if not self.has_bot:
+            client_room.pop(p2_client_socket, None)
         for viewer_client_socket in self.viewers_client_socket:
             client_room.pop(viewer_client_socket, None)
-        full_rooms.pop(self.room_name)
+        if self.turn_timer is not None:
+            timer_wheel.cancel(self.turn_timer)
+        if self.coalesce_timer is not None:
+            timer_wheel.cancel(self.coalesce_timer)
+        # the players and viewers are back in the lobby, whose idle timeout starts now
+        for client_socket in [p1_client_socket, p2_client_socket] + self.viewers_client_socket:
+            client = clients.get(client_socket)
+            if client is not None:
+                client.last_active = loop_time
+        room_registry.remove(self.room_name)
+        publish_room(self.room_name, None)
 
-pending_rooms: dict[str, Room] = {} # [room_name, room_object] : stores rooms with insufficient players
-full_rooms: dict[str, Room] = {} # [room_name, room_object] : stores rooms with 2 players
+logger: logging.Logger = logging.getLogger("server")
+room_registry: rooms.RoomRegistry = rooms.RoomRegistry() # stores every room by name (those of the other workers in sharded mode) and the cached room lists
+protocol_handlers: protocol.Dispatcher = protocol.Dispatcher() # the handler of each protocol verb, see process_lines() for the options
+UNKNOWN_VERB_OPTIONS: dict = {"requires_auth": True, "requires_room": True} # how lines with an unregistered verb are answered
 
 
 server_port: int = 0
+admin_port: int = 0 # the local port the metrics are served at (plus worker_id in sharded mode), 0 if disabled
+n_workers: int = 1 # the number of worker processes, rooms are partitioned across them by cluster.room_shard()
+worker_id: int = 0 # the id of this worker process
+unauthenticated_timeout: float = 30 # the seconds a client may stay connected without logging in, 0 if forever
+lobby_timeout: float = 600 # the seconds a logged in client outside a game may stay silent, 0 if forever
+turn_timeout: float = 120 # the seconds a player may take to place a marker before forfeiting, 0 if forever
+coalesce_window: float = 0.25 # the seconds the updates of a delta viewer that cannot keep up are merged for, 0 if never merged
+peers: dict[int, cluster.Peer] = {} # [worker_id, peer_object] : in sharded mode, the channels to the other workers
 user_database_path: str = ""
-user_database: list[dict] = []
-existing_username: set = set() # stores every already-existing usernames
+user_store: userstore.UserStore = None # every user record, indexed by username
+registering_usernames: set[str] = set() # stores the usernames whose REGISTER is being hashed
+unsynced_registrations: list[socket.socket] = [] # store the clients whose new user record is waiting for the next sync
+game_log: history.GameLog = None # every finished game, None if no game history is kept
+player_ratings: ratings.Ratings = None # the rating of every player, None if no ratings are kept
 
 
 def config(args: list[str]) -> None:
@@ -181,48 +361,317 @@ def config(args: list[str]) -> None:
     if not os.path.exists(user_database_path):
         sys.stderr.write("Error: <user database path> doesn't exist.\n")
         sys.exit(1)
-    try:
-        with open(user_database_path) as fileobj:
-            data = json.load(fileobj)
-    except json.decoder.JSONDecodeError:
-        sys.stderr.write("Error: <user database path> is not in a valid JSON format.\n")
+    # optional: run <workers> processes with the rooms partitioned across them
+    global n_workers
+    n_workers = data.get("workers", 1)
+    if not isinstance(n_workers, int) or isinstance(n_workers, bool) or n_workers < 1:
+        sys.stderr.write("Error: workers must be a positive integer\n")
+        sys.exit(1)
+    if n_workers > 1 and not hasattr(os, "fork"):
+        sys.stderr.write("Error: workers > 1 is not supported on this platform\n")
         sys.exit(1)
-    if not isinstance(data, list):
-        sys.stderr.write("Error: <user database path> is not a JSON array.\n")
+    if n_workers > 1 and not user_database_path.lower().endswith(userstore.SQLITE_EXTENSIONS):
+        # every worker must see the users registered through the others
+        sys.stderr.write("Error: workers > 1 requires an SQLite <user database path>\n")
         sys.exit(1)
-    for account in data:
-        keys = sorted(account.keys())
-        if keys != ["password", "username"]:
-            sys.stderr.write("Error: <user database path> contains invalid user record formats.\n")
+
+    # optional: serve the metrics in the Prometheus text format at http://localhost:<adminPort>/metrics
+    global admin_port
+    admin_port = data.get("adminPort", 0)
+    if not isinstance(admin_port, int) or isinstance(admin_port, bool) or not (admin_port == 0 or 1024 <= admin_port <= 65535 - n_workers + 1):
+        sys.stderr.write("Error: adminPort number out of range\n")
+        sys.exit(1)
+    # optional: the least severe log messages written, DEBUG includes every received buffer
+    log_level = data.get("logLevel", "INFO")
+    if log_level not in metrics.LOG_LEVELS:
+        sys.stderr.write(f"Error: logLevel must be one of {', '.join(metrics.LOG_LEVELS)}\n")
+        sys.exit(1)
+    metrics.start_logging(log_level)
+
+    # optional: the seconds a client may stay connected without logging in, idle in the lobby (or waiting in a room it created),
+    # and take to place a marker before it forfeits, 0 disables a timeout
+    global unauthenticated_timeout, lobby_timeout, turn_timeout
+    timeouts = []
+    for key, default in (("unauthenticatedTimeout", unauthenticated_timeout), ("lobbyTimeout", lobby_timeout), ("turnTimeout", turn_timeout)):
+        timeout = data.get(key, default)
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or timeout < 0:
+            sys.stderr.write(f"Error: {key} must be a non-negative number of seconds\n")
             sys.exit(1)
+        timeouts.append(timeout)
+    unauthenticated_timeout, lobby_timeout, turn_timeout = timeouts
+    # optional: the seconds the board updates of a delta viewer whose queue is not empty are merged into one SNAPSHOT,
+    # 0 queues every update
+    global coalesce_window
+    coalesce_window = data.get("coalesceWindow", coalesce_window)
+    if not isinstance(coalesce_window, (int, float)) or isinstance(coalesce_window, bool) or coalesce_window < 0:
+        sys.stderr.write("Error: coalesceWindow must be a non-negative number of seconds\n")
+        sys.exit(1)
+
+    # optional: cache the parsed JSON user database in a binary file next to it for faster restarts
+    user_index_cache = data.get("userIndexCache", False)
+    if not isinstance(user_index_cache, bool):
+        sys.stderr.write("Error: userIndexCache must be true or false\n")
+        sys.exit(1)
+
+    # optional: append every finished game to the log at <gameHistory>, which HISTORY and REPLAY read
+    game_history_path = data.get("gameHistory", "")
+    if not isinstance(game_history_path, str):
+        sys.stderr.write("Error: gameHistory must be a path\n")
+        sys.exit(1)
+    if game_history_path and n_workers > 1:
+        # the games of a user are played in the workers of their rooms
+        sys.stderr.write("Error: gameHistory requires workers = 1\n")
+        sys.exit(1)
+    # optional: rate the players of every game without the bot and keep their ratings at <ratings>, which LEADERBOARD reads
+    ratings_path = data.get("ratings", "")
+    if not isinstance(ratings_path, str):
+        sys.stderr.write("Error: ratings must be a path\n")
+        sys.exit(1)
+    if ratings_path and n_workers > 1:
+        sys.stderr.write("Error: ratings requires workers = 1\n")
+        sys.exit(1)
 
-    global user_database
-    user_database = data
-    for user in user_database:
-        existing_username.add(user["username"])
+    global user_store
+    try:
+        user_store = userstore.open_user_store(user_database_path, user_index_cache)
+    except userstore.UserDatabaseError as e:
+        sys.stderr.write(f"Error: <user database path> {e}\n")
+        sys.exit(1)
+    global game_log
+    if game_history_path:
+        try:
+            game_log = history.GameLog(os.path.abspath(os.path.expanduser(game_history_path)))
+        except history.GameLogError as e:
+            sys.stderr.write(f"Error: <game history path> {e}\n")
+            sys.exit(1)
+        atexit.register(game_log.close)
+    global player_ratings
+    if ratings_path:
+        try:
+            player_ratings = ratings.Ratings(os.path.abspath(os.path.expanduser(ratings_path)))
+        except ratings.RatingsError as e:
+            sys.stderr.write(f"Error: <ratings path> {e}\n")
+            sys.exit(1)
+        atexit.register(player_ratings.close)
 
 
 def create_client_socket(server_socket: socket.socket) -> None:
     '''
-    create a new client socket and add it to global tracking databases
+    accept every pending connection and add the new client sockets to global tracking databases
     '''
-    client_socket, client_address = server_socket.accept()
-    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-    client_socket.setblocking(False)
-    sockets_list.append(client_socket)
-    clients[client_socket] = client_address
-    print(f"new connection from {client_address}")
+    while True:
+        try:
+            client_socket, client_address = server_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. EMFILE, the connection stays in the backlog until a descriptor frees up
+            logger.warning("error accepting connection: %s", e)
+            return
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_socket.setblocking(False)
+        client = Client(client_socket, client_address)
+        clients[client_socket] = client
+        selector.register(client_socket, selectors.EVENT_READ, client)
+        watch_idle(client_socket)
+        logger.debug("new connection from %s", client_address)
+
+
+def send_to_client(client_socket: socket.socket, message: str | bytes) -> None:
+    '''
+    send <message> to a client without blocking, a message already encoded is queued as is
+    a binary client is sent the message as a frame instead
+    '''
+    client = clients.get(client_socket)
+    if client is None or client.closing:
+        return
+    if client.binary:
+        encoded = wire.encode_message(message if isinstance(message, str) else message.decode(), name_table)
+        write_to_client(client_socket, client, binary_frames(client, encoded))
+        return
+    write_to_client(client_socket, client, message.encode() if isinstance(message, str) else message)
+
+
+def binary_frames(client: Client, encoded: tuple[bytes, tuple[tuple[int, str], ...]]) -> bytes:
+    '''
+    return the frame of the encoded message <encoded> to send to a binary client,
+    preceded by the NAME frames of the name ids it uses that the client does not know yet
+    '''
+    frame, refs = encoded
+    known_names = client.known_names
+    missing = [name_id for name_id, name in refs if known_names.get(name_id) != name]
+    if not missing:
+        return frame
+    for name_id in missing:
+        known_names[name_id] = name_table.names[name_id]
+    return b"".join([name_table.frames[name_id] for name_id in missing] + [frame])
+
+
+def write_to_client(client_socket: socket.socket, client: Client, data: bytes) -> None:
+    '''
+    send the encoded <data> to a client without blocking
+    whatever the socket does not accept right away is queued until it becomes writable
+    a client whose queue grows past OUTBOUND_HIGH_WATER_MARK is scheduled to be disconnected
+    '''
+    if not client.outbound:
+        # nothing is queued, so try to send right away
+        try:
+            sent = client_socket.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            logger.info("error sending data to %s: %s", client.address, e)
+            close_client(client_socket)
+            return
+        if sent == len(data):
+            return
+        data = memoryview(data)[sent:]
+    client.outbound.append(data)
+    client.outbound_bytes += len(data)
+    if len(client.outbound) == 1:
+        # the queue was empty, start waiting for the socket to become writable
+        watch_client(client_socket)
+    if client.outbound_bytes > OUTBOUND_HIGH_WATER_MARK:
+        logger.info("%s is too slow to receive, %d bytes queued", client.address, client.outbound_bytes)
+        slow_client_disconnects.inc()
+        close_client(client_socket)
+
+
+def flush_client(client_socket: socket.socket) -> bool:
+    '''
+    send as much of a client's queued messages as the socket accepts,
+    up to SENDMSG_MAX_BUFFERS queued messages are written with a single sendmsg call
+    return False if there is an error raised
+    return True otherwise
+    '''
+    client = clients[client_socket]
+    outbound = client.outbound
+    while outbound:
+        batch = list(itertools.islice(outbound, SENDMSG_MAX_BUFFERS))
+        try:
+            sent = client_socket.sendmsg(batch)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError as e:
+            logger.info("error sending data to %s: %s", client.address, e)
+            return False
+        client.outbound_bytes -= sent
+        for chunk in batch:
+            if sent < len(chunk):
+                # the socket is full, keep the unsent part of the chunk
+                outbound[0] = memoryview(chunk)[sent:]
+                return True
+            sent -= len(chunk)
+            outbound.popleft()
+    if client.handoff:
+        # everything is sent, the client can move to its worker
+        hand_off_client(client_socket)
+        return True
+    # everything is sent, stop waiting for the socket to become writable
+    watch_client(client_socket)
+    return True
+
+
+def watch_client(client_socket: socket.socket) -> None:
+    '''
+    update the events the selector waits for on a client socket:
+    readable unless a password job or a handoff of the client is pending, writable while messages are queued
+    '''
+    client = clients[client_socket]
+    events = 0 if client.auth_pending or client.handoff else selectors.EVENT_READ
+    if client.outbound:
+        events |= selectors.EVENT_WRITE
+    registered = client_socket in selector.get_map()
+    if not events:
+        if registered:
+            selector.unregister(client_socket)
+    elif registered:
+        selector.modify(client_socket, events, client)
+    else:
+        selector.register(client_socket, events, client)
+
+
+def client_idle_deadline(client_socket: socket.socket) -> float | None:
+    '''
+    return the loop time a client times out at in its current state, None if it cannot time out in it:
+    an unauthenticated client must log in within unauthenticated_timeout of connecting however much it sends,
+    a client in the lobby or waiting in the room it created must send a line every lobby_timeout,
+    a player of a game is held to its turn clock instead and a viewer only watches
+    '''
+    client = clients[client_socket]
+    if client_socket not in auth_clients:
+        return client.connected_at + unauthenticated_timeout if unauthenticated_timeout else None
+    room_name = client_room.get(client_socket)
+    if room_name is not None:
+        state, room = room_registry.lookup(room_name)
+        if state == rooms.FULL or client_socket in room.get_viewers():
+            return None
+    return client.last_active + lobby_timeout if lobby_timeout else None
+
+
+def watch_idle(client_socket: socket.socket) -> None:
+    '''
+    schedule the check of whether a client is idle for too long at its deadline
+    a client that cannot time out right now is checked again lobby_timeout later, in case it went back to the lobby
+    '''
+    client = clients[client_socket]
+    deadline = client_idle_deadline(client_socket)
+    if deadline is None:
+        if not lobby_timeout:
+            return
+        deadline = loop_time + lobby_timeout
+    client.idle_timer = timer_wheel.schedule(deadline, check_idle, client_socket, client)
+
+
+def check_idle(client_socket: socket.socket, client: Client) -> None:
+    '''
+    called by the timer wheel: disconnect the client if it has been idle past its deadline, otherwise check again at the new deadline
+    only the last_active time is updated when the client sends a line, so the timer is moved at most once per timeout
+    '''
+    if clients.get(client_socket) is not client or client.closing:
+        return
+    client.idle_timer = None
+    deadline = client_idle_deadline(client_socket)
+    if deadline is not None and deadline <= loop_time and not client.auth_pending:
+        logger.info("%s timed out", client.address)
+        idle_disconnects.inc()
+        close_client(client_socket)
+        return
+    if deadline is not None and deadline <= loop_time:
+        # its LOGIN is being checked, look again once the job had time to finish
+        client.idle_timer = timer_wheel.schedule(loop_time + 1, check_idle, client_socket, client)
+        return
+    watch_idle(client_socket)
+
+
+def close_client(client_socket: socket.socket) -> None:
+    '''
+    schedule a client to be disconnected once the current loop iteration is over
+    '''
+    client = clients[client_socket]
+    if not client.closing:
+        client.closing = True
+        closing_clients.append(client_socket)
+
+
+def remove_closing_clients() -> None:
+    '''
+    disconnect every client scheduled by close_client()
+    '''
+    while closing_clients:
+        client_socket = closing_clients.popleft()
+        if client_socket in clients:
+            remove_client_socket(client_socket)
 
 
 def remove_client_socket(client_socket: socket.socket) -> None:
     '''
     remove a client socket from global tracking databases
     '''
-    print(f"disconnection from {clients[client_socket]}")
+    logger.debug("disconnection from %s", clients[client_socket].address)
     if client_socket in client_room:
-        room_name = client_room[client_socket]
-        if room_name in full_rooms:
-            room = full_rooms[room_name]
+        state, room = room_registry.lookup(client_room[client_socket])
+        if state == rooms.FULL:
             p1_username = room.get_player1()[0]
             p2_username = room.get_player2()[0]
             client_username = auth_clients[client_socket]
@@ -230,90 +679,366 @@ def remove_client_socket(client_socket: socket.socket) -> None:
                 gameend_protocol(room, "2", p2_username)
             elif client_username == p2_username:
                 gameend_protocol(room, "2", p1_username)
-    sockets_list.remove(client_socket)
-    del clients[client_socket]
+            else:
+                room.remove_viewer(client_socket)
+        elif room.get_player1()[1] is client_socket:
+            # the creator of a pending room left, nobody could play in it
+            room.destroy()
+        else:
+            room.remove_viewer(client_socket)
+    if client_socket in selector.get_map():
+        selector.unregister(client_socket)
+    client = clients.pop(client_socket)
+    if client.idle_timer is not None:
+        timer_wheel.cancel(client.idle_timer)
     auth_clients.pop(client_socket, None)
     client_room.pop(client_socket, None)
+    client_socket.close()
+
+
+def submit_auth_job(client_socket: socket.socket, function, args: tuple, on_complete, *context) -> bool:
+    '''
+    run the password function <function>(*<args>) in the worker pool so that bcrypt does not block the loop
+    on_complete(client_socket, result, *context) is called by the loop once it finishes, with None as the result if it raises
+    the client's following lines are deferred and its socket is not read until then
+    return False without running it if AUTH_WAITING_LIMIT jobs are already waiting, the caller rejects the request
+    '''
+    if len(auth_jobs_waiting) >= AUTH_WAITING_LIMIT:
+        auth_jobs_rejected.inc()
+        return False
+    client = clients[client_socket]
+    client.auth_pending = True
+    watch_client(client_socket)
+    job = (client_socket, function, args, on_complete, context, time.perf_counter())
+    if auth_jobs_running < AUTH_QUEUE_LIMIT:
+        start_auth_job(job)
+    else:
+        auth_jobs_waiting.append(job)
+    return True
+
+
+def start_auth_job(job: tuple) -> None:
+    '''
+    hand a password job to the worker pool
+    '''
+    global auth_jobs_running
+    auth_jobs_running += 1
+    _, function, args, _, _, _ = job
+    future = auth_executor.submit(function, *args)
+    future.add_done_callback(lambda future: finish_auth_job(job, future))
+
+
+def finish_auth_job(job: tuple, future: concurrent.futures.Future) -> None:
+    '''
+    called from a worker thread: pass the finished job to the loop and wake it up
+    '''
+    auth_results.put((job, future))
+    try:
+        auth_wakeup_send.send(b"\0")
+    except (BlockingIOError, InterruptedError):
+        # the loop already has a wakeup pending
+        pass
+
+
+def complete_auth_jobs() -> None:
+    '''
+    run the completion of every finished password job and resume the clients waiting on them
+    '''
+    global auth_jobs_running
+    try:
+        while auth_wakeup_recv.recv(4096):
+            pass
+    except (BlockingIOError, InterruptedError):
+        pass
+    finished = []
+    while True:
+        try:
+            job, future = auth_results.get_nowait()
+        except queue.Empty:
+            break
+        auth_jobs_running -= 1
+        if auth_jobs_waiting:
+            start_auth_job(auth_jobs_waiting.popleft())
+        client_socket, _, _, on_complete, context, submitted = job
+        password_job_duration.observe(time.perf_counter() - submitted)
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error("error in password job: %s", e)
+            result = None
+        on_complete(client_socket, result, *context)
+        finished.append(client_socket)
+    # every REGISTER completed above shares one sync, and is acknowledged before the client's next line
+    sync_user_store()
+    for client_socket in finished:
+        client = clients.get(client_socket)
+        if client is None or client.closing:
+            continue
+        client.auth_pending = False
+        watch_client(client_socket)
+        deferred = client.deferred
+        client.deferred = []
+        process_lines(client_socket, deferred)
+
+
+@protocol_handlers.register("HELLO", malformed="HELLO:ACKSTATUS:1\n")
+def hello_protocol(client_socket: socket.socket, data: list[str]) -> None:
+    '''
+    handle the HELLO protocol: HELLO:BINARY switches the connection to binary frames right after the acknowledgement,
+    HELLO:TEXT keeps the text lines, either is only accepted before logging in
+    HELLO:<mode>:DELTA also asks for a MOVE after every move, and a SNAPSHOT of the board every SNAPSHOT_INTERVAL moves,
+    instead of a BOARDSTATUS
+    '''
+    client = clients[client_socket]
+    if len(data) not in (2, 3) or data[1] not in (wire.BINARY, wire.TEXT) or len(data) == 3 and data[2] != wire.DELTA or client.binary or client_socket in auth_clients:
+        send_to_client(client_socket, "HELLO:ACKSTATUS:1\n")
+        return
+    send_to_client(client_socket, "HELLO:ACKSTATUS:0\n")
+    client.deltas = len(data) == 3
+    if data[1] == wire.BINARY:
+        client.binary = True
+        client.reader = protocol.FrameBuffer()
 
 
-def login_protocol(client_socket: socket.socket, data: str) -> None:
+@protocol_handlers.register("LOGIN", malformed="LOGIN:ACKSTATUS:3\n")
+def login_protocol(client_socket: socket.socket, data: list[str]) -> None:
     '''
     handle the LOGIN protocol
     '''
-    data = data.split(":")
     if len(data) != 3:
-        client_socket.sendall("LOGIN:ACKSTATUS:3\n".encode())
+        send_to_client(client_socket, "LOGIN:ACKSTATUS:3\n")
         return
     _, username, password = data
-    for user in user_database:
-        if user["username"] != username:
-            continue
-        if bcrypt.checkpw(password.encode(), user["password"].encode()):
-            client_socket.sendall("LOGIN:ACKSTATUS:0\n".encode())
-            auth_clients[client_socket] = username
-            return
-        client_socket.sendall("LOGIN:ACKSTATUS:2\n".encode())
+    password_hash = user_store.get_password(username)
+    if password_hash is None:
+        # username not found in user database
+        send_to_client(client_socket, "LOGIN:ACKSTATUS:1\n")
         return
-    # username not found in user database
-    client_socket.sendall("LOGIN:ACKSTATUS:1\n".encode())
+    if not submit_auth_job(client_socket, bcrypt.checkpw, (password.encode(), password_hash.encode()), complete_login, username):
+        # too many password jobs are waiting, the client may try again
+        send_to_client(client_socket, "LOGIN:ACKSTATUS:2\n")
 
 
-def create_user_record(username: str, password: str) -> None:
+def complete_login(client_socket: socket.socket, password_matches: bool | None, username: str) -> None:
     '''
-    create a new user recode and add it to the user database file
+    send the LOGIN acknowledgement once the password has been checked
     '''
-    user_record = {"username":username, "password":bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()}
-    user_database.append(user_record)
-    existing_username.add(username)
-    with open(user_database_path, "w") as f:
-        f.write("[\n")
-        for i, user in enumerate(user_database):
-            username = user["username"]
-            password = user["password"]
-            f.write("\t{\n")
-            f.write(f'\t\t"username": "{username}",\n')
-            f.write(f'\t\t"password": "{password}"\n')
-            f.write("\t}")
-            if i < len(user_database)-1:
-                f.write(",")
-            f.write("\n")
-        f.write("]")
+    if client_socket not in clients:
+        return
+    if password_matches:
+        send_to_client(client_socket, "LOGIN:ACKSTATUS:0\n")
+        auth_clients[client_socket] = username
+    else:
+        send_to_client(client_socket, "LOGIN:ACKSTATUS:2\n")
 
 
-def register_protocol(client_socket: socket.socket, data: str) -> None:
+@protocol_handlers.register("REGISTER", malformed="REGISTER:ACKSTATUS:2\n")
+def register_protocol(client_socket: socket.socket, data: list[str]) -> None:
     '''
     handle the REGISTER protocol
     '''
-    data = data.split(":")
     if len(data) != 3:
-        client_socket.sendall("REGISTER:ACKSTATUS:2\n".encode())
+        send_to_client(client_socket, "REGISTER:ACKSTATUS:2\n")
         return
     _, username, password = data
-    if username not in existing_username:
-        create_user_record(username, password)
-        client_socket.sendall("REGISTER:ACKSTATUS:0\n".encode())
-    else:
-        client_socket.sendall("REGISTER:ACKSTATUS:1\n".encode())
+    if username in user_store or username in registering_usernames:
+        send_to_client(client_socket, "REGISTER:ACKSTATUS:1\n")
+        return
+    if not submit_auth_job(client_socket, bcrypt.hashpw, (password.encode(), bcrypt.gensalt()), complete_register, username):
+        # too many password jobs are waiting, the client may try again
+        send_to_client(client_socket, "REGISTER:ACKSTATUS:2\n")
+        return
+    # reserve the username while its password is being hashed
+    registering_usernames.add(username)
 
 
-def roomlist_protocol(client_socket: socket.socket, data: str) -> None:
+def complete_register(client_socket: socket.socket, password_hash: bytes | None, username: str) -> None:
     '''
-    handle the ROOMLIST protocol
+    store the new user record and send the REGISTER acknowledgement once the password has been hashed
     '''
-    data = data.split(":")
-    if len(data) != 2:
-        client_socket.sendall("ROOMLIST:ACKSTATUS:1\n".encode())
+    registering_usernames.discard(username)
+    if password_hash is None:
+        # e.g. bcrypt refuses passwords longer than 72 bytes
+        send_to_client(client_socket, "REGISTER:ACKSTATUS:2\n")
         return
-    mode = data[1]
-    if mode not in("PLAYER", "VIEWER"):
-        client_socket.sendall("ROOMLIST:ACKSTATUS:1\n".encode())
+    try:
+        user_store.add(username, password_hash.decode())
+    except userstore.UserExistsError:
+        # registered through another worker meanwhile
+        send_to_client(client_socket, "REGISTER:ACKSTATUS:1\n")
         return
-    room_list = ""
-    if mode == "PLAYER":
-        room_list = ",".join(pending_rooms)
-    elif mode == "VIEWER":
-        room_list = ",".join(list(pending_rooms.keys()) + list(full_rooms.keys()))
-    client_socket.sendall(f"ROOMLIST:ACKSTATUS:0:{room_list}\n".encode())
+    except userstore.UserDatabaseError as e:
+        logger.error("error adding user %s: %s %s", username, user_database_path, e)
+        send_to_client(client_socket, "REGISTER:ACKSTATUS:2\n")
+        return
+    # acknowledged once the record is durable, see complete_auth_jobs()
+    unsynced_registrations.append(client_socket)
+
+
+def sync_user_store() -> None:
+    '''
+    make the records added since the last call durable with a single sync,
+    then acknowledge their REGISTER, which fails if the sync does (e.g. the disk is full)
+    '''
+    if not unsynced_registrations:
+        return
+    try:
+        user_store.sync()
+    except (OSError, userstore.UserDatabaseError) as e:
+        logger.error("error syncing %s: %s", user_database_path, e)
+        status = "2"
+    else:
+        status = "0"
+    for client_socket in unsynced_registrations:
+        send_to_client(client_socket, f"REGISTER:ACKSTATUS:{status}\n")
+    unsynced_registrations.clear()
+
+
+def publish_room(room_name: str, state: str | None) -> None:
+    '''
+    in sharded mode, tell the other workers that a room of this worker is now "PENDING", "FULL" or gone (None)
+    '''
+    for peer in peers.values():
+        peer.send({"type": "room", "name": room_name, "state": state})
+        watch_peer(peer)
+
+
+def update_remote_room(room_name: str, state: str | None) -> None:
+    '''
+    record the new state of a room of another worker
+    '''
+    room_registry.update_remote(room_name, state)
+
+
+def route_room_request(client_socket: socket.socket, data: list[str], following: list[bytes]) -> bool:
+    '''
+    in sharded mode, hand a client sending a CREATE/JOIN line for a room hosted by another worker
+    off to that worker, along with the lines <following> it
+    return True if the line was dealt with, False if this worker should handle it
+    '''
+    if not peers or len(data) < 2:
+        return False
+    shard = cluster.room_shard(data[1], n_workers)
+    if shard == worker_id:
+        return False
+    if client_socket in client_room:
+        # the room this client is in lives on this worker, so the client cannot move
+        send_to_client(client_socket, "CREATE:ACKSTATUS:3\n" if data[0] == "CREATE" else "JOIN:ACKSTATUS:2\n")
+        return True
+    client = clients[client_socket]
+    line = wire.encode_request(data) if client.binary else ":".join(data).encode()
+    client.handoff = (shard, [line] + following)
+    if client.outbound:
+        # the queued messages are sent first, see flush_client()
+        watch_client(client_socket)
+        return True
+    hand_off_client(client_socket)
+    return True
+
+
+def hand_off_client(client_socket: socket.socket) -> None:
+    '''
+    pass a client's socket, login and unprocessed input to the worker in its <handoff>
+    and forget about it in this worker
+    '''
+    client = clients[client_socket]
+    shard, lines = client.handoff
+    message = {
+        "type": "handoff",
+        "username": auth_clients[client_socket],
+        "address": list(client.address),
+        "lines": [base64.b64encode(line).decode() for line in lines],
+        "partial": base64.b64encode(client.reader.buffer).decode(),
+        "binary": client.binary,
+        "deltas": client.deltas,
+    }
+    if client_socket in selector.get_map():
+        selector.unregister(client_socket)
+    del clients[client_socket]
+    if client.idle_timer is not None:
+        timer_wheel.cancel(client.idle_timer)
+    auth_clients.pop(client_socket, None)
+    logger.debug("handing %s off to worker %d", client.address, shard)
+    peers[shard].send(message, [client_socket])
+    watch_peer(peers[shard])
+
+
+def adopt_client(message: dict, fds: list[int]) -> None:
+    '''
+    take over a client handed off by another worker and process its pending lines
+    '''
+    client_socket = socket.socket(fileno=fds[0])
+    for fd in fds[1:]:
+        os.close(fd)
+    client_socket.setblocking(False)
+    client = Client(client_socket, tuple(message["address"]))
+    clients[client_socket] = client
+    auth_clients[client_socket] = message["username"]
+    selector.register(client_socket, selectors.EVENT_READ, client)
+    watch_idle(client_socket)
+    client.deltas = message["deltas"]
+    if message["binary"]:
+        # the name ids of this worker are new to the client, their NAME frames are sent again
+        client.binary = True
+        client.reader = protocol.FrameBuffer()
+    client.reader.feed(base64.b64decode(message["partial"]))
+    process_lines(client_socket, [base64.b64decode(line) for line in message["lines"]])
+
+
+def watch_peer(peer: cluster.Peer) -> None:
+    '''
+    wait for a peer channel to become writable while it has queued messages
+    '''
+    events = selectors.EVENT_READ
+    if peer.outbound:
+        events |= selectors.EVENT_WRITE
+    selector.modify(peer.channel_socket, events, peer)
+
+
+def process_peer(peer: cluster.Peer, events: int) -> None:
+    '''
+    flush the queued messages of a peer channel and handle the messages received from it
+    '''
+    if events & selectors.EVENT_WRITE:
+        peer.flush()
+        watch_peer(peer)
+    if events & selectors.EVENT_READ:
+        for message, fds in peer.receive():
+            if message["type"] == "room":
+                update_remote_room(message["name"], message["state"])
+            elif message["type"] == "handoff":
+                adopt_client(message, fds)
+
+
+def roomlist_response(registry: rooms.RoomRegistry, data: list[str]) -> str | bytes:
+    '''
+    return the response to the ROOMLIST message <data>:
+    ROOMLIST:<mode> lists the first rooms in creation order,
+    ROOMLIST:<mode>:<offset>:<limit>[:<prefix>] lists a page of the rooms whose names start with <prefix> in sorted order,
+    followed by the number of such rooms
+    '''
+    if len(data) not in (2, 4, 5) or data[1] not in ("PLAYER", "VIEWER"):
+        return "ROOMLIST:ACKSTATUS:1\n"
+    mode = data[1]
+    if len(data) == 2:
+        return registry.room_list(mode)
+    try:
+        offset = int(data[2])
+        limit = int(data[3])
+    except ValueError:
+        return "ROOMLIST:ACKSTATUS:1\n"
+    if offset < 0 or not 1 <= limit <= rooms.PAGE_LIMIT:
+        return "ROOMLIST:ACKSTATUS:1\n"
+    names, n_matching = registry.page(mode, offset, limit, data[4] if len(data) == 5 else "")
+    return f"ROOMLIST:ACKSTATUS:0:{','.join(names)}:{n_matching}\n"
+
+
+@protocol_handlers.register("ROOMLIST", requires_auth=True, malformed="ROOMLIST:ACKSTATUS:1\n")
+def roomlist_protocol(client_socket: socket.socket, data: list[str]) -> None:
+    '''
+    handle the ROOMLIST protocol
+    '''
+    send_to_client(client_socket, roomlist_response(room_registry, data))
 
 
 def valid_room_name(room_name: str) -> bool:
@@ -334,60 +1059,83 @@ def add_client_to_room(client_socket: socket.socket, mode: str, room_name: str)
     the client can be either player or viewer, specified by <mode>
     '''
     client_room[client_socket] = room_name
+    state, room = room_registry.lookup(room_name)
     if mode == "PLAYER":
-        if pending_rooms[room_name].add_player(auth_clients[client_socket], client_socket):
-            full_rooms[room_name] = pending_rooms[room_name]
-            pending_rooms.pop(room_name)
-            begin_protocol(full_rooms[room_name])
+        if room.add_player(auth_clients[client_socket], client_socket):
+            room_registry.fill(room_name)
+            publish_room(room_name, rooms.FULL)
+            begin_protocol(room)
     elif mode == "VIEWER":
-        if room_name in pending_rooms:
-            pending_rooms[room_name].add_viewer(client_socket)
-        elif room_name in full_rooms:
-            full_rooms[room_name].add_viewer(client_socket)
+        room.add_viewer(client_socket)
+        if state == rooms.FULL:
             inprogress_protocol(client_socket)
 
-def create_protocol(client_socket: socket.socket, data: str) -> None:
+
+def board_shape(data: list[str]) -> tuple[int, int] | None:
+    '''
+    return the board size and win length asked for by the CREATE message <data>:
+    CREATE:<room name> is a 3x3 tic tac toe game, CREATE:<room name>:<size>:<win length> a larger board
+    return None if the message is malformed or the board is not supported
+    '''
+    if len(data) == 2:
+        return tictactoe.BOARD_SIZE, tictactoe.BOARD_SIZE
+    if len(data) != 4:
+        return None
+    try:
+        board_size = int(data[2])
+        win_length = int(data[3])
+    except ValueError:
+        return None
+    if not tictactoe.BOARD_SIZE <= board_size <= tictactoe.MAX_BOARD_SIZE or not tictactoe.BOARD_SIZE <= win_length <= board_size:
+        return None
+    return board_size, win_length
+
+
+@protocol_handlers.register("CREATE", requires_auth=True, sharded=True, malformed="CREATE:ACKSTATUS:4\n")
+def create_protocol(client_socket: socket.socket, data: list[str]) -> None:
     '''
     handle the CREATE protocol
     '''
-    data = data.split(":")
-    if len(data) != 2:
-        client_socket.sendall("CREATE:ACKSTATUS:4\n".encode())
+    shape = board_shape(data)
+    if shape is None:
+        send_to_client(client_socket, "CREATE:ACKSTATUS:4\n")
         return
     room_name = data[1]
-    if len(pending_rooms) + len(full_rooms) == ROOMS_LIMIT:
-        client_socket.sendall("CREATE:ACKSTATUS:3\n".encode())
+    if len(room_registry) >= ROOMS_LIMIT:
+        send_to_client(client_socket, "CREATE:ACKSTATUS:3\n")
         return
     if not valid_room_name(room_name):
-        client_socket.sendall("CREATE:ACKSTATUS:1\n".encode())
+        send_to_client(client_socket, "CREATE:ACKSTATUS:1\n")
         return
-    if room_name in pending_rooms or room_name in full_rooms:
-        client_socket.sendall("CREATE:ACKSTATUS:2\n".encode())
+    if room_name in room_registry:
+        send_to_client(client_socket, "CREATE:ACKSTATUS:2\n")
         return
-    pending_rooms[room_name] = Room(room_name)
+    room_registry.add(room_name, Room(room_name, *shape))
+    publish_room(room_name, rooms.PENDING)
     add_client_to_room(client_socket, "PLAYER", room_name)
-    client_socket.sendall("CREATE:ACKSTATUS:0\n".encode())
+    send_to_client(client_socket, "CREATE:ACKSTATUS:0\n")
 
 
-def join_protocol(client_socket: socket.socket, data: str) -> None:
+@protocol_handlers.register("JOIN", requires_auth=True, sharded=True, malformed="JOIN:ACKSTATUS:3\n")
+def join_protocol(client_socket: socket.socket, data: list[str]) -> None:
     '''
     handle the JOIN protocol
     '''
-    data = data.split(":")
     if len(data) != 3:
-        client_socket.sendall("JOIN:ACKSTATUS:3\n".encode())
+        send_to_client(client_socket, "JOIN:ACKSTATUS:3\n")
         return
     _, room_name, mode = data
     if mode not in ("PLAYER", "VIEWER"):
-        client_socket.sendall("JOIN:ACKSTATUS:3\n".encode())
+        send_to_client(client_socket, "JOIN:ACKSTATUS:3\n")
         return
-    if room_name not in pending_rooms and room_name not in full_rooms:
-        client_socket.sendall("JOIN:ACKSTATUS:1\n".encode())
+    entry = room_registry.lookup(room_name)
+    if entry is None or entry[1] is None:
+        send_to_client(client_socket, "JOIN:ACKSTATUS:1\n")
         return
-    if mode == "PLAYER" and room_name not in pending_rooms:
-        client_socket.sendall("JOIN:ACKSTATUS:2\n".encode())
+    if mode == "PLAYER" and entry[0] != rooms.PENDING:
+        send_to_client(client_socket, "JOIN:ACKSTATUS:2\n")
         return
-    client_socket.sendall("JOIN:ACKSTATUS:0\n".encode())
+    send_to_client(client_socket, "JOIN:ACKSTATUS:0\n")
     add_client_to_room(client_socket, mode, room_name)
 
 
@@ -397,32 +1145,145 @@ def begin_protocol(room: Room) -> None:
     '''
     p1_username = room.get_player1()[0]
     p2_username = room.get_player2()[0]
-    room.board = tictactoe.create_board()
-    room.send_message(f"BEGIN:{p1_username}:{p2_username}\n")
+    room.board = tictactoe.create_game_board(room.board_size, room.win_length)
+    room.started = time.time()
+    if room.board_size == tictactoe.BOARD_SIZE and room.win_length == tictactoe.BOARD_SIZE:
+        room.send_message(f"BEGIN:{p1_username}:{p2_username}\n")
+    else:
+        room.send_message(f"BEGIN:{p1_username}:{p2_username}:{room.board_size}:{room.win_length}\n")
+    update_join_snapshot(room, tictactoe.get_board_status(room.board))
+    start_turn_clock(room)
 
 
-def place_protocol(client_socket: socket.socket, data: str) -> None:
+@protocol_handlers.register("PLACE", requires_auth=True, requires_room=True, fields=(3,), malformed="PLACE:ACKSTATUS:1\n")
+def place_protocol(client_socket: socket.socket, data: list[str]) -> None:
     '''
-    handle the PLACE protocol
+    handle the PLACE protocol, a PLACE without an integer column and row is answered with PLACE:ACKSTATUS:1
     '''
-    client_room_name = client_room[client_socket]
-    if client_room_name in pending_rooms:
+    room = room_registry.full.get(client_room[client_socket])
+    if room is None:
         return
-    room = full_rooms[client_room_name]
     username = auth_clients[client_socket]
     p1 = room.get_player1()[0]
     marker = 'X' if username == p1 else 'O'
-    _, col, row = data.split(":")
+    if room.has_bot and username != room.current_turn_player:
+        return
+    _, col, row = data
     col = int(col)
     row = int(row)
-    room.board = tictactoe.put_marker(room.board, row, col, marker)
+    if tictactoe.put_marker(room.board, row, col, marker) is None:
+        return
+    if play_move(room, username, marker, row, col) and room.has_bot:
+        request_bot_move(room)
+
+
+def play_move(room: Room, username: str, marker: str, row: int, col: int) -> bool:
+    '''
+    end the game if the marker <marker> just placed at (<row>, <col>) by <username> won or filled the board,
+    otherwise send the new board
+    return True if the game goes on
+    '''
+    room.seq += 1
+    room.moves.append((col, row, marker))
     if tictactoe.player_wins(marker, room.board):
         gameend_protocol(room, "0", username)
-        return
+        return False
     if tictactoe.players_draw(room.board):
         gameend_protocol(room, "1")
+        return False
+    boardstatus_protocol(room, row, col, marker)
+    return True
+
+
+@protocol_handlers.register("ADDBOT", requires_auth=True, requires_room=True, malformed="ADDBOT:ACKSTATUS:1\n")
+def addbot_protocol(client_socket: socket.socket, data: list[str]) -> None:
+    '''
+    handle the ADDBOT protocol: seat the bot as player 2 of the pending room the client created
+    '''
+    room_name = client_room[client_socket]
+    room = room_registry.pending.get(room_name)
+    if len(data) != 1 or room is None or room.get_player1()[1] is not client_socket or auth_clients[client_socket] == bot.BOT_USERNAME:
+        send_to_client(client_socket, "ADDBOT:ACKSTATUS:1\n")
+        return
+    send_to_client(client_socket, "ADDBOT:ACKSTATUS:0\n")
+    room.has_bot = True
+    room.add_player(bot.BOT_USERNAME, None)
+    room_registry.fill(room_name)
+    publish_room(room_name, rooms.FULL)
+    begin_protocol(room)
+
+
+def request_bot_move(room: Room) -> None:
+    '''
+    let the bot place its marker in <room>: a 3x3 move is looked up right away,
+    a move on a larger board is searched for in bot_executor and placed by complete_bot_moves()
+    '''
+    if isinstance(room.board, tictactoe.BitBoard):
+        place_bot_marker(room, bot.choose_move(room.board, 'O'))
         return
-    boardstatus_protocol(room)
+    future = start_bot_search(bot.copy_board(room.board))
+    future.add_done_callback(lambda future: finish_bot_move(room, future))
+
+
+def start_bot_search(board: tictactoe.GridBoard) -> concurrent.futures.Future:
+    '''
+    search for the bot's move on <board> in a process of bot_executor, which is created on first use so that
+    the workers of sharded mode do not share one, a search takes up to bot.TIME_BUDGET of a CPU and the searches
+    of more rooms than there are CPUs wait for a free process
+    '''
+    global bot_executor
+    if bot_executor is None:
+        # a forked child would inherit the loop's threads and locks mid-use
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        bot_executor = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context(method))
+    try:
+        return bot_executor.submit(bot.choose_move, board, 'O')
+    except concurrent.futures.BrokenExecutor:
+        # a search process died, e.g. killed for its memory, and the pool cannot be used again
+        logger.error("bot search processes stopped, starting new ones")
+        bot_executor.shutdown(wait=False)
+        bot_executor = None
+        return start_bot_search(board)
+
+
+def finish_bot_move(room: Room, future: concurrent.futures.Future) -> None:
+    '''
+    called from a thread of bot_executor: pass the searched move to the loop and wake it up
+    '''
+    bot_results.put((room, future))
+    try:
+        auth_wakeup_send.send(b"\0")
+    except (BlockingIOError, InterruptedError):
+        pass
+
+
+def complete_bot_moves() -> None:
+    '''
+    place every move the bot finished searching for, unless its game ended meanwhile
+    '''
+    while True:
+        try:
+            room, future = bot_results.get_nowait()
+        except queue.Empty:
+            return
+        if room_registry.full.get(room.room_name) is not room:
+            continue
+        try:
+            move = future.result()
+        except Exception as e:
+            logger.error("error in bot search: %s", e)
+            gameend_protocol(room, "2", room.get_player1()[0])
+            continue
+        place_bot_marker(room, move)
+
+
+def place_bot_marker(room: Room, move: tuple[int, int]) -> None:
+    '''
+    place the bot's marker at <move> (row, col) in <room>
+    '''
+    row, col = move
+    tictactoe.put_marker(room.board, row, col, 'O')
+    play_move(room, bot.BOT_USERNAME, 'O', row, col)
 
 
 def gameend_protocol(room: Room, status_code: str, *winner_username) -> None:
@@ -435,25 +1296,207 @@ def gameend_protocol(room: Room, status_code: str, *winner_username) -> None:
     else:
         message = f"GAMEEND:{board_status}:{status_code}\n"
     room.send_message(message)
+    record_game(room, status_code, winner_username[0] if winner_username else None)
+    rate_game(room, status_code, winner_username[0] if winner_username else None)
     room.destroy()
 
 
-def boardstatus_protocol(room: Room) -> None:
+def record_game(room: Room, status_code: str, winner_username: str | None) -> None:
+    '''
+    append the game of <room>, which just ended with <status_code>, to the game log if one is kept
+    '''
+    if game_log is None:
+        return
+    if winner_username is None:
+        winner = history.NO_WINNER
+    else:
+        winner = 1 if winner_username == room.p1_username else 2
+    game_log.append(history.Game(room.room_name, room.p1_username, room.p2_username, room.board_size, room.win_length,
+                                 room.moves, room.started, time.time(), int(status_code), winner))
+    games_recorded.inc()
+
+
+def boardstatus_protocol(room: Room, row: int, col: int, marker: str) -> None:
     '''
-    handle the BOARDSTATUS protocol
+    handle the BOARDSTATUS protocol, and the MOVE protocol for the clients that asked for deltas:
+    a MOVE carries the marker <marker> just placed at (<row>, <col>), every SNAPSHOT_INTERVAL-th move is a SNAPSHOT instead
     '''
     board_status = tictactoe.get_board_status(room.board)
     room.swap_turn()
-    print(f"sending BOARDSTATUS message, the next turn player is {room.current_turn_player}")
+    update_join_snapshot(room, board_status)
+    start_turn_clock(room)
+    logger.debug("sending BOARDSTATUS message, the next turn player is %s", room.current_turn_player)
     message = f"BOARDSTATUS:{board_status}\n"
-    room.send_message(message)
+    if room.seq % SNAPSHOT_INTERVAL:
+        delta_message = f"MOVE:{room.seq}:{col}:{row}:{MARKER_DIGITS[marker]}\n"
+    else:
+        delta_message = f"SNAPSHOT:{room.seq}:{board_status}\n"
+    room.send_message(message, delta_message)
+
+
+def snapshot_message(room: Room) -> str:
+    '''
+    return the SNAPSHOT message of the board of <room>, the MOVEs following it start from sequence number <room.seq> + 1
+    '''
+    return f"SNAPSHOT:{room.seq}:{tictactoe.get_board_status(room.board)}\n"
+
+
+def update_join_snapshot(room: Room, board_status: str) -> None:
+    '''
+    rewrite the lines a viewer joining <room> is sent after a move or BEGIN, <board_status> is the board as of now
+    the encodings are made again by the next viewer joining, so a move costs one string whether or not anyone joins
+    '''
+    p1_username, p2_username = room.p1_username, room.p2_username
+    current_turn_player = room.current_turn_player
+    opposing_player = p1_username if current_turn_player == p2_username else p2_username
+    room.join_snapshot = f"INPROGRESS:{current_turn_player}:{opposing_player}\nSNAPSHOT:{room.seq}:{board_status}\n"
+    room.join_snapshot_encodings.clear()
+
+
+def send_coalesced_snapshots(room: Room) -> None:
+    '''
+    called by the timer wheel: send the SNAPSHOT of the board to the viewers of <room> whose updates were merged
+    '''
+    room.coalesce_timer = None
+    stale_viewers = room.stale_viewers
+    room.stale_viewers = set()
+    if room_registry.full.get(room.room_name) is not room:
+        return
+    message = snapshot_message(room)
+    for client_socket in stale_viewers:
+        send_to_client(client_socket, message)
+
+
+def rate_game(room: Room, status_code: str, winner_username: str | None) -> None:
+    '''
+    update the ratings of the players of <room>, whose game just ended with <status_code>, if ratings are kept
+    a game against the bot, or between two connections of the same user, is not rated
+    '''
+    if player_ratings is None or room.has_bot or room.p1_username == room.p2_username:
+        return
+    if status_code == "1":
+        p1_score = 0.5
+    else:
+        p1_score = 1.0 if winner_username == room.p1_username else 0.0
+    player_ratings.record_game(room.p1_username, room.p2_username, p1_score)
+
+
+@protocol_handlers.register("LEADERBOARD", requires_auth=True, malformed="LEADERBOARD:ACKSTATUS:1\n")
+def leaderboard_protocol(client_socket: socket.socket, data: list[str]) -> None:
+    '''
+    handle the LEADERBOARD protocol: LEADERBOARD:TOP:<offset>:<limit> lists a page of the best rated players,
+    LEADERBOARD:RANK:<username> the rank of a player, both followed by the number of rated players and
+    :<rank>:<username>:<rating>:<wins>:<losses>:<draws> for each player listed
+    '''
+    if player_ratings is None:
+        send_to_client(client_socket, "LEADERBOARD:ACKSTATUS:2\n")
+        return
+    if len(data) == 4 and data[1] == "TOP":
+        try:
+            offset = int(data[2])
+            limit = int(data[3])
+        except ValueError:
+            send_to_client(client_socket, "LEADERBOARD:ACKSTATUS:1\n")
+            return
+        if offset < 0 or not 1 <= limit <= LEADERBOARD_PAGE_LIMIT:
+            send_to_client(client_socket, "LEADERBOARD:ACKSTATUS:1\n")
+            return
+        entries = player_ratings.top(offset, limit)
+    elif len(data) == 3 and data[1] == "RANK":
+        rank = player_ratings.rank(data[2])
+        if rank is None:
+            send_to_client(client_socket, "LEADERBOARD:ACKSTATUS:3\n")
+            return
+        entries = [(rank, data[2], player_ratings.get(data[2]))]
+    else:
+        send_to_client(client_socket, "LEADERBOARD:ACKSTATUS:1\n")
+        return
+    fields = "".join(f":{rank}:{username}:{rating:.0f}:{wins}:{losses}:{draws}" for rank, username, (rating, wins, losses, draws) in entries)
+    send_to_client(client_socket, f"LEADERBOARD:ACKSTATUS:0:{len(player_ratings)}{fields}\n")
+
+
+@protocol_handlers.register("HISTORY", requires_auth=True, malformed="HISTORY:ACKSTATUS:1\n")
+def history_protocol(client_socket: socket.socket, data: list[str]) -> None:
+    '''
+    handle the HISTORY protocol: HISTORY:<USER|ROOM>:<name>:<offset>:<limit> lists a page of the ids of the games
+    a user played or that were played in a room, newest first, followed by the number of such games
+    '''
+    if game_log is None:
+        send_to_client(client_socket, "HISTORY:ACKSTATUS:2\n")
+        return
+    if len(data) != 5 or data[1] not in ("USER", "ROOM"):
+        send_to_client(client_socket, "HISTORY:ACKSTATUS:1\n")
+        return
+    try:
+        offset = int(data[3])
+        limit = int(data[4])
+    except ValueError:
+        send_to_client(client_socket, "HISTORY:ACKSTATUS:1\n")
+        return
+    if offset < 0 or not 1 <= limit <= HISTORY_PAGE_LIMIT:
+        send_to_client(client_socket, "HISTORY:ACKSTATUS:1\n")
+        return
+    index = game_log.by_username if data[1] == "USER" else game_log.by_room
+    game_ids, n_games = game_log.games(index, data[2], offset, limit)
+    send_to_client(client_socket, f"HISTORY:ACKSTATUS:0:{','.join(map(str, game_ids))}:{n_games}\n")
+
+
+@protocol_handlers.register("REPLAY", requires_auth=True, malformed="REPLAY:ACKSTATUS:1\n")
+def replay_protocol(client_socket: socket.socket, data: list[str]) -> None:
+    '''
+    handle the REPLAY protocol: REPLAY:<game id> is acknowledged with the room name and the UNIX times the game began
+    and ended at, followed by the messages a viewer joining before the first move was sent: INPROGRESS, a SNAPSHOT
+    of the empty board, a BOARDSTATUS (or a MOVE for a delta client) per move and GAMEEND, all in one write
+    '''
+    if game_log is None:
+        send_to_client(client_socket, "REPLAY:ACKSTATUS:2\n")
+        return
+    if client_socket in client_room:
+        # the replay would be mixed up with the game in the room
+        send_to_client(client_socket, "REPLAY:ACKSTATUS:3\n")
+        return
+    try:
+        game = game_log.get(int(data[1])) if len(data) == 2 else None
+    except ValueError:
+        game = None
+    if game is None:
+        send_to_client(client_socket, "REPLAY:ACKSTATUS:1\n")
+        return
+    client = clients[client_socket]
+    cells = ["0"] * (game.board_size * game.board_size)
+    messages = [
+        f"REPLAY:ACKSTATUS:0:{data[1]}:{game.room_name}:{game.started:.0f}:{game.ended:.0f}\n",
+        f"INPROGRESS:{game.p1_username}:{game.p2_username}\n",
+        f"SNAPSHOT:0:{''.join(cells)}\n",
+    ]
+    for seq, (col, row, marker) in enumerate(game.moves, 1):
+        cells[row * game.board_size + col] = str(MARKER_DIGITS[marker])
+        if seq == len(game.moves) and game.status != 2:
+            # the move that won or filled the board was followed by GAMEEND only
+            break
+        if client.deltas:
+            messages.append(f"MOVE:{seq}:{col}:{row}:{MARKER_DIGITS[marker]}\n")
+        else:
+            messages.append(f"BOARDSTATUS:{''.join(cells)}\n")
+    winner_username = game.winner_username()
+    if winner_username is None:
+        messages.append(f"GAMEEND:{''.join(cells)}:{game.status}\n")
+    else:
+        messages.append(f"GAMEEND:{''.join(cells)}:{game.status}:{winner_username}\n")
+    if client.binary:
+        write_to_client(client_socket, client, b"".join(binary_frames(client, wire.encode_message(message, name_table)) for message in messages))
+    else:
+        write_to_client(client_socket, client, "".join(messages).encode())
 
 
-def forfeit_protocol(client_socket: socket.socket) -> None:
+@protocol_handlers.register("FORFEIT", requires_auth=True, requires_room=True)
+def forfeit_protocol(client_socket: socket.socket, data: list[str]) -> None:
     '''
-    handle the FORFEIT protocol
+    handle the FORFEIT protocol, a player waiting in a pending room has no game to forfeit
     '''
-    room = full_rooms[client_room[client_socket]]
+    room = room_registry.full.get(client_room[client_socket])
+    if room is None:
+        return
     username = auth_clients[client_socket]
     p1_username = room.get_player1()[0]
     p2_username = room.get_player2()[0]
@@ -461,16 +1504,57 @@ def forfeit_protocol(client_socket: socket.socket) -> None:
     gameend_protocol(room, "2", opponent)
 
 
+def start_turn_clock(room: Room) -> None:
+    '''
+    give the current turn player of <room> turn_timeout seconds to place a marker
+    the room keeps one timer, which is moved on to the new deadline when it fires early
+    '''
+    if not turn_timeout:
+        return
+    room.turn_deadline = loop_time + turn_timeout
+    if room.turn_timer is None:
+        room.turn_timer = timer_wheel.schedule(room.turn_deadline, check_turn_clock, room)
+
+
+def check_turn_clock(room: Room) -> None:
+    '''
+    called by the timer wheel: the current turn player of <room> forfeits if its turn clock ran out
+    '''
+    room.turn_timer = None
+    if room_registry.full.get(room.room_name) is not room:
+        return
+    if room.has_bot and room.current_turn_player == bot.BOT_USERNAME:
+        # the bot's search has its own time budget, the human's clock starts once it moves
+        room.turn_deadline = loop_time + turn_timeout
+    if loop_time < room.turn_deadline:
+        room.turn_timer = timer_wheel.schedule(room.turn_deadline, check_turn_clock, room)
+        return
+    p1_username, p1_client_socket = room.get_player1()
+    client_socket = p1_client_socket if room.current_turn_player == p1_username else room.get_player2()[1]
+    logger.info("%s ran out of time in room %s", room.current_turn_player, room.room_name)
+    turn_timeouts.inc()
+    forfeit_protocol(client_socket, ["FORFEIT"])
+
+
 def inprogress_protocol(client_socket: socket.socket) -> None:
     '''
-    handle the INPROGRESS protocol
+    handle the INPROGRESS protocol: the players, whose turn it is and a SNAPSHOT of the board, so a viewer
+    does not wait for the next move to see the game, in one write however long the game has run
     '''
-    room = full_rooms[client_room[client_socket]]
-    p1_username = room.get_player1()[0]
-    p2_username = room.get_player2()[0]
-    current_turn_player = room.current_turn_player
-    opposing_player = p1_username if current_turn_player == p2_username else p2_username
-    client_socket.sendall(f"INPROGRESS:{current_turn_player}:{opposing_player}\n".encode())
+    room = room_registry.full.get(client_room[client_socket])
+    client = clients.get(client_socket)
+    if room is None or client is None or client.closing:
+        return
+    encoded = room.join_snapshot_encodings.get(client.binary)
+    if encoded is None or any(name_table.names[name_id] != name for name_id, name in encoded[1]):
+        # a long game may outlive the name ids it was encoded with, see wire.NameTable.intern()
+        if client.binary:
+            frames = [wire.encode_message(line, name_table) for line in room.join_snapshot.splitlines()]
+            encoded = b"".join(frame for frame, _ in frames), tuple(ref for _, refs in frames for ref in refs)
+        else:
+            encoded = room.join_snapshot.encode(), ()
+        room.join_snapshot_encodings[client.binary] = encoded
+    write_to_client(client_socket, client, binary_frames(client, encoded) if encoded[1] else encoded[0])
 
 
 def process_message(client_socket: socket.socket) -> bool:
@@ -479,74 +1563,326 @@ def process_message(client_socket: socket.socket) -> bool:
     return False if no data is received or there is an error raised
     return True otherwise
     '''
-    if client_socket in pending_rooms:
-        return True
     try:
-        data_list = client_socket.recv(8192)
-        if not data_list:
+        n_bytes = client_socket.recv_into(recv_view)
+        if not n_bytes:
             return False
+    except (BlockingIOError, InterruptedError):
+        return True
     except Exception as e:
-        print(f"error receiving data: {e}")
+        logger.info("error receiving data: %s", e)
         return False
-    data_list = data_list.decode()
-    print(f"received from {clients[client_socket]}: {data_list}")
-    for i, data in enumerate(data_list.split("\n")):
-        if i == len(data_list.split("\n")) - 1:
-            continue
-        if data.split(":")[0] == "LOGIN":
-            login_protocol(client_socket, data)
-        elif data.split(":")[0] == "REGISTER":
-            register_protocol(client_socket, data)
-        elif client_socket not in auth_clients:
-            client_socket.sendall("BADAUTH\n".encode())
-        elif data.split(":")[0] == "ROOMLIST":
-            roomlist_protocol(client_socket, data)
-        elif data.split(":")[0] == "CREATE":
-            create_protocol(client_socket, data)
-        elif data.split(":")[0] == "JOIN":
-            join_protocol(client_socket, data)
-        elif client_socket not in client_room:
-            client_socket.sendall("NOROOM\n".encode())
-        elif data.split(":")[0] == "PLACE":
-            place_protocol(client_socket, data)
-        elif data.split(":")[0] == "FORFEIT":
-            forfeit_protocol(client_socket)
+    received_bytes.inc(amount=n_bytes)
+    client = clients[client_socket]
+    try:
+        data_list = client.reader.feed(recv_view[:n_bytes])
+    except protocol.LineTooLong as e:
+        logger.info("line of %d bytes from %s exceeds %d bytes", e.args[0], client.address, protocol.MAX_LINE_LENGTH)
+        return False
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("received from %s: %s", client.address, recv_buffer[:n_bytes].decode(errors="replace").rstrip("\n"))
+    process_lines(client_socket, data_list)
     return True
 
 
+def process_lines(client_socket: socket.socket, data_list: list[bytes]) -> None:
+    '''
+    respond to complete protocol lines in order
+    lines following a LOGIN/REGISTER are deferred until its password job completes
+    a verb is registered with the options requires_auth, requires_room, sharded (see route_room_request()),
+    fields (the numbers of fields its lines may have) and malformed (the reply to a line with other fields,
+    or whose handler raised ValueError/IndexError on them), a malformed line never stops the loop
+    '''
+    client = clients[client_socket]
+    reader = client.reader
+    if data_list:
+        client.last_active = loop_time
+    for i, data in enumerate(data_list):
+        if client.closing:
+            return
+        if client.auth_pending:
+            client.deferred.extend(data_list[i:])
+            return
+        data = wire.decode_request(data) if client.binary else data.decode(errors="replace").split(":")
+        entry = protocol_handlers.lookup(data[0])
+        options = entry[1] if entry is not None else UNKNOWN_VERB_OPTIONS
+        # unknown verbs share one label so that a client cannot create series at will
+        verb = data[0] if entry is not None else "UNKNOWN"
+        requests_received.inc(verb)
+        if options.get("requires_auth") and client_socket not in auth_clients:
+            send_to_client(client_socket, "BADAUTH\n")
+        elif options.get("requires_room") and client_socket not in client_room:
+            send_to_client(client_socket, "NOROOM\n")
+        elif entry is None:
+            continue
+        elif "fields" in options and len(data) not in options["fields"]:
+            reply_malformed(client_socket, options, data, "wrong number of fields")
+        elif options.get("sharded") and route_room_request(client_socket, data, data_list[i+1:]):
+            return
+        else:
+            start = time.perf_counter()
+            try:
+                entry[0](client_socket, data)
+            except (ValueError, IndexError) as e:
+                reply_malformed(client_socket, options, data, e)
+            request_duration.observe(time.perf_counter() - start, verb)
+            if client.reader is not reader:
+                # the client switched to binary frames, the bytes it sent after its HELLO line are frames
+                rest = b"".join(line + b"\n" for line in data_list[i+1:]) + reader.buffer
+                try:
+                    frames = client.reader.feed(rest)
+                except protocol.LineTooLong:
+                    close_client(client_socket)
+                    return
+                process_lines(client_socket, frames)
+                return
+
+
+def reply_malformed(client_socket: socket.socket, options: dict, data: list[str], reason) -> None:
+    '''
+    answer the malformed line <data> with the malformed reply of its verb, if it has one
+    '''
+    logger.info("malformed message from %s: %s (%s)", clients[client_socket].address, ":".join(data), reason)
+    malformed = options.get("malformed")
+    if malformed is not None:
+        send_to_client(client_socket, malformed)
+
+
 auth_clients: dict[socket.socket, str] = {} # [socket_object, client_username] : store the username of clients who logged in
-sockets_list: list[socket.socket] = [] # store the list of socket objects that we are handling
-clients: dict[socket.socket, str] = {} # [socket_object, client_address] : store the address of all clients
+selector: selectors.BaseSelector = None # epoll/kqueue backed readiness notification of the sockets that we are handling, created by serve()
+clients: dict[socket.socket, Client] = {} # [socket_object, client_object] : store the per-connection state of all clients
 client_room: dict[socket.socket, str] = {} # [socket_object, client' room name] : store the room name of which the client is in
+closing_clients: collections.deque[socket.socket] = collections.deque() # store the client sockets scheduled to be disconnected
+bot_executor: concurrent.futures.ProcessPoolExecutor = None # searches the bot's moves on larger boards without holding the loop's GIL, see start_bot_search()
+bot_results: queue.SimpleQueue = queue.SimpleQueue() # store the searched bot moves until the loop places them
+auth_executor: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="auth") # runs bcrypt, which releases the GIL
+auth_results: queue.SimpleQueue = queue.SimpleQueue() # store the finished password jobs until the loop completes them
+auth_jobs_waiting: collections.deque[tuple] = collections.deque() # store the password jobs waiting for a free slot in the worker pool
+auth_jobs_running: int = 0 # the number of password jobs handed to the worker pool
+auth_wakeup_recv: socket.socket = None # read by the loop when the worker threads wake it up, created by serve()
+auth_wakeup_send: socket.socket = None # written by the worker threads to wake the loop up
+recv_buffer: bytearray = bytearray(protocol.RECV_SIZE) # scratch buffer every socket is read into before framing
+recv_view: memoryview = memoryview(recv_buffer)
+name_table: wire.NameTable = wire.NameTable() # the name ids of the usernames sent to binary clients
 
-ROOMS_LIMIT: int = 256
+ROOMS_LIMIT: int = 200000 # the most rooms at once, ROOMLIST pages through them with a cursor
+OUTBOUND_HIGH_WATER_MARK: int = 256 * 1024 # the most bytes queued for a client before it is disconnected
+AUTH_QUEUE_LIMIT: int = 64 # the most password jobs handed to the worker pool at once, the rest wait in auth_jobs_waiting
+AUTH_WAITING_LIMIT: int = 1024 # the most password jobs waiting in auth_jobs_waiting, a LOGIN/REGISTER past it is rejected right away
+SENDMSG_MAX_BUFFERS: int = 64 # the most queued messages written to a client with one sendmsg call
+LISTEN_BACKLOG: int = socket.SOMAXCONN
+ADMIN_TIMEOUT: float = 5.0 # the most seconds a connection to the admin port may take to send its request and read the response
+TIMER_TICK: float = 0.1 # the resolution in seconds of the timer wheel, a timeout fires up to one tick late
+SNAPSHOT_INTERVAL: int = 32 # every how many moves a delta client is sent the whole board, so that it can check it is in sync
+MARKER_DIGITS: dict[str, int] = {'X': 1, 'O': 2} # the digit of each marker in a board status and a MOVE
+HISTORY_PAGE_LIMIT: int = 100 # the most game ids a HISTORY page may ask for
+LEADERBOARD_PAGE_LIMIT: int = 100 # the most players a LEADERBOARD page may ask for
 
-def main(args: list[str]) -> None:
-    config(args)
+metrics_registry: metrics.Registry = metrics.Registry() # the metrics of this process, served on the admin port
+requests_received: metrics.Counter = metrics_registry.counter("tictactoe_requests_total", "Protocol lines received, by verb", ("verb",))
+request_duration: metrics.Histogram = metrics_registry.histogram("tictactoe_request_duration_seconds", "Time spent handling a protocol line, by verb", ("verb",))
+password_job_duration: metrics.Histogram = metrics_registry.histogram("tictactoe_password_job_duration_seconds", "Time from submitting a LOGIN/REGISTER password job to its completion, including the wait for a free worker")
+received_bytes: metrics.Counter = metrics_registry.counter("tictactoe_received_bytes_total", "Bytes received from clients")
+games_recorded: metrics.Counter = metrics_registry.counter("tictactoe_games_recorded_total", "Finished games appended to the game log")
+slow_client_disconnects: metrics.Counter = metrics_registry.counter("tictactoe_slow_client_disconnects_total", "Clients disconnected for queueing more than OUTBOUND_HIGH_WATER_MARK bytes")
+auth_jobs_rejected: metrics.Counter = metrics_registry.counter("tictactoe_password_jobs_rejected_total", "LOGIN/REGISTER requests rejected because AUTH_WAITING_LIMIT password jobs were waiting")
+metrics_registry.gauge("tictactoe_connections", "Connected clients", lambda: len(clients))
+metrics_registry.gauge("tictactoe_authenticated_clients", "Logged in clients", lambda: len(auth_clients))
+metrics_registry.gauge("tictactoe_rooms", "Rooms, including those of the other workers in sharded mode", lambda: len(room_registry))
+metrics_registry.gauge("tictactoe_game_records_unwritten", "Finished games not written to the game log yet", lambda: len(game_log.unwritten) if game_log is not None else 0)
+metrics_registry.gauge("tictactoe_rated_players", "Players who finished a rated game", lambda: len(player_ratings) if player_ratings is not None else 0)
+metrics_registry.gauge("tictactoe_password_jobs_queued", "Password jobs running or waiting for a free worker", lambda: auth_jobs_running + len(auth_jobs_waiting))
+metrics_registry.gauge("tictactoe_outbound_queued_bytes", "Bytes queued for clients whose sockets are full", lambda: sum(client.outbound_bytes for client in clients.values()))
+idle_disconnects: metrics.Counter = metrics_registry.counter("tictactoe_idle_disconnects_total", "Clients disconnected for staying unauthenticated or idle in the lobby for too long")
+turn_timeouts: metrics.Counter = metrics_registry.counter("tictactoe_turn_timeouts_total", "Games forfeited by a player whose turn clock ran out")
+coalesced_updates: metrics.Counter = metrics_registry.counter("tictactoe_coalesced_updates_total", "Board updates merged into a SNAPSHOT for a delta viewer that could not keep up")
+metrics_registry.gauge("tictactoe_timers", "Idle and turn timers scheduled", lambda: len(timer_wheel) if timer_wheel is not None else 0)
+admin_socket: socket.socket | None = None # the listening socket of the admin port, created by serve() if adminPort is set
+timer_wheel: timers.TimerWheel = None # the idle and turn timers, advanced by the loop after every wakeup, created by serve()
+loop_time: float = time.monotonic() # the monotonic time of the current loop iteration
+
+
+def raise_file_limit() -> None:
+    '''
+    raise the soft limit of open file descriptors to the hard limit so that the server can hold as many connections as the system allows
+    '''
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def create_server_socket(reuse_port: bool) -> socket.socket:
+    '''
+    create the listening socket, with SO_REUSEPORT if <reuse_port> so that every worker can bind its own
+    '''
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     server_address = ("localhost", server_port)
     server_socket.bind(server_address)
     server_socket.setblocking(False)
-    sockets_list.append(server_socket)
-    server_socket.listen(5)
-    print(f"server is listening at {server_address}")
+    server_socket.listen(LISTEN_BACKLOG)
+    logger.info("server is listening at %s", server_address)
+    return server_socket
+
 
+def accept_admin_connections() -> None:
+    '''
+    accept every pending connection to the admin port, its request is answered by process_admin_connection()
+    '''
     while True:
-        read_sockets, _, exception_sockets = select.select(sockets_list, [], sockets_list)
+        try:
+            admin_connection, _ = admin_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.warning("error accepting admin connection: %s", e)
+            return
+        admin_connection.setblocking(False)
+        admin = AdminConnection()
+        admin.timer = timer_wheel.schedule(loop_time + ADMIN_TIMEOUT, close_admin_connection, admin_connection, admin)
+        selector.register(admin_connection, selectors.EVENT_READ, admin)
+
+
+def process_admin_connection(admin_connection: socket.socket, admin: AdminConnection) -> None:
+    '''
+    read from a connection to the admin port until its HTTP request is complete, then write the response
+    as the socket accepts it, like flush_client(), so that a slow scraper never holds up the games
+    '''
+    if admin.response is None:
+        try:
+            received = admin_connection.recv(protocol.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            received = b""
+        if not received:
+            close_admin_connection(admin_connection, admin)
+            return
+        admin.request += received
+        response = metrics.http_response(bytes(admin.request), metrics_registry)
+        if response is None:
+            return
+        admin.response = memoryview(response)
+        selector.modify(admin_connection, selectors.EVENT_WRITE, admin)
+    while admin.response:
+        try:
+            sent = admin_connection.send(admin.response)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.info("error sending metrics: %s", e)
+            break
+        admin.response = admin.response[sent:]
+    close_admin_connection(admin_connection, admin)
+
+
+def close_admin_connection(admin_connection: socket.socket, admin: AdminConnection) -> None:
+    '''
+    close a connection to the admin port, also called by the timer wheel once it took longer than ADMIN_TIMEOUT
+    '''
+    if admin_connection.fileno() < 0:
+        return
+    timer_wheel.cancel(admin.timer)
+    selector.unregister(admin_connection)
+    admin_connection.close()
+
+
+def serve(server_socket: socket.socket) -> None:
+    '''
+    run the event loop of this process until it is killed
+    '''
+    global selector, auth_wakeup_recv, auth_wakeup_send, admin_socket, timer_wheel, loop_time
+    selector = selectors.DefaultSelector()
+    loop_time = time.monotonic()
+    timer_wheel = timers.TimerWheel(TIMER_TICK, loop_time)
+    selector.register(server_socket, selectors.EVENT_READ, None)
+    auth_wakeup_recv, auth_wakeup_send = socket.socketpair()
+    auth_wakeup_recv.setblocking(False)
+    auth_wakeup_send.setblocking(False)
+    selector.register(auth_wakeup_recv, selectors.EVENT_READ, None)
+    for peer in peers.values():
+        selector.register(peer.channel_socket, selectors.EVENT_READ, peer)
+    if admin_port:
+        # every worker serves its own metrics
+        admin_socket = metrics.create_admin_socket(admin_port + worker_id)
+        selector.register(admin_socket, selectors.EVENT_READ, None)
+        logger.info("metrics are served at http://localhost:%d/metrics", admin_port + worker_id)
 
-        for notified_socket in read_sockets:
-            if notified_socket == server_socket:
-                # new connection
+    while True:
+        # only sockets with pending events are returned, idle connections cost nothing per wakeup
+        ready = selector.select(timer_wheel.timeout())
+        loop_time = time.monotonic()
+        # the timers only look at the clients and rooms whose deadline is due
+        timer_wheel.advance(loop_time)
+        for key, events in ready:
+            if key.fileobj is auth_wakeup_recv:
+                # finished password job(s)
+                complete_auth_jobs()
+                complete_bot_moves()
+                continue
+            if key.fileobj is admin_socket:
+                accept_admin_connections()
+                continue
+            if isinstance(key.data, AdminConnection):
+                # a connection to the admin port
+                process_admin_connection(key.fileobj, key.data)
+                continue
+            if key.data is None:
+                # new connection(s)
                 create_client_socket(server_socket)
-            else:
-                # a client
-                if not process_message(notified_socket):
-                    remove_client_socket(notified_socket)
+                continue
+            if isinstance(key.data, cluster.Peer):
+                # another worker
+                process_peer(key.data, events)
+                continue
+            # a client
+            notified_socket = key.fileobj
+            if key.data.closing or notified_socket not in clients:
+                continue
+            if events & selectors.EVENT_WRITE and not flush_client(notified_socket):
+                close_client(notified_socket)
+                continue
+            if events & selectors.EVENT_READ and notified_socket in clients and not process_message(notified_socket):
+                close_client(notified_socket)
+        remove_closing_clients()
+
+
+def run_worker(new_worker_id: int, new_peers: dict[int, cluster.Peer], shared_server_socket: socket.socket | None) -> None:
+    '''
+    the entry point of a worker process in sharded mode
+    '''
+    global worker_id, peers, user_store
+    worker_id = new_worker_id
+    peers = new_peers
+    # connections are not shared across fork, every worker opens its own
+    metrics.start_logging(logging.getLevelName(logging.getLogger().level))
+    user_store = userstore.open_user_store(user_database_path)
+    server_socket = shared_server_socket or create_server_socket(reuse_port=True)
+    serve(server_socket)
+
 
-        for notified_socket in exception_sockets:
-            remove_client_socket(notified_socket)
+def main(args: list[str]) -> None:
+    config(args)
+    raise_file_limit()
+    bot.load_table()
+    if n_workers == 1:
+        serve(create_server_socket(reuse_port=False))
+        return
+    user_store.close()
+    # with SO_REUSEPORT the kernel spreads new connections across the workers' own listening sockets,
+    # otherwise they all accept from one socket created here
+    shared_server_socket = None if hasattr(socket, "SO_REUSEPORT") else create_server_socket(reuse_port=False)
+    cluster.start_workers(n_workers, lambda new_worker_id, new_peers: run_worker(new_worker_id, new_peers, shared_server_socket))
 
 
 if __name__ == "__main__":
@@ -1,4 +1,7 @@
+import math
+
 BOARD_SIZE = 3
+MAX_BOARD_SIZE = 19
 CELL_SIZE = 5
 ROW_SEPARATOR = '-'
 N_ROW_SEPARATORS = CELL_SIZE + (CELL_SIZE - 1) * (BOARD_SIZE - 1)
@@ -6,26 +9,105 @@ COLUMN_SEPARATOR = '|'
 
 Board = list[list[str]]
 
-def create_board() -> Board:
+
+class BitBoard:
+    """A board stored as one integer: bit <BOARD_SIZE*row + col> marks an X and the same bit shifted by N_CELLS marks an O"""
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+
+class GridBoard:
+    """A <size> by <size> board won by <win_length> markers in a row, stored as a bytearray of status code digits"""
+    __slots__ = ("size", "win_length", "cells", "n_filled", "winner")
+
+    def __init__(self, size: int, win_length: int):
+        self.size = size
+        self.win_length = win_length
+        self.cells = bytearray(b"0" * (size * size))
+        self.n_filled = 0
+        self.winner = None
+
+
+N_CELLS = BOARD_SIZE * BOARD_SIZE
+CELLS_MASK = (1 << N_CELLS) - 1
+MARKER_SHIFTS = {'X': 0, 'O': N_CELLS}
+ROW_MASKS = tuple(sum(1 << (BOARD_SIZE * row + col) for col in range(BOARD_SIZE)) for row in range(BOARD_SIZE))
+COLUMN_MASKS = tuple(sum(1 << (BOARD_SIZE * row + col) for row in range(BOARD_SIZE)) for col in range(BOARD_SIZE))
+DIAGONAL_MASKS = (
+    sum(1 << ((BOARD_SIZE + 1) * i) for i in range(BOARD_SIZE)),
+    sum(1 << (BOARD_SIZE * i + BOARD_SIZE - 1 - i) for i in range(BOARD_SIZE)),
+)
+LINE_MASKS = ROW_MASKS + COLUMN_MASKS + DIAGONAL_MASKS
+# WINNING_MASKS[mask] is 1 if the cells in <mask> contain a whole line
+WINNING_MASKS = bytes(any(mask & line == line for line in LINE_MASKS) for mask in range(1 << N_CELLS))
+# STATUS_DIGITS[mask] has a decimal digit 1 for every cell in <mask>, in status code order
+STATUS_DIGITS = tuple(
+    sum(10 ** (N_CELLS - 1 - i) for i in range(N_CELLS) if mask >> i & 1)
+    for mask in range(1 << N_CELLS)
+)
+X_STATUS_BITS = str.maketrans("012", "010")
+O_STATUS_BITS = str.maketrans("012", "001")
+MARKER_DIGITS = {'X': ord('1'), 'O': ord('2')}
+CELL_MARKERS = {ord('0'): ' ', ord('1'): 'X', ord('2'): 'O'}
+# the directions of a row, a column and the two diagonals
+LINE_DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+def create_board(size: int = BOARD_SIZE) -> Board:
     """Create and return an empty board"""
-    return [[' ' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+    return [[' ' for _ in range(size)] for _ in range(size)]
+
+
+def create_bitboard() -> BitBoard:
+    """Create and return an empty BitBoard"""
+    return BitBoard()
+
+
+def create_gridboard(size: int, win_length: int) -> GridBoard:
+    """Create and return an empty <size> by <size> GridBoard won by <win_length> in a row"""
+    return GridBoard(size, win_length)
+
 
+def create_game_board(size: int = BOARD_SIZE, win_length: int = BOARD_SIZE) -> BitBoard | GridBoard:
+    """Create and return the fastest empty board for a game on a <size> by <size> board won by <win_length> in a row"""
+    if size == BOARD_SIZE and win_length == BOARD_SIZE:
+        return create_bitboard()
+    return create_gridboard(size, win_length)
 
-def print_board(board: Board) -> None:
+
+def get_board_size(board: Board | BitBoard | GridBoard) -> int:
+    """Return the number of rows (and columns) of the board"""
+    if isinstance(board, BitBoard):
+        return BOARD_SIZE
+    if isinstance(board, GridBoard):
+        return board.size
+    return len(board)
+
+
+def print_board(board: Board | BitBoard | GridBoard) -> None:
     """Print the board to stdout"""
-    print(ROW_SEPARATOR * N_ROW_SEPARATORS)
+    if isinstance(board, (BitBoard, GridBoard)):
+        board = assign_board(get_board_status(board))
+    n_row_separators = CELL_SIZE + (CELL_SIZE - 1) * (len(board) - 1)
+    print(ROW_SEPARATOR * n_row_separators)
     for row in board:
         for value in row:
             print(f"{COLUMN_SEPARATOR} {value} ", end='')
         print(COLUMN_SEPARATOR)
-        print(ROW_SEPARATOR * N_ROW_SEPARATORS)
+        print(ROW_SEPARATOR * n_row_separators)
 
 
-def get_board_status(board: Board) -> str:
+def get_board_status(board: Board | BitBoard | GridBoard) -> str:
     """Convert the board to a status code and return it"""
+    if isinstance(board, BitBoard):
+        bits = board.bits
+        return f"{STATUS_DIGITS[bits & CELLS_MASK] + 2 * STATUS_DIGITS[bits >> N_CELLS]:0{N_CELLS}d}"
+    if isinstance(board, GridBoard):
+        return board.cells.decode()
     ans: str = ""
-    for i in range(BOARD_SIZE):
-        for j in range(BOARD_SIZE):
+    for i in range(len(board)):
+        for j in range(len(board)):
             if board[i][j] == ' ':
                 ans += "0"
             elif board[i][j] == 'X':
@@ -35,55 +117,123 @@ def get_board_status(board: Board) -> str:
     return ans
 
 
-def get_marker(board: Board, row: int, col: int) -> str | None:
-    """Get the marker at position (<row>,<col>) on the board"""
-    if row < 0 or row > 2 or col < 0 or col > 2:
-        print(f"Invalid position ({row},{col}). Row/Column must be an integer between 0 and 2")
+def get_marker(board: Board | BitBoard | GridBoard, row: int, col: int) -> str | None:
+    """Get the marker at position (<row>,<col>) on the board, or None if the position is off the board"""
+    size = get_board_size(board)
+    if row < 0 or row >= size or col < 0 or col >= size:
         return
+    if isinstance(board, GridBoard):
+        return CELL_MARKERS[board.cells[row * size + col]]
+    if isinstance(board, BitBoard):
+        cell = 1 << (BOARD_SIZE * row + col)
+        if board.bits & cell:
+            return 'X'
+        if board.bits >> N_CELLS & cell:
+            return 'O'
+        return ' '
     return board[row][col]
 
 
-def put_marker(board: Board, row: int, col: int, marker: str) -> Board | None:
-    """Put the marker <marker> at position (<row>,<col>) on the board"""
-    if row < 0 or row > 2 or col < 0 or col > 2:
-        print(f"Invalid position ({row},{col}). Row/Column must be an integer between 0 and 2")
-        return
-    if get_marker(board, row, col) != ' ':
-        print(f"({row},{col}) is occupied by {board[row][col]}")
+def put_marker(board: Board | BitBoard | GridBoard, row: int, col: int, marker: str) -> Board | BitBoard | GridBoard | None:
+    """Put the marker <marker> at position (<row>,<col>) on the board, or return None if the position is off the board
+    or occupied or the marker is not X or O, the caller reports why (the server must not print for every bad PLACE)"""
+    size = get_board_size(board)
+    if row < 0 or row >= size or col < 0 or col >= size:
         return
-    if marker not in ('X', 'O'):
-        print("marker must be X or O")
+    if get_marker(board, row, col) != ' ' or marker not in ('X', 'O'):
         return
+    if isinstance(board, BitBoard):
+        board.bits |= 1 << (MARKER_SHIFTS[marker] + BOARD_SIZE * row + col)
+        return board
+    if isinstance(board, GridBoard):
+        board.cells[row * size + col] = MARKER_DIGITS[marker]
+        board.n_filled += 1
+        if board.winner is None and any(
+            line_length(board, row, col, d_row, d_col) >= board.win_length
+            for d_row, d_col in LINE_DIRECTIONS
+        ):
+            board.winner = marker
+        return board
     board[row][col] = marker
     return board
 
 
-def player_wins_vertically(player: str, board: Board) -> bool:
+def line_length(board: GridBoard, row: int, col: int, d_row: int, d_col: int) -> int:
+    """Count the markers in an unbroken line through (<row>,<col>) in the direction (<d_row>,<d_col>), capped at the win length"""
+    size = board.size
+    cells = board.cells
+    digit = cells[row * size + col]
+    length = 1
+    for sign in (1, -1):
+        r = row + sign * d_row
+        c = col + sign * d_col
+        while length < board.win_length and 0 <= r < size and 0 <= c < size and cells[r * size + c] == digit:
+            length += 1
+            r += sign * d_row
+            c += sign * d_col
+    return length
+
+
+def player_wins_in_directions(player: str, board: GridBoard, directions: tuple[tuple[int, int], ...]) -> bool:
+    """Check if <player> has a line of the win length in one of <directions> anywhere on a GridBoard"""
+    size = board.size
+    digit = MARKER_DIGITS[player]
+    return any(
+        board.cells[row * size + col] == digit and line_length(board, row, col, d_row, d_col) >= board.win_length
+        for row in range(size)
+        for col in range(size)
+        for d_row, d_col in directions
+    )
+
+def player_wins_along(player: str, board: BitBoard, line_masks: tuple[int, ...]) -> bool:
+    """Check if <player> fills one of the lines in <line_masks> on a BitBoard"""
+    mask = board.bits >> MARKER_SHIFTS[player] & CELLS_MASK
+    return any(mask & line == line for line in line_masks)
+
+
+def player_wins_vertically(player: str, board: Board | BitBoard | GridBoard) -> bool:
     """Check if <player> wins vertically"""
+    if isinstance(board, BitBoard):
+        return player_wins_along(player, board, COLUMN_MASKS)
+    if isinstance(board, GridBoard):
+        return player_wins_in_directions(player, board, ((1, 0),))
     return any(
-        all(board[y][x] == player for y in range(BOARD_SIZE))
-        for x in range(BOARD_SIZE)
+        all(board[y][x] == player for y in range(len(board)))
+        for x in range(len(board))
     )
 
 
-def player_wins_horizontally(player: str, board: Board) -> bool:
+def player_wins_horizontally(player: str, board: Board | BitBoard | GridBoard) -> bool:
     """Check if <player> wins horizontally"""
+    if isinstance(board, BitBoard):
+        return player_wins_along(player, board, ROW_MASKS)
+    if isinstance(board, GridBoard):
+        return player_wins_in_directions(player, board, ((0, 1),))
     return any(
-        all(board[x][y] == player for y in range(BOARD_SIZE))
-        for x in range(BOARD_SIZE)
+        all(board[x][y] == player for y in range(len(board)))
+        for x in range(len(board))
     )
 
 
-def player_wins_diagonally(player: str, board: Board) -> bool:
+def player_wins_diagonally(player: str, board: Board | BitBoard | GridBoard) -> bool:
     """Check if <player> wins diagonally"""
+    if isinstance(board, BitBoard):
+        return player_wins_along(player, board, DIAGONAL_MASKS)
+    if isinstance(board, GridBoard):
+        return player_wins_in_directions(player, board, ((1, 1), (1, -1)))
     return (
-        all(board[y][y] == player for y in range(BOARD_SIZE)) or
-        all(board[BOARD_SIZE - 1 - y][y] == player for y in range(BOARD_SIZE))
+        all(board[y][y] == player for y in range(len(board))) or
+        all(board[len(board) - 1 - y][y] == player for y in range(len(board)))
     )
 
 
-def player_wins(player: str, board: Board) -> bool:
+def player_wins(player: str, board: Board | BitBoard | GridBoard) -> bool:
     """Determines whether the specified player wins given the board"""
+    if isinstance(board, BitBoard):
+        return WINNING_MASKS[board.bits >> MARKER_SHIFTS[player] & CELLS_MASK] == 1
+    if isinstance(board, GridBoard):
+        # put_marker checks the lines through every move as it is made
+        return board.winner == player
     return (
         player_wins_vertically(player, board) or
         player_wins_horizontally(player, board) or
@@ -91,29 +241,41 @@ def player_wins(player: str, board: Board) -> bool:
     )
 
 
-def players_draw(board: Board) -> bool:
+def players_draw(board: Board | BitBoard | GridBoard) -> bool:
     """Determines whether the players draw on the given board"""
+    if isinstance(board, BitBoard):
+        return (board.bits | board.bits >> N_CELLS) & CELLS_MASK == CELLS_MASK
+    if isinstance(board, GridBoard):
+        return board.n_filled == board.size * board.size
     return all(
         board[y][x] != ' '
-        for y in range(BOARD_SIZE)
-        for x in range(BOARD_SIZE)
+        for y in range(len(board))
+        for x in range(len(board))
     )
 
 
 def assign_board(status: str) -> Board:
-    """Create and return a board that matches the given status code <status>"""
-    board = create_board()
-    for i in range(BOARD_SIZE):
-        for j in range(BOARD_SIZE):
-            if status[3*i + j] == "0":
+    """Create and return a board that matches the given status code <status>, its size is derived from the status length"""
+    size = math.isqrt(len(status))
+    board = create_board(size)
+    for i in range(size):
+        for j in range(size):
+            if status[size*i + j] == "0":
                 board[i][j] = ' '
-            elif status[3*i + j] == "1":
+            elif status[size*i + j] == "1":
                 board[i][j] = 'X'
-            elif status[3*i + j] == "2":
+            elif status[size*i + j] == "2":
                 board[i][j] = 'O'
     return board
 
 
+def assign_bitboard(status: str) -> BitBoard:
+    """Create and return a BitBoard that matches the given status code <status>"""
+    x_bits = int(status.translate(X_STATUS_BITS)[::-1], 2)
+    o_bits = int(status.translate(O_STATUS_BITS)[::-1], 2)
+    return BitBoard(x_bits | o_bits << N_CELLS)
+
+
 def main() -> None:
     board = create_board()
     print_board(board)
@@ -128,8 +290,8 @@ def main() -> None:
             except Exception as e:
                 print(f"caught exception {e}")
                 continue
-            if row < 0 or row > 2 or col < 0 or col > 2:
-                print(f"Invalid position ({row},{col}). Row/Column must be an integer between 0 and 2")
+            if row < 0 or row >= len(board) or col < 0 or col >= len(board):
+                print(f"Invalid position ({row},{col}). Row/Column must be an integer between 0 and {len(board) - 1}")
             elif get_marker(board, row, col) != ' ':
                 print(f"({row},{col}) occupied by {board[row][col]}")
             else:
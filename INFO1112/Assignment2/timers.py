@@ -0,0 +1,136 @@
+import math
+
+
+LEVEL_BITS: tuple[int, ...] = (8, 6, 6, 6) # the number of slots of each level of the wheel is 1 << bits, each level's slot spans a whole turn of the level below
+
+
+class Timer:
+    '''
+    A callback scheduled on a TimerWheel
+
+    Attributes:
+    -----------
+    expires: int
+        the tick the timer fires at
+    callback: callable
+        called with <args> when the timer fires
+    args: tuple
+        the arguments of the callback
+    cancelled: bool
+        whether the timer was cancelled, it is dropped instead of fired when its slot comes up
+    '''
+    def __init__(self, expires: int, callback, args: tuple):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    '''
+    A hierarchical timing wheel: scheduling, cancelling and firing a timer cost O(1),
+    plus at most one move down per level as the timer gets closer to firing
+
+    The first level has a slot for each of the next 256 ticks. A slot of each higher level holds the timers
+    of a whole turn of the level below, they are moved down a level when the lower level wraps around.
+
+    Attributes:
+    -----------
+    tick: float
+        the seconds per tick, timers fire up to one tick late
+    current: int
+        the last tick the wheel advanced to
+    levels: list[list[list[Timer]]]
+        the slots of every level
+    n_timers: int
+        the number of scheduled timers that have not fired or been cancelled
+    '''
+    def __init__(self, tick: float, now: float):
+        self.tick = tick
+        self.current = int(now / tick)
+        self.levels = [[[] for _ in range(1 << bits)] for bits in LEVEL_BITS]
+        self.n_timers = 0
+
+    def __len__(self) -> int:
+        return self.n_timers
+
+    def schedule(self, deadline: float, callback, *args) -> Timer:
+        '''
+        call <callback>(*<args>) once the time passes <deadline>, in the same clock as the times given to advance()
+        return the timer, which can be cancelled
+        '''
+        timer = Timer(max(self.current + 1, math.ceil(deadline / self.tick)), callback, args)
+        self.insert(timer)
+        self.n_timers += 1
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        '''
+        stop <timer> from firing, it is dropped when its slot comes up
+        '''
+        if not timer.cancelled:
+            timer.cancelled = True
+            self.n_timers -= 1
+
+    def insert(self, timer: Timer) -> None:
+        '''
+        put <timer> in the slot of the lowest level that reaches its tick
+        '''
+        delta = timer.expires - self.current
+        shift = 0
+        for level, bits in enumerate(LEVEL_BITS):
+            if delta < 1 << (shift + bits) or level == len(LEVEL_BITS) - 1:
+                # a timer further away than the whole wheel waits in the last slot it reaches and is moved down from there
+                expires = min(timer.expires, self.current + (1 << (shift + bits)) - 1)
+                self.levels[level][(expires >> shift) & ((1 << bits) - 1)].append(timer)
+                return
+            shift += bits
+
+    def advance(self, now: float) -> None:
+        '''
+        advance the wheel to the time <now> and fire every timer whose tick has come, in tick order
+        a callback may schedule or cancel timers
+        '''
+        target = int(now / self.tick)
+        while self.current < target:
+            if not self.n_timers:
+                # nothing can fire, e.g. after the loop slept with no timer scheduled
+                self.current = target
+                return
+            self.current += 1
+            self.cascade()
+            slots = self.levels[0]
+            index = self.current & (len(slots) - 1)
+            expired = slots[index]
+            if not expired:
+                continue
+            slots[index] = []
+            for timer in expired:
+                if timer.cancelled:
+                    continue
+                timer.cancelled = True
+                self.n_timers -= 1
+                timer.callback(*timer.args)
+
+    def cascade(self) -> None:
+        '''
+        when a level wraps around, move the timers of the next slot of the level above down into it
+        '''
+        shift = 0
+        for level in range(len(LEVEL_BITS) - 1):
+            shift += LEVEL_BITS[level]
+            if self.current & ((1 << shift) - 1):
+                return
+            slots = self.levels[level + 1]
+            index = (self.current >> shift) & (len(slots) - 1)
+            timers = slots[index]
+            slots[index] = []
+            for timer in timers:
+                if not timer.cancelled:
+                    self.insert(timer)
+
+    def timeout(self) -> float | None:
+        '''
+        return the seconds the event loop may wait before advancing the wheel, None if no timer is scheduled
+        '''
+        return self.tick if self.n_timers else None
@@ -0,0 +1,464 @@
+import os
+import abc
+import sys
+import json
+import struct
+import marshal
+import logging
+import sqlite3
+import threading
+
+
+SQLITE_EXTENSIONS: tuple[str, ...] = (".db", ".sqlite", ".sqlite3")
+SQLITE_BUSY_TIMEOUT: float = 0.05 # the most seconds a write waits for another worker's write to the SQLite database, the event loop waits with it
+COMPACT_THRESHOLD: int = 4096 # the number of journaled records that triggers folding the journal into the JSON file
+LOAD_CHUNK_SIZE: int = 1 << 20 # the number of characters of the JSON file parsed at once
+INDEX_CACHE_MAGIC: bytes = b"TTTUIDX1"
+INDEX_CACHE_HEADER: struct.Struct = struct.Struct("<8sQQ") # magic, size and mtime (ns) of the JSON file the cache was built from
+
+logger: logging.Logger = logging.getLogger("userstore")
+
+
+class UserDatabaseError(Exception):
+    '''
+    raised when a user database cannot be loaded or written, the message completes "Error: <user database path> ..."
+    '''
+
+
+class UserExistsError(Exception):
+    '''
+    raised by add() when another process registered the same username first
+    '''
+
+
+class UserStore(abc.ABC):
+    '''
+    A user database indexed by username
+
+    Subclasses store the records, every lookup by username is O(1) (or O(log n) on disk)
+    instead of a scan of every record. A subclass missing one of the abstract methods cannot be instantiated.
+    '''
+    @abc.abstractmethod
+    def get_password(self, username: str) -> str | None:
+        '''
+        return the bcrypt password hash of <username>, or None if there is no such user
+        '''
+
+    @abc.abstractmethod
+    def add(self, username: str, password_hash: str) -> None:
+        '''
+        add a new user record, it is durable once sync() returns
+        '''
+
+    def sync(self) -> None:
+        '''
+        make every record added so far durable
+        '''
+
+    def __contains__(self, username: str) -> bool:
+        return self.get_password(username) is not None
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        '''
+        return the number of user records
+        '''
+
+    def close(self) -> None:
+        '''
+        release the resources held by the store
+        '''
+
+
+class JsonUserStore(UserStore):
+    '''
+    A user store backed by a JSON array of {"username", "password"} records (the snapshot)
+    and an append-only journal of the records added since, one JSON object per line
+
+    New records are only appended to the journal, sync() fsyncs every record added since the
+    last sync at once, and once the journal holds COMPACT_THRESHOLD records it is rotated and
+    folded into the snapshot by a background thread. Loading replays the journal(s) over the snapshot.
+
+    Attributes:
+    -----------
+    path: str
+        the path of the JSON file
+    journal_path: str
+        the path of the journal being appended to
+    old_journal_path: str
+        the path of the rotated journal being folded into the snapshot
+    records: dict[str, str]
+        [username, password hash] : every user record, in insertion order
+    journal: io.TextIOWrapper
+        the open journal file
+    journal_records: int
+        the number of records journaled since the last compaction
+    unsynced: bool
+        whether records were appended since the last sync()
+    compaction: threading.Thread or None
+        the thread folding the rotated journal into the snapshot, if any
+    index_cache_path: str or None
+        the path of the binary index cache of the snapshot, None if caching is disabled
+    '''
+    def __init__(self, path: str, index_cache: bool = False):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.old_journal_path = path + ".journal.old"
+        self.index_cache_path = path + ".idx" if index_cache else None
+        self.records = load_snapshot(path, self.index_cache_path)
+        self.compaction = None
+        interrupted_compaction = os.path.exists(self.old_journal_path)
+        if interrupted_compaction:
+            self.replay(self.old_journal_path)
+        self.journal_records = self.replay(self.journal_path)
+        self.journal = open(self.journal_path, "a")
+        self.unsynced = False
+        if interrupted_compaction:
+            # the server stopped before the rotated journal was folded in, finish that first
+            self.fold_journal(list(self.records.items()))
+
+    def replay(self, journal_path: str) -> int:
+        '''
+        add the records of the journal at <journal_path> and return how many it holds
+        a torn last line, left by a crash in the middle of an append, is cut off the journal
+        raise UserDatabaseError if any complete line is not a valid user record
+        '''
+        if not os.path.exists(journal_path):
+            return 0
+        n_records = 0
+        valid_length = 0
+        with open(journal_path, "rb") as fileobj:
+            for line in fileobj:
+                if not line.endswith(b"\n"):
+                    # only the last line can be unterminated
+                    break
+                try:
+                    account = json.loads(line)
+                except ValueError:
+                    raise UserDatabaseError("journal contains a corrupt user record.")
+                if not isinstance(account, dict) or sorted(account.keys()) != ["password", "username"]:
+                    raise UserDatabaseError("journal contains invalid user record formats.")
+                self.records.setdefault(account["username"], account["password"])
+                n_records += 1
+                valid_length += len(line)
+        if valid_length < os.path.getsize(journal_path):
+            os.truncate(journal_path, valid_length)
+        return n_records
+
+    def get_password(self, username: str) -> str | None:
+        return self.records.get(username)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, username: str, password_hash: str) -> None:
+        self.records[username] = password_hash
+        self.journal.write(json.dumps({"username": username, "password": password_hash}) + "\n")
+        self.journal_records += 1
+        self.unsynced = True
+
+    def sync(self) -> None:
+        if not self.unsynced:
+            return
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.unsynced = False
+        if self.journal_records >= COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self) -> None:
+        '''
+        rotate the journal and fold it into the snapshot in a background thread
+        does nothing while a previous compaction is still running, the rotated journal of a previous compaction
+        that failed is folded again instead of being overwritten, the journal is rotated by the next compaction
+        '''
+        if self.compaction is not None and self.compaction.is_alive():
+            return
+        if not os.path.exists(self.old_journal_path):
+            self.journal.close()
+            os.replace(self.journal_path, self.old_journal_path)
+            self.journal = open(self.journal_path, "a")
+        self.journal_records = 0
+        # the copy is taken in the caller's thread so that the store can keep changing meanwhile
+        records = list(self.records.items())
+        self.compaction = threading.Thread(target=self.fold_journal, args=(records,), daemon=True)
+        self.compaction.start()
+
+    def fold_journal(self, records: list[tuple[str, str]]) -> None:
+        '''
+        write <records> as the new snapshot then drop the rotated journal, which it includes
+        the rotated journal is kept if the snapshot cannot be written
+        '''
+        try:
+            write_snapshot(self.path, records)
+            if self.index_cache_path is not None:
+                write_index_cache(self.index_cache_path, self.path, dict(records))
+            os.remove(self.old_journal_path)
+        except OSError as e:
+            logger.error("error folding %s into %s, it is folded again by the next compaction: %s", self.old_journal_path, self.path, e)
+
+    def close(self) -> None:
+        self.sync()
+        if self.compaction is not None:
+            self.compaction.join()
+        self.journal.close()
+
+
+def stream_user_records(path: str):
+    '''
+    parse the JSON array of user records at <path> a chunk at a time, validating each record,
+    and yield (username, password hash) pairs without holding the whole array in memory
+    raise UserDatabaseError if it is not a valid array of user records
+    '''
+    decoder = json.JSONDecoder()
+    with open(path) as fileobj:
+        text = fileobj.read(LOAD_CHUNK_SIZE)
+        at_eof = len(text) < LOAD_CHUNK_SIZE
+        position = 0
+
+        def skip_whitespace() -> None:
+            nonlocal text, position, at_eof
+            while True:
+                while position < len(text) and text[position] in " \t\n\r":
+                    position += 1
+                if position < len(text) or at_eof:
+                    return
+                read_more()
+
+        def read_more() -> None:
+            nonlocal text, position, at_eof
+            chunk = fileobj.read(LOAD_CHUNK_SIZE)
+            at_eof = len(chunk) < LOAD_CHUNK_SIZE
+            text = text[position:] + chunk
+            position = 0
+
+        skip_whitespace()
+        if text[position:position+1] != "[":
+            # not an array: only a full parse tells an invalid document from another JSON value
+            fileobj.seek(0)
+            try:
+                json.load(fileobj)
+            except json.decoder.JSONDecodeError:
+                raise UserDatabaseError("is not in a valid JSON format.")
+            raise UserDatabaseError("is not a JSON array.")
+        position += 1
+        skip_whitespace()
+        closed = text[position:position+1] == "]"
+        if closed:
+            # an empty array
+            position += 1
+        while not closed:
+            # parse every complete record of the buffer in one call, the last "}" of the buffer
+            # usually closes a record, when it does not the next record is parsed on its own
+            cut = text.rfind("}", position) + 1
+            try:
+                accounts = json.loads("[" + text[position:cut] + "]") if cut else None
+            except json.decoder.JSONDecodeError:
+                accounts = None
+            if accounts:
+                position = cut
+            else:
+                while True:
+                    try:
+                        account, position = decoder.raw_decode(text, position)
+                        break
+                    except json.decoder.JSONDecodeError:
+                        if at_eof:
+                            raise UserDatabaseError("is not in a valid JSON format.")
+                        # the record may continue in the next chunk
+                        read_more()
+                accounts = (account,)
+            for account in accounts:
+                if not isinstance(account, dict) or len(account) != 2:
+                    raise UserDatabaseError("contains invalid user record formats.")
+                username = account.get("username")
+                password = account.get("password")
+                if not isinstance(username, str) or not isinstance(password, str):
+                    raise UserDatabaseError("contains invalid user record formats.")
+                yield username, password
+            skip_whitespace()
+            separator = text[position:position+1]
+            position += 1
+            if separator == "]":
+                closed = True
+            elif separator == ",":
+                skip_whitespace()
+            else:
+                raise UserDatabaseError("is not in a valid JSON format.")
+        skip_whitespace()
+        if position < len(text):
+            raise UserDatabaseError("is not in a valid JSON format.")
+
+
+def load_snapshot(path: str, index_cache_path: str | None = None) -> dict[str, str]:
+    '''
+    return the [username, password hash] index of the JSON user database at <path>
+    it is read from the binary index cache at <index_cache_path> if the cache matches the file,
+    otherwise the file is streamed in one pass and the cache is rewritten
+    raise UserDatabaseError if it is not a valid array of user records
+    '''
+    if index_cache_path is not None:
+        records = read_index_cache(index_cache_path, path)
+        if records is not None:
+            return records
+    records = {}
+    for username, password in stream_user_records(path):
+        # the first record of a username wins, like the linear scan it replaces
+        records.setdefault(username, password)
+    if index_cache_path is not None:
+        write_index_cache(index_cache_path, path, records)
+    return records
+
+
+def read_index_cache(index_cache_path: str, path: str) -> dict[str, str] | None:
+    '''
+    return the records of the index cache at <index_cache_path>
+    or None if it is missing, unreadable or was built from another version of the file at <path>
+    '''
+    try:
+        stat = os.stat(path)
+        with open(index_cache_path, "rb") as f:
+            magic, size, mtime_ns = INDEX_CACHE_HEADER.unpack(f.read(INDEX_CACHE_HEADER.size))
+            if magic != INDEX_CACHE_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                return None
+            records = marshal.loads(f.read())
+    except (OSError, struct.error, ValueError, EOFError, TypeError):
+        return None
+    return records if isinstance(records, dict) else None
+
+
+def write_index_cache(index_cache_path: str, path: str, records: dict[str, str]) -> None:
+    '''
+    atomically write <records> as the index cache of the current version of the file at <path>
+    '''
+    stat = os.stat(path)
+    temporary_path = index_cache_path + ".tmp"
+    try:
+        with open(temporary_path, "wb") as f:
+            f.write(INDEX_CACHE_HEADER.pack(INDEX_CACHE_MAGIC, stat.st_size, stat.st_mtime_ns))
+            f.write(marshal.dumps(records))
+        os.replace(temporary_path, index_cache_path)
+    except OSError as e:
+        # the cache only speeds up the next start
+        logger.warning("error writing user index cache: %s", e)
+
+
+def write_snapshot(path: str, records: list[tuple[str, str]]) -> None:
+    '''
+    atomically replace the JSON user database at <path> with <records>
+    '''
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        f.write("[\n")
+        for i, (username, password) in enumerate(records):
+            f.write("\t{\n")
+            f.write(f'\t\t"username": {json.dumps(username)},\n')
+            f.write(f'\t\t"password": {json.dumps(password)}\n')
+            f.write("\t}")
+            if i < len(records)-1:
+                f.write(",")
+            f.write("\n")
+        f.write("]")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+class SqliteUserStore(UserStore):
+    '''
+    A user store backed by an SQLite table whose primary key is the username,
+    only the records being looked up are read into memory
+
+    The database is in WAL mode so that the workers of sharded mode read while another one writes,
+    a write waits at most SQLITE_BUSY_TIMEOUT for the others and then fails with UserDatabaseError.
+
+    Attributes:
+    -----------
+    path: str
+        the path of the SQLite database
+    connection: sqlite3.Connection
+        the connection to the database
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self.connection = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL) WITHOUT ROWID"
+            )
+            self.connection.commit()
+        except sqlite3.DatabaseError:
+            raise UserDatabaseError("is not a valid SQLite database.")
+
+    def get_password(self, username: str) -> str | None:
+        row = self.connection.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row is not None else None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def add(self, username: str, password_hash: str) -> None:
+        try:
+            self.connection.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password_hash))
+        except sqlite3.IntegrityError:
+            raise UserExistsError(username)
+        except sqlite3.Error as e:
+            # e.g. another worker held the write lock for longer than SQLITE_BUSY_TIMEOUT
+            raise UserDatabaseError(f"cannot be written: {e}")
+
+    def sync(self) -> None:
+        if not self.connection.in_transaction:
+            return
+        try:
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            raise UserDatabaseError(f"cannot be written: {e}")
+
+    def add_many(self, records: list[tuple[str, str]]) -> None:
+        '''
+        add many (username, password hash) records in one transaction
+        '''
+        self.connection.executemany("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", records)
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def open_user_store(path: str, index_cache: bool = False) -> UserStore:
+    '''
+    open the user database at <path>, an SQLite database if its extension is one of SQLITE_EXTENSIONS,
+    otherwise a JSON array, whose index is cached next to it if <index_cache> is set
+    raise UserDatabaseError if it cannot be loaded
+    '''
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteUserStore(path)
+    return JsonUserStore(path, index_cache)
+
+
+def main(args: list[str]) -> None:
+    '''
+    convert a JSON user database to an SQLite one
+    '''
+    if len(args) != 2 or not args[1].lower().endswith(SQLITE_EXTENSIONS):
+        sys.stderr.write(f"Error: Expecting 2 arguments: <JSON user database path> <SQLite user database path ({'/'.join(SQLITE_EXTENSIONS)})>\n")
+        sys.exit(1)
+    json_path, sqlite_path = (os.path.abspath(os.path.expanduser(arg)) for arg in args)
+    try:
+        json_store = JsonUserStore(json_path)
+        sqlite_store = SqliteUserStore(sqlite_path)
+    except (OSError, UserDatabaseError) as e:
+        sys.stderr.write(f"Error: {e}\n")
+        sys.exit(1)
+    sqlite_store.add_many(list(json_store.records.items()))
+    print(f"copied {len(json_store)} user records to {sqlite_path}")
+    sqlite_store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
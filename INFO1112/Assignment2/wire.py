@@ -0,0 +1,236 @@
+import tictactoe
+
+
+BINARY: str = "BINARY" # HELLO:BINARY switches a connection to binary frames
+TEXT: str = "TEXT" # HELLO:TEXT keeps the newline-terminated text lines
+DELTA: str = "DELTA" # HELLO:<mode>:DELTA asks for a MOVE after every move instead of the whole board in a BOARDSTATUS
+LENGTH_BYTES: int = 2 # a frame is a big-endian payload length followed by the payload, which starts with the opcode
+MAX_FRAME_LENGTH: int = (1 << (8 * LENGTH_BYTES)) - 1
+NO_NAME: int = 0xFFFF # the name id of a GAMEEND without a winner
+MAX_NAMES: int = NO_NAME # the number of name ids, the oldest id is reused once they run out
+
+OPCODES: dict[str, int] = {
+    "HELLO": 0x01,
+    "LOGIN": 0x02,
+    "REGISTER": 0x03,
+    "ROOMLIST": 0x04,
+    "CREATE": 0x05,
+    "JOIN": 0x06,
+    "PLACE": 0x07,
+    "FORFEIT": 0x08,
+    "ADDBOT": 0x09,
+    "BADAUTH": 0x10,
+    "NOROOM": 0x11,
+    "BEGIN": 0x12,
+    "BOARDSTATUS": 0x13,
+    "GAMEEND": 0x14,
+    "INPROGRESS": 0x15,
+    "MOVE": 0x16,
+    "SNAPSHOT": 0x17,
+} # the one byte opcode of every verb, a request and its acknowledgement share the opcode of their verb
+NAME_OPCODE: int = 0x20 # defines the username a name id stands for until it is redefined
+TEXT_OPCODE: int = 0x7F # carries a text line without its newline, for messages the binary protocol has no layout for
+VERBS: dict[int, str] = {opcode: verb for verb, opcode in OPCODES.items()}
+
+
+def board_bytes(n_cells: int) -> int:
+    '''
+    return the number of bytes of a packed board of <n_cells> cells
+    '''
+    return ((3 ** n_cells - 1).bit_length() + 7) // 8
+
+
+# the packed sizes of the supported boards are all different, so a packed board gives away its size
+BOARD_BYTES: dict[int, int] = {size * size: board_bytes(size * size) for size in range(tictactoe.BOARD_SIZE, tictactoe.MAX_BOARD_SIZE + 1)}
+BOARD_CELLS: dict[int, int] = {n_bytes: n_cells for n_cells, n_bytes in BOARD_BYTES.items()}
+
+
+class NameTable:
+    '''
+    The usernames interned to 2-byte name ids, shared by every binary connection of a process
+
+    A connection is sent the NAME frame of an id before the first message using it,
+    so a username crosses each connection once instead of in every message naming it.
+
+    Attributes:
+    -----------
+    ids: dict[str, int]
+        [username, name_id] : the id of every interned username
+    names: list[str]
+        the username of every id
+    frames: list[bytes]
+        the NAME frame defining every id
+    next_id: int
+        the id reused for the next username once every id is taken
+    '''
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.frames = []
+        self.next_id = 0
+
+    def intern(self, name: str) -> int:
+        '''
+        return the id of <name>, giving it one if it has none
+        '''
+        name_id = self.ids.get(name)
+        if name_id is not None:
+            return name_id
+        if len(self.names) < MAX_NAMES:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.frames.append(b"")
+        else:
+            # a connection that knew the old name of the id is sent the new NAME frame before its next use
+            name_id = self.next_id
+            self.next_id = (self.next_id + 1) % MAX_NAMES
+            del self.ids[self.names[name_id]]
+            self.names[name_id] = name
+        self.frames[name_id] = encode_frame(NAME_OPCODE, name_id_bytes(name_id) + name.encode())
+        self.ids[name] = name_id
+        return name_id
+
+
+def name_id_bytes(name_id: int) -> bytes:
+    '''
+    return the 2 bytes of <name_id>
+    '''
+    return name_id.to_bytes(2, "big")
+
+
+def encode_frame(opcode: int, body: bytes = b"") -> bytes:
+    '''
+    return the frame of a message with <opcode> and <body>
+    '''
+    return frame(bytes((opcode,)) + body)
+
+
+def frame(payload: bytes) -> bytes:
+    '''
+    return <payload> preceded by its length
+    '''
+    return len(payload).to_bytes(LENGTH_BYTES, "big") + payload
+
+
+def pack_board(board_status: str) -> bytes:
+    '''
+    return the board status digits <board_status> packed as a base 3 number, 2 bytes for a 3x3 board
+    '''
+    return int(board_status, 3).to_bytes(BOARD_BYTES[len(board_status)], "big")
+
+
+def unpack_board(packed: bytes) -> str:
+    '''
+    return the board status digits of the packed board <packed>
+    '''
+    value = int.from_bytes(packed, "big")
+    digits = []
+    for _ in range(BOARD_CELLS[len(packed)]):
+        value, digit = divmod(value, 3)
+        digits.append("012"[digit])
+    return "".join(reversed(digits))
+
+
+def encode_message(message: str, names: NameTable) -> tuple[bytes, tuple[tuple[int, str], ...]]:
+    '''
+    return the frame of the text message <message> sent by the server, and the (name id, username) pairs it uses,
+    whose NAME frames have to reach a connection first
+    '''
+    fields = message.rstrip("\n").split(":")
+    opcode = OPCODES.get(fields[0])
+    try:
+        if opcode is None:
+            pass
+        elif len(fields) >= 3 and fields[1] == "ACKSTATUS":
+            # the rest of a ROOMLIST acknowledgement is room names, which stay text, colon included
+            return encode_frame(opcode, bytes((int(fields[2]),)) + "".join(f":{field}" for field in fields[3:]).encode()), ()
+        elif fields[0] in ("BADAUTH", "NOROOM") and len(fields) == 1:
+            return encode_frame(opcode), ()
+        elif fields[0] == "BOARDSTATUS" and len(fields) == 2:
+            return encode_frame(opcode, pack_board(fields[1])), ()
+        elif fields[0] in ("BEGIN", "INPROGRESS") and len(fields) in (3, 5):
+            refs = ((names.intern(fields[1]), fields[1]), (names.intern(fields[2]), fields[2]))
+            body = name_id_bytes(refs[0][0]) + name_id_bytes(refs[1][0])
+            if len(fields) == 5:
+                body += bytes((int(fields[3]), int(fields[4])))
+            return encode_frame(opcode, body), refs
+        elif fields[0] == "MOVE" and len(fields) == 5:
+            return encode_frame(opcode, int(fields[1]).to_bytes(4, "big") + bytes((int(fields[2]), int(fields[3]), int(fields[4])))), ()
+        elif fields[0] == "SNAPSHOT" and len(fields) == 3:
+            return encode_frame(opcode, int(fields[1]).to_bytes(4, "big") + pack_board(fields[2])), ()
+        elif fields[0] == "GAMEEND" and len(fields) in (3, 4):
+            refs = ((names.intern(fields[3]), fields[3]),) if len(fields) == 4 else ()
+            body = bytes((int(fields[2]),)) + name_id_bytes(refs[0][0] if refs else NO_NAME) + pack_board(fields[1])
+            return encode_frame(opcode, body), refs
+    except (ValueError, KeyError, OverflowError):
+        pass
+    return encode_frame(TEXT_OPCODE, message.rstrip("\n").encode()), ()
+
+
+def decode_message(payload: bytes, names: dict[int, str]) -> str | None:
+    '''
+    return the text message, without its newline, of the frame payload <payload> received from the server
+    a NAME frame updates <names>, the usernames of the name ids, and returns None, as does an unknown opcode
+    '''
+    opcode, body = payload[0], payload[1:]
+    if opcode == TEXT_OPCODE:
+        return body.decode(errors="replace")
+    if opcode == NAME_OPCODE:
+        names[int.from_bytes(body[:2], "big")] = body[2:].decode(errors="replace")
+        return None
+    verb = VERBS.get(opcode)
+    if verb is None:
+        return None
+    if verb in ("BADAUTH", "NOROOM"):
+        return verb
+    if verb == "BOARDSTATUS":
+        return f"BOARDSTATUS:{unpack_board(body)}"
+    if verb == "MOVE":
+        return f"MOVE:{int.from_bytes(body[:4], 'big')}:{body[4]}:{body[5]}:{body[6]}"
+    if verb == "SNAPSHOT":
+        return f"SNAPSHOT:{int.from_bytes(body[:4], 'big')}:{unpack_board(body[4:])}"
+    if verb in ("BEGIN", "INPROGRESS"):
+        message = f"{verb}:{names[int.from_bytes(body[0:2], 'big')]}:{names[int.from_bytes(body[2:4], 'big')]}"
+        return f"{message}:{body[4]}:{body[5]}" if len(body) == 6 else message
+    if verb == "GAMEEND":
+        winner_id = int.from_bytes(body[1:3], "big")
+        message = f"GAMEEND:{unpack_board(body[3:])}:{body[0]}"
+        return message if winner_id == NO_NAME else f"{message}:{names[winner_id]}"
+    return f"{verb}:ACKSTATUS:{body[0]}{body[1:].decode(errors='replace')}"
+
+
+def encode_request(fields: list[str]) -> bytes:
+    '''
+    return the frame payload of the request split into <fields>, PLACE carries its column and row as bytes
+    '''
+    opcode = OPCODES.get(fields[0])
+    if opcode is None:
+        return bytes((TEXT_OPCODE,)) + ":".join(fields).encode()
+    if fields[0] == "PLACE":
+        try:
+            return bytes((opcode, int(fields[1]), int(fields[2])))
+        except (ValueError, IndexError):
+            return bytes((TEXT_OPCODE,)) + ":".join(fields).encode()
+    return bytes((opcode,)) + ":".join(fields[1:]).encode()
+
+
+def decode_request(payload: bytes) -> list[str]:
+    '''
+    return the fields of the request frame payload <payload> received from a client,
+    a malformed payload is a request with an empty verb
+    '''
+    if not payload:
+        return [""]
+    opcode = payload[0]
+    if opcode == TEXT_OPCODE:
+        return payload[1:].decode(errors="replace").split(":")
+    verb = VERBS.get(opcode)
+    if verb is None:
+        return [""]
+    if verb == "PLACE":
+        if len(payload) != 3:
+            return [""]
+        return ["PLACE", str(payload[1]), str(payload[2])]
+    if len(payload) == 1:
+        return [verb]
+    return [verb] + payload[1:].decode(errors="replace").split(":")